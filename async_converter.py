@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于asyncio的转换接口，供异步服务直接嵌入
+
+ffmpeg通过asyncio.create_subprocess_exec运行，不再为每个转换占用一个线程（run_in_executor）。
+等待转换的任务被取消时，ffmpeg进程组会被终止，未完成的临时文件会被删除。
+
+用法:
+    async for event in convert("in.mp4", "out.mp4", crf=28):
+        if event["type"] == "progress":
+            print(event["percent"])
+        elif event["type"] == "result":
+            print(event["success"])
+
+    async for event in batch([("a.mp4", "a_h265.mp4"), ("b.mp4", "b_h265.mp4")], max_concurrency=2):
+        print(event["input_file"], event["type"])
+"""
+
+import os
+import signal
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+
+from index import (video_info_command, parse_video_info, basic_video_info, ConversionError, prepare_conversion,
+                   finalize_conversion, remove_temp_output)
+
+logger = logging.getLogger(__name__)
+
+# 保留的stderr末尾行数
+STDERR_LINES = 200
+
+async def get_video_info(input_file):
+    """
+    异步获取视频文件信息（与index.get_video_info返回相同的字典）
+
+    Returns:
+        dict: 视频信息，文件不存在时返回None
+    """
+    try:
+        file_size = os.path.getsize(input_file)
+    except OSError as e:
+        logger.error(f"获取视频信息失败: {str(e)}")
+        return None
+    try:
+        process = await asyncio.create_subprocess_exec(*video_info_command(input_file),
+                                                       stdin=asyncio.subprocess.DEVNULL,
+                                                       stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.DEVNULL)
+        output, _ = await process.communicate()
+        if process.returncode == 0:
+            info = parse_video_info(output.decode("utf-8", "replace"), file_size)
+            if info:
+                return info
+    except (OSError, ValueError):
+        logger.warning("ffprobe不可用，使用基本文件信息")
+    return basic_video_info(file_size)
+
+async def terminate_process_group(process, timeout=5):
+    """
+    终止ffmpeg所在的进程组：先发送SIGTERM，超时后发送SIGKILL
+    """
+    if process.returncode is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"ffmpeg未在 {timeout} 秒内退出，强制结束")
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+            await process.wait()
+    except ProcessLookupError:
+        pass
+
+async def _read_stderr(stream, tail):
+    async for line in stream:
+        tail.append(line.decode("utf-8", "replace"))
+
+def _result(input_file, output_file, success, input_size, started, returncode=None, output_size=None,
+            stderr="", error=None):
+    return {
+        "type": "result",
+        "input_file": input_file,
+        "output_file": output_file,
+        "success": success,
+        "returncode": returncode,
+        "input_size": input_size,
+        "output_size": output_size,
+        "elapsed": time.time() - started,
+        "stderr": stderr,
+        "error": error,
+    }
+
+async def convert(input_file, output_file,
+                  crf=28,
+                  preset="medium",
+                  audio_codec="aac",
+                  audio_bitrate="128k",
+                  threads=0,
+                  scratch_dir=None,
+                  moov_mode="reserve",
+                  priority=None,
+                  result_cache=None,
+                  ffmpeg="ffmpeg"):
+    """
+    异步转换一个文件，以异步生成器的形式产生进度事件，最后产生一个结果事件
+
+    参数与index.convert_h264_to_h265相同，使用相同的准备（预检、结果缓存）和收尾步骤，
+    同样先写入临时文件，成功后再移动到最终路径。
+    等待中的任务被取消（或提前退出async for）时终止ffmpeg并删除临时文件。
+
+    Args:
+        result_cache: ResultCache，内容和参数相同的输入已转换过时直接使用缓存的结果
+        ffmpeg: ffmpeg可执行文件
+
+    Yields:
+        dict: {"type": "progress", "input_file", "time", "duration", "percent", "speed", "fps"}，
+              最后是 {"type": "result", "input_file", "output_file", "success", "returncode",
+              "input_size", "output_size", "elapsed", "stderr", "error"}
+    """
+    started = time.time()
+    loop = asyncio.get_running_loop()
+    try:
+        # 探测和预检（试解码开头几秒）会阻塞，在线程中运行
+        prepared = await loop.run_in_executor(None, functools.partial(
+            prepare_conversion, input_file, output_file, crf, preset, audio_codec, audio_bitrate, threads,
+            scratch_dir, moov_mode, priority, result_cache, ffmpeg=ffmpeg))
+    except (ConversionError, OSError) as e:
+        logger.error(f"无法开始转换: {input_file}: {str(e)}")
+        yield _result(input_file, output_file, False, None, started, error=str(e))
+        return
+    input_size = prepared.input_size
+    if prepared.cached is not None:
+        logger.info(f"内容相同的文件已转换过，使用缓存的结果（{prepared.cached}）: {output_file}")
+        yield _result(input_file, output_file, True, input_size, started, output_size=os.path.getsize(output_file))
+        return
+    duration = prepared.input_info["duration"] if prepared.input_info else None
+
+    cmd = prepared.cmd
+    # 进度以key=value的形式写到stdout
+    cmd[1:1] = ["-hide_banner", "-nostats", "-progress", "pipe:1"]
+    logger.info(f"开始异步转换: {input_file} -> {output_file}")
+    logger.info(f"执行的FFmpeg命令: {' '.join(cmd)}")
+
+    process = None
+    try:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True)
+        except OSError as e:
+            logger.error(f"无法启动ffmpeg: {str(e)}")
+            yield _result(input_file, output_file, False, input_size, started, error=f"无法启动ffmpeg: {str(e)}")
+            return
+        if priority and not priority.is_empty():
+            priority.apply(process.pid)
+
+        tail = deque(maxlen=STDERR_LINES)
+        stderr_reader = asyncio.ensure_future(_read_stderr(process.stderr, tail))
+        try:
+            fields = {}
+            async for line in process.stdout:
+                key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+                if key != "progress":
+                    fields[key] = value
+                    continue
+                # 一组进度信息以progress=continue/end结束
+                try:
+                    position = int(fields.get("out_time_us") or fields.get("out_time_ms") or 0) / 1_000_000
+                except ValueError:
+                    position = 0.0
+                percent = min(100.0, position / duration * 100) if duration else None
+                speed = fields.get("speed", "").rstrip("x").strip()
+                yield {
+                    "type": "progress",
+                    "input_file": input_file,
+                    "time": position,
+                    "duration": duration,
+                    "percent": percent,
+                    "speed": float(speed) if speed.replace(".", "", 1).isdigit() else None,
+                    "fps": float(fields["fps"]) if fields.get("fps", "").replace(".", "", 1).isdigit() else None,
+                }
+                fields = {}
+            returncode = await process.wait()
+            await stderr_reader
+        finally:
+            stderr_reader.cancel()
+        stderr = "".join(tail)
+
+        try:
+            # 跨文件系统时移动输出需要复制，在线程中运行
+            await loop.run_in_executor(None, finalize_conversion, prepared, returncode, stderr)
+        except (ConversionError, OSError) as e:
+            logger.error(f"异步转换失败: {input_file}: {str(e)}")
+            yield _result(input_file, output_file, False, input_size, started, returncode, stderr=stderr,
+                          error=str(e))
+            return
+        result = _result(input_file, output_file, True, input_size, started, returncode,
+                         output_size=os.path.getsize(output_file), stderr=stderr)
+        logger.info(f"异步转换完成: {output_file}，耗时: {result['elapsed']:.2f} 秒")
+        yield result
+    except (asyncio.CancelledError, GeneratorExit):
+        logger.warning(f"转换已取消: {input_file}")
+        raise
+    finally:
+        # 任务被取消或调用方提前退出时终止ffmpeg
+        if process is not None and process.returncode is None:
+            await terminate_process_group(process)
+        remove_temp_output(prepared)
+
+async def convert_file(input_file, output_file, on_progress=None, **kwargs):
+    """
+    异步转换一个文件并返回结果事件（不需要逐个处理进度时使用）
+
+    Args:
+        on_progress: 可选的回调，接收每个进度事件
+        kwargs: 传给convert()的参数
+
+    Returns:
+        dict: convert()最后产生的结果事件
+    """
+    result = None
+    async for event in convert(input_file, output_file, **kwargs):
+        if event["type"] == "result":
+            result = event
+        elif on_progress is not None:
+            on_progress(event)
+    return result
+
+async def batch(jobs, max_concurrency=2, **kwargs):
+    """
+    异步批量转换，同时运行的ffmpeg不超过max_concurrency个
+
+    所有文件的事件按发生顺序产生（每个事件都带有input_file）；
+    等待中的任务被取消（或提前退出async for）时终止所有进行中的转换。
+
+    Args:
+        jobs: (输入文件, 输出文件) 的可迭代对象
+        max_concurrency: 最大并发转换数
+        kwargs: 传给convert()的参数
+
+    Yields:
+        dict: convert()产生的进度和结果事件
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    events = asyncio.Queue()
+
+    async def run(input_file, output_file):
+        async with semaphore:
+            try:
+                async for event in convert(input_file, output_file, **kwargs):
+                    await events.put(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"转换过程中出错: {input_file}: {str(e)}")
+                await events.put(_result(input_file, output_file, False, None, time.time(), error=str(e)))
+
+    tasks = [asyncio.ensure_future(run(input_file, output_file)) for input_file, output_file in jobs]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            event = await events.get()
+            if event["type"] == "result":
+                remaining -= 1
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令精简测试：比较simple_gui_converter.py以前的固定参数与按探测结果精简后的参数，
+报告每帧节省的CPU时间（用户态+内核态，来自子进程的资源使用统计）
+
+默认只测量解码和前处理（缩放、像素格式转换、音频重采样），视频输出为rawvideo、音频为PCM，
+不受x265编码时间的干扰；--encode 测量完整的H.265转换。
+
+用法:
+    python benchmark_command_minimization.py 输入文件... [--runs 3] [--encode]
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from command_profile import probe_media, video_conversion_args, audio_conversion_args, build_douyin_command
+from ffmpeg_capabilities import find_ffmpeg
+
+def run_cpu_seconds(cmd):
+    """
+    运行命令，返回子进程消耗的CPU时间（秒）
+
+    Raises:
+        RuntimeError: 命令失败
+    """
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = process.stderr.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg返回码 {process.returncode}: {stderr.decode('utf-8', 'replace')[-300:]}")
+    return usage.ru_utime + usage.ru_stime
+
+def preprocess_command(ffmpeg_path, input_file, media, minimize):
+    """只做解码和前处理的命令"""
+    video_args, _ = video_conversion_args(media, minimize)
+    audio_args, _ = audio_conversion_args(media, minimize)
+    cmd = [ffmpeg_path, "-hide_banner", "-nostats", "-i", input_file, "-map", "0:v"]
+    if media["has_audio"]:
+        cmd.extend(["-map", "0:a"])
+    return cmd + video_args + audio_args + ["-c:v", "rawvideo", "-c:a", "pcm_s16le", "-f", "null", "-"]
+
+def benchmark_file(ffmpeg_path, input_file, runs, encode):
+    media = probe_media(ffmpeg_path, input_file)
+    frames = (media["duration"] or 0) * (media["fps"] or 0)
+    if not frames:
+        raise RuntimeError("无法读取时长和帧率")
+    _, skipped = video_conversion_args(media)
+    skipped += audio_conversion_args(media)[1]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for minimize in (False, True):
+            if encode:
+                output_file = os.path.join(temp_dir, "output.mp4")
+                cmd, _ = build_douyin_command(ffmpeg_path, input_file, output_file, media, minimize)
+                cmd[1:1] = ["-hide_banner", "-nostats"]
+            else:
+                cmd = preprocess_command(ffmpeg_path, input_file, media, minimize)
+            results[minimize] = statistics.median(run_cpu_seconds(cmd) for _ in range(runs))
+    return media, frames, skipped, results[False], results[True]
+
+def main():
+    parser = argparse.ArgumentParser(description="命令精简测试：比较固定参数与按探测结果精简后的参数的CPU时间")
+    parser.add_argument("inputs", nargs="+", help="输入视频文件")
+    parser.add_argument("--runs", type=int, default=3, help="每种命令运行的次数，取中位数，默认3")
+    parser.add_argument("--encode", action="store_true", help="测量完整的H.265转换（默认只测量解码和前处理）")
+    parser.add_argument("--ffmpeg", help="FFmpeg路径，默认优先使用内置FFmpeg")
+    args = parser.parse_args()
+
+    ffmpeg_path = args.ffmpeg or find_ffmpeg()
+    if not ffmpeg_path:
+        print("❌ 未找到FFmpeg")
+        sys.exit(1)
+
+    print(f"测量内容: {'完整转换' if args.encode else '解码和前处理'}，每种命令运行 {args.runs} 次取中位数")
+    for input_file in args.inputs:
+        try:
+            media, frames, skipped, full_cpu, minimized_cpu = benchmark_file(ffmpeg_path, input_file,
+                                                                           args.runs, args.encode)
+        except RuntimeError as e:
+            print(f"\n{input_file}: ❌ {str(e)}")
+            continue
+        saved = full_cpu - minimized_cpu
+        print(f"\n{input_file}")
+        print(f"  输入: {media['width']}x{media['height']} {media['pix_fmt']} {media['colorspace'] or '未标记'}，"
+              f"音频: {media['sample_rate'] or '-'} Hz {media['channels'] or '-'} 声道，{frames:.0f} 帧")
+        print(f"  省略: {'，'.join(skipped) or '无（输入需要全部转换）'}")
+        print(f"  固定参数: {full_cpu/frames*1000:.3f} ms/帧，精简后: {minimized_cpu/frames*1000:.3f} ms/帧，"
+              f"每帧节省 {saved/frames*1000:.3f} ms（{saved/full_cpu*100 if full_cpu else 0:.1f}%）")
+
+if __name__ == "__main__":
+    main()
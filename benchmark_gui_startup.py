@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GUI启动时间测试：测量从启动进程到第一个窗口显示的时间，以及后台FFmpeg检查完成的时间
+
+用法:
+    python benchmark_gui_startup.py [--runs 5] [--offscreen]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+GUIS = {
+    "gui_video_converter": "VideoConverterApp",
+    "simple_gui_converter": "SimpleVideoConverter",
+}
+
+# 在子进程中运行：创建窗口，事件循环第一次空闲时（窗口已显示）记录时间，等待后台检查完成后退出
+CHILD_CODE = """
+import sys, time, json
+sys.path.insert(0, {repo!r})
+from PyQt5.QtWidgets import QApplication, QMessageBox
+from PyQt5.QtCore import QTimer
+QMessageBox.warning = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+app = QApplication(sys.argv)
+import {module} as gui
+window = gui.{cls}()
+window.show()
+times = {{}}
+def done():
+    if "window" in times and "ffmpeg" in times:
+        print(json.dumps(times))
+        app.quit()
+def first_window():
+    times["window"] = time.time()
+    done()
+def ffmpeg_checked(result):
+    times["ffmpeg"] = time.time()
+    QTimer.singleShot(0, done)
+window.ffmpeg_check_thread.checked.connect(ffmpeg_checked)
+if window.ffmpeg_check_thread.isFinished():
+    times["ffmpeg"] = time.time()
+QTimer.singleShot(0, first_window)
+QTimer.singleShot(60000, app.quit)
+app.exec_()
+"""
+
+def run_once(module, cls, env):
+    code = CHILD_CODE.format(repo=os.path.dirname(os.path.abspath(__file__)), module=module, cls=cls)
+    start = time.time()
+    result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True, env=env, timeout=90)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"{module} 启动失败，返回码: {result.returncode}")
+    times = json.loads(lines[-1])
+    return times["window"] - start, times["ffmpeg"] - start
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI启动时间测试")
+    parser.add_argument("--runs", type=int, default=5, help="每个界面运行的次数，默认5")
+    parser.add_argument("--offscreen", action="store_true", help="使用Qt offscreen平台（无显示器的环境）")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+
+    for module, cls in GUIS.items():
+        window_times = []
+        ffmpeg_times = []
+        for _ in range(args.runs):
+            window_time, ffmpeg_time = run_once(module, cls, env)
+            window_times.append(window_time)
+            ffmpeg_times.append(ffmpeg_time)
+        print(f"{module}:")
+        print(f"  首个窗口显示: 中位数 {statistics.median(window_times)*1000:.0f} ms，"
+              f"最慢 {max(window_times)*1000:.0f} ms")
+        print(f"  FFmpeg检查完成: 中位数 {statistics.median(ffmpeg_times)*1000:.0f} ms，"
+              f"最慢 {max(ffmpeg_times)*1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按探测结果精简FFmpeg命令
+
+simple_gui_converter.py的目标格式（抖音）要求偶数分辨率、yuv420p、BT.709色彩标记、立体声和常用采样率。
+以前无论输入是什么都加上缩放滤镜、像素格式转换和音频重采样，输入已经符合要求时这些操作
+什么也不改变，却要对每一帧做一次缩放/格式转换、对音频做一次重采样（48kHz重采样到44.1kHz还会降低音质）。
+这里把探测结果与目标格式比较，只在确实会改变输出时才加入对应的滤镜或转换。
+"""
+
+import re
+import logging
+import subprocess
+
+from mp4_layout import movflags_args
+
+logger = logging.getLogger(__name__)
+
+# 目标格式
+TARGET_PIX_FMT = "yuv420p"
+TARGET_COLOR_RANGE = "tv"
+TARGET_COLORSPACE = "bt709"
+TARGET_CHANNELS = 2
+# 无需重采样的采样率，其他采样率重采样到TARGET_SAMPLE_RATE
+ACCEPTED_SAMPLE_RATES = (44100, 48000)
+TARGET_SAMPLE_RATE = 44100
+
+# 输出的最大视频码率和音频码率（与命令中的-maxrate和-b:a一致），用于预估输出大小
+MAX_VIDEO_BITRATE = 5_000_000
+AUDIO_BITRATE = 192_000
+
+# 声道布局对应的声道数
+CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2, "2.1": 3, "3.0": 3, "quad": 4, "4.0": 4, "5.0": 5, "5.1": 6,
+                   "6.1": 7, "7.1": 8}
+# 像素格式括号中表示扫描方式的词，不是色彩信息
+_FIELD_ORDERS = ("progressive", "top first", "bottom first", "top coded first", "bottom coded first")
+
+def _split_fields(text):
+    """按逗号拆分流信息，括号内的逗号不拆分"""
+    fields = []
+    depth = 0
+    current = ""
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            fields.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        fields.append(current.strip())
+    return fields
+
+def parse_media_info(stderr):
+    """
+    解析 `ffmpeg -i` 输出的第一个视频流和第一个音频流
+
+    Returns:
+        dict: duration、fps、has_audio（与mp4_layout.probe_timing相同），以及
+              width、height、pix_fmt、color_range、colorspace、color_primaries、color_trc、
+              sample_rate、channels，无法识别的项为None
+    """
+    media = {"duration": None, "fps": None, "has_audio": False, "width": None, "height": None,
+             "pix_fmt": None, "color_range": None, "colorspace": None, "color_primaries": None,
+             "color_trc": None, "sample_rate": None, "channels": None}
+
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        media["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    match = re.search(r"Stream #.*?Video: (.*)", stderr)
+    if match:
+        fields = _split_fields(match.group(1))
+        if len(fields) > 1:
+            pix_match = re.match(r"(\w+)(?:\((.*)\))?", fields[1])
+            if pix_match:
+                media["pix_fmt"] = pix_match.group(1)
+                for item in (pix_match.group(2) or "").split(","):
+                    item = item.strip()
+                    if item in ("tv", "pc"):
+                        media["color_range"] = item
+                    elif item and not item.startswith(_FIELD_ORDERS):
+                        # "bt709" 表示三项相同，否则为 "色彩空间/原色/传输特性"
+                        parts = item.split("/")
+                        if len(parts) == 3:
+                            media["colorspace"], media["color_primaries"], media["color_trc"] = parts
+                        else:
+                            media["colorspace"] = media["color_primaries"] = media["color_trc"] = item
+        for field in fields:
+            size_match = re.match(r"(\d+)x(\d+)", field)
+            if size_match and media["width"] is None:
+                media["width"], media["height"] = int(size_match.group(1)), int(size_match.group(2))
+            fps_match = re.match(r"([\d.]+) fps", field)
+            if fps_match:
+                media["fps"] = float(fps_match.group(1))
+
+    match = re.search(r"Stream #.*?Audio: (.*)", stderr)
+    if match:
+        media["has_audio"] = True
+        for field in _split_fields(match.group(1)):
+            rate_match = re.match(r"(\d+) Hz", field)
+            if rate_match:
+                media["sample_rate"] = int(rate_match.group(1))
+                continue
+            layout = field.split("(")[0].strip()
+            channels_match = re.match(r"(\d+) channels", field)
+            if channels_match:
+                media["channels"] = int(channels_match.group(1))
+            elif layout in CHANNEL_LAYOUTS and media["channels"] is None:
+                media["channels"] = CHANNEL_LAYOUTS[layout]
+    return media
+
+def probe_media(ffmpeg_path, input_file):
+    """
+    只用ffmpeg（无需ffprobe）读取输入的流信息，见parse_media_info
+    """
+    try:
+        result = subprocess.run([ffmpeg_path, "-hide_banner", "-i", input_file],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                text=True,
+                                errors="replace",
+                                timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"读取输入信息失败: {str(e)}")
+        return parse_media_info("")
+    return parse_media_info(result.stderr)
+
+def video_conversion_args(media, minimize=True):
+    """
+    视频的缩放、像素格式和色彩标记参数
+
+    Args:
+        media: probe_media()的结果
+        minimize: False时总是加入全部参数（旧行为，用于对比测试）
+
+    Returns:
+        tuple: (参数列表, 省略的参数说明列表)
+    """
+    args = []
+    skipped = []
+    width, height = media.get("width"), media.get("height")
+    # 分辨率未知时保守地加入全部转换
+    if not minimize or width is None or width % 2 or height % 2:
+        args.extend(["-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2"])    # 确保分辨率为偶数
+    else:
+        skipped.append(f"缩放（{width}x{height}已是偶数）")
+
+    if not minimize or media.get("pix_fmt") != TARGET_PIX_FMT:
+        args.extend(["-pix_fmt", TARGET_PIX_FMT])                     # 像素格式确保兼容性
+    else:
+        skipped.append(f"像素格式转换（已是{TARGET_PIX_FMT}）")
+
+    # 色彩标记只是元数据：输入已标记时libx265会沿用，输入标记为其他色彩空间时强行标记为BT.709反而是错误的
+    if not minimize or media.get("colorspace") is None:
+        args.extend(["-color_range", TARGET_COLOR_RANGE,              # 标准色彩范围
+                     "-colorspace", TARGET_COLORSPACE,                # 标准色彩空间
+                     "-color_trc", TARGET_COLORSPACE,                 # 色彩传输特性
+                     "-color_primaries", TARGET_COLORSPACE])          # 色彩原色
+    else:
+        if media.get("pix_fmt") != TARGET_PIX_FMT or media.get("color_range") is None:
+            args.extend(["-color_range", TARGET_COLOR_RANGE])
+        skipped.append(f"色彩标记（沿用输入的{media['colorspace']}）")
+    return args, skipped
+
+def audio_conversion_args(media, minimize=True):
+    """
+    音频的声道和采样率参数
+
+    Returns:
+        tuple: (参数列表, 省略的参数说明列表)
+    """
+    args = []
+    skipped = []
+    if not minimize:
+        return ["-ac", str(TARGET_CHANNELS), "-ar", str(TARGET_SAMPLE_RATE)], skipped
+    if not media.get("has_audio"):
+        return args, ["声道和采样率（没有音频流）"]
+
+    if media.get("channels") != TARGET_CHANNELS:
+        args.extend(["-ac", str(TARGET_CHANNELS)])                    # 确保是立体声
+    else:
+        skipped.append("声道转换（已是立体声）")
+    sample_rate = media.get("sample_rate")
+    if sample_rate not in ACCEPTED_SAMPLE_RATES:
+        args.extend(["-ar", str(TARGET_SAMPLE_RATE)])                 # 标准音频采样率
+    else:
+        skipped.append(f"重采样（{sample_rate} Hz无需转换）")
+    return args, skipped
+
+def estimate_douyin_size(media, input_size):
+    """
+    预估输出大小：按最大码率和时长计算，时长未知时按输入大小
+
+    Returns:
+        int: 字节数
+    """
+    if not media.get("duration"):
+        return input_size
+    return int((MAX_VIDEO_BITRATE + AUDIO_BITRATE) / 8 * media["duration"])
+
+def build_douyin_command(ffmpeg_path, input_file, output_file, media, minimize=True):
+    """
+    simple_gui_converter.py使用的抖音格式转换命令
+
+    Args:
+        ffmpeg_path: ffmpeg可执行文件路径
+        input_file: 输入文件路径
+        output_file: 输出文件路径（MP4）
+        media: probe_media()的结果
+        minimize: 只加入会改变输出的滤镜和转换
+
+    Returns:
+        tuple: (FFmpeg命令, 省略的参数说明列表)
+    """
+    video_args, video_skipped = video_conversion_args(media, minimize)
+    audio_args, audio_skipped = audio_conversion_args(media, minimize)
+    # 构建适合抖音的FFmpeg参数，优化画质和兼容性
+    ffmpeg_cmd = [
+        ffmpeg_path,
+        "-y",                       # 覆盖输出文件
+        "-i", input_file,
+        "-map", "0:v",              # 明确映射视频流
+        "-map", "0:a?",             # 映射音频流（没有音频的视频也能转换）
+        "-c:v", "libx265",          # 视频编码器
+        "-crf", "26",               # 降低CRF值以提高画质（26比28质量更好）
+        "-preset", "medium",        # 编码预设
+    ]
+    ffmpeg_cmd.extend(video_args)
+    ffmpeg_cmd.extend([
+        "-maxrate", "5M",           # 最大比特率限制，适合抖音
+        "-bufsize", "10M",          # 缓冲区大小
+        "-c:a", "aac",              # 音频编码器
+        "-b:a", "192k",             # 提高音频比特率以获得更好音质
+    ])
+    ffmpeg_cmd.extend(audio_args)
+    ffmpeg_cmd.extend([
+        "-threads", "0",            # 自动使用所有CPU核心
+        "-tag:v", "hvc1",           # 使用hvc1标签提高兼容性
+    ])
+    # moov放在文件开头（预留空间），快速开始播放且无需二次重写
+    ffmpeg_cmd.extend(movflags_args("reserve", media["duration"], media["fps"], media["has_audio"]))
+    ffmpeg_cmd.append(output_file)
+    return ffmpeg_cmd, video_skipped + audio_skipped
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频文件的内容哈希
+
+对几GB到几十GB的视频计算完整的SHA-256只为了识别文件，读盘量和编码时读取输入一样多。
+抽样哈希只读取文件大小加上开头、结尾和均匀分布的若干固定大小的块（默认16个1MB的块），
+读取量与文件大小无关；视频文件的任何实际修改（重新编码、剪辑、重新封装）都会改变大小或
+被抽到的块。完整哈希保留用于需要校验的场合。
+
+结果按文件的（设备号、inode、大小、修改时间）缓存在内存中，同一次运行中探测、去重和任务记录
+共用同一个结果，文件只读取一次。
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 抽样块的大小和数量（包括开头和结尾的块）
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_SAMPLES = 16
+# 完整哈希每次读取的字节数
+FULL_HASH_READ_SIZE = 1024 * 1024
+# 内存中缓存的哈希数量
+MEMO_SIZE = 4096
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+def _new_digest():
+    return hashlib.blake2b(digest_size=20)
+
+def _read_at(f, offset, size):
+    """读取指定位置的数据，支持时使用os.pread（不移动文件位置，多线程安全）"""
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), size, offset)
+    f.seek(offset)
+    return f.read(size)
+
+def sample_offsets(size, chunk_size=DEFAULT_CHUNK_SIZE, samples=DEFAULT_SAMPLES):
+    """
+    抽样块的起始位置：开头、结尾和中间均匀分布的位置
+
+    Returns:
+        list: 起始位置，文件不大于全部抽样块时返回None（读取整个文件）
+    """
+    if samples < 2 or size <= chunk_size * samples:
+        return None
+    last = size - chunk_size
+    return [last * i // (samples - 1) for i in range(samples)]
+
+def sampled_hash(path, chunk_size=DEFAULT_CHUNK_SIZE, samples=DEFAULT_SAMPLES):
+    """
+    抽样哈希：文件大小 + 开头、结尾和均匀分布的块的摘要
+
+    不大于全部抽样块的小文件读取全部内容。
+
+    Args:
+        path: 文件路径
+        chunk_size: 每个抽样块的字节数
+        samples: 抽样块的数量
+
+    Returns:
+        str: 十六进制摘要
+
+    Raises:
+        OSError: 无法读取
+    """
+    digest = _new_digest()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(f"sampled:{size}:{chunk_size}:{samples}".encode("ascii"))
+        offsets = sample_offsets(size, chunk_size, samples)
+        if offsets is None:
+            for chunk in iter(lambda: f.read(FULL_HASH_READ_SIZE), b""):
+                digest.update(chunk)
+        else:
+            for offset in offsets:
+                digest.update(_read_at(f, offset, chunk_size))
+    return digest.hexdigest()
+
+def full_hash(path):
+    """
+    完整哈希：读取整个文件，用于校验
+
+    Raises:
+        OSError: 无法读取
+    """
+    digest = _new_digest()
+    with open(path, "rb") as f:
+        digest.update(f"full:{os.fstat(f.fileno()).st_size}".encode("ascii"))
+        for chunk in iter(lambda: f.read(FULL_HASH_READ_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_hash(path, full=False, st=None):
+    """
+    文件的内容哈希，同一文件（设备号、inode、大小、修改时间都未变）只计算一次
+
+    Args:
+        path: 文件路径
+        full: True时计算完整哈希，否则计算抽样哈希
+        st: 已有的os.stat结果，None表示重新读取
+
+    Returns:
+        str: 十六进制摘要（抽样哈希和完整哈希的值不同，不能相互比较）
+
+    Raises:
+        OSError: 无法读取
+    """
+    st = st or os.stat(path)
+    memo_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, full)
+    with _memo_lock:
+        digest = _memo.get(memo_key)
+        if digest is not None:
+            _memo.move_to_end(memo_key)
+            return digest
+    digest = full_hash(path) if full else sampled_hash(path)
+    with _memo_lock:
+        _memo[memo_key] = digest
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return digest
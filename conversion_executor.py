@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+concurrent.futures风格的转换接口，供Python程序直接调用
+
+index.py中的函数面向命令行（打印信息、返回bool），这里的ConversionExecutor返回Future，
+结果是结构化的ConversionResult（大小、耗时、返回码、stderr末尾），调用方不需要解析日志。
+
+用法:
+    with ConversionExecutor(max_workers=2, cpu_budget=8) as executor:
+        futures = [executor.submit(path, crf=28) for path in paths]
+        for future in executor.as_completed(futures):
+            result = future.result()
+            print(result.input_file, result.success, result.output_size)
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from index import (ConversionError, prepare_conversion, encode_prepared, finalize_conversion, remove_temp_output,
+                   make_output_path)
+from segment_checkpoint import SEGMENT_SECONDS
+from process_priority import ProcessPriority, CoreAllocator, available_cpus
+
+logger = logging.getLogger(__name__)
+
+# 结果中保留的stderr末尾行数
+STDERR_TAIL_LINES = 20
+
+class ConversionResult:
+    """
+    一次转换的结果
+
+    Attributes:
+        input_file/output_file: 输入和输出文件路径
+        success: 是否成功
+        cancelled: 是否被取消
+        returncode: ffmpeg返回码，未启动ffmpeg时为None
+        input_size/output_size: 文件大小（字节），失败时output_size为None
+        queued_seconds: 提交后等待空闲工作线程的时间
+        probe_seconds: 探测输入文件信息的时间
+        encode_seconds: ffmpeg运行时间
+        elapsed_seconds: 从开始处理到结束的总时间
+        stderr_tail: ffmpeg stderr的最后几行
+        error: 失败原因
+    """
+
+    def __init__(self, input_file, output_file):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.success = False
+        self.cancelled = False
+        self.returncode = None
+        self.input_size = None
+        self.output_size = None
+        self.queued_seconds = 0.0
+        self.probe_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.elapsed_seconds = 0.0
+        self.stderr_tail = ""
+        self.error = None
+
+    @property
+    def compression_ratio(self):
+        """输出比输入小的比例（0-1），无法计算时返回None"""
+        if not self.input_size or self.output_size is None:
+            return None
+        return 1 - self.output_size / self.input_size
+
+    def to_dict(self):
+        data = dict(vars(self))
+        data["compression_ratio"] = self.compression_ratio
+        return data
+
+    def __repr__(self):
+        state = "成功" if self.success else ("已取消" if self.cancelled else f"失败: {self.error}")
+        return f"<ConversionResult {self.input_file} {state}>"
+
+def run_conversion(input_file, output_file,
+                   crf=28,
+                   preset="medium",
+                   audio_codec="aac",
+                   audio_bitrate="128k",
+                   threads=0,
+                   scratch_dir=None,
+                   moov_mode="reserve",
+                   priority=None,
+                   cancel_event=None,
+                   result_cache=None,
+                   checkpoint=False,
+                   segment_seconds=SEGMENT_SECONDS,
+                   ffmpeg="ffmpeg"):
+    """
+    转换一个文件，不打印信息，返回结构化结果
+
+    与index.convert_h264_to_h265使用相同的准备、编码和收尾步骤（预检、结果缓存、分段编码、
+    先写临时文件成功后再移动到最终路径）。任何失败（包括文件系统错误）都记录在结果中，不抛出异常。
+
+    Args:
+        ffmpeg: ffmpeg可执行文件（分段编码时使用PATH中的ffmpeg）
+        其余参数同index.convert_h264_to_h265
+
+    Returns:
+        ConversionResult: 转换结果
+    """
+    result = ConversionResult(input_file, output_file)
+    started = time.monotonic()
+    prepared = None
+    try:
+        prepared = prepare_conversion(input_file, output_file, crf, preset, audio_codec, audio_bitrate, threads,
+                                      scratch_dir, moov_mode, priority, result_cache, ffmpeg=ffmpeg)
+        result.input_size = prepared.input_size
+        result.probe_seconds = prepared.probe_seconds
+        if prepared.cached is None:
+            # 不输出统计信息，stderr中只保留有用的错误信息
+            prepared.cmd[1:1] = ["-hide_banner", "-nostats"]
+            logger.info(f"执行的FFmpeg命令: {' '.join(prepared.cmd)}")
+            encode_started = time.monotonic()
+            returncode, stderr, cancelled = encode_prepared(prepared, cancel_event=cancel_event,
+                                                            checkpoint=checkpoint, segment_seconds=segment_seconds)
+            result.encode_seconds = time.monotonic() - encode_started
+            result.returncode = returncode
+            result.cancelled = cancelled
+            result.stderr_tail = "".join(stderr.splitlines(keepends=True)[-STDERR_TAIL_LINES:])
+            if cancelled:
+                result.error = "已取消"
+                return result
+            finalize_conversion(prepared, returncode, stderr)
+        result.output_size = os.path.getsize(output_file)
+        result.success = True
+        return result
+    except ConversionError as e:
+        result.error = str(e)
+        return result
+    except Exception as e:
+        result.error = f"转换过程中出错: {str(e)}"
+        return result
+    finally:
+        if prepared is not None:
+            remove_temp_output(prepared)
+        result.elapsed_seconds = time.monotonic() - started
+        if result.success:
+            logger.info(f"转换成功: {input_file}，耗时 {result.elapsed_seconds:.2f} 秒")
+        else:
+            logger.warning(f"转换未成功: {input_file}: {result.error}")
+
+class ConversionExecutor:
+    """
+    转换任务执行器，接口与concurrent.futures.Executor类似
+
+    Args:
+        max_workers: 同时进行的转换数量
+        cpu_budget: 所有转换合计使用的CPU核数，None表示不限制。
+                    支持CPU亲和性的平台上每个任务绑定到 cpu_budget // max_workers 个核
+                    （核数少于并发数时共用这些核），其他平台上限制每个ffmpeg的线程数
+        priority: ProcessPriority，应用到每个ffmpeg子进程
+        **defaults: 每个任务的默认转换参数（见run_conversion），submit()的参数会覆盖其中的同名项
+    """
+
+    def __init__(self, max_workers=1, cpu_budget=None, priority=None, **defaults):
+        self.max_workers = max(1, max_workers)
+        self.cpu_budget = cpu_budget
+        self.priority = priority or ProcessPriority()
+        self.defaults = defaults
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="conversion")
+        self._core_allocator = None
+        self._threads_per_job = 0
+        if cpu_budget:
+            cores_per_job = max(1, cpu_budget // self.max_workers)
+            if not hasattr(os, "sched_setaffinity"):
+                self._threads_per_job = cores_per_job
+            elif cpu_budget >= self.max_workers:
+                self._core_allocator = CoreAllocator(cores_per_job, available_cpus()[:cpu_budget])
+            else:
+                # 核数少于并发数时所有任务共用预算内的核，不超出预算
+                self.priority = self.priority.with_cpus(available_cpus()[:cpu_budget])
+        self._cancel_event = threading.Event()
+        self._futures = set()
+        # 进行中和排队中的任务占用的自动生成的输出路径
+        self._outputs = set()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True, cancel=exc_type is not None)
+        return False
+
+    def _run(self, input_file, output_file, submitted, params):
+        queued_seconds = time.monotonic() - submitted
+        if self._cancel_event.is_set():
+            result = ConversionResult(input_file, output_file)
+            result.cancelled = True
+            result.error = "已取消"
+        elif self._core_allocator is not None:
+            with self._core_allocator.acquire() as cores:
+                priority = self.priority.with_cpus(cores)
+                result = run_conversion(input_file, output_file, priority=priority,
+                                        cancel_event=self._cancel_event, **params)
+        else:
+            params.setdefault("threads", self._threads_per_job)
+            result = run_conversion(input_file, output_file, priority=self.priority,
+                                    cancel_event=self._cancel_event, **params)
+        result.queued_seconds = queued_seconds
+        return result
+
+    def submit(self, input_file, output_file=None, **params):
+        """
+        提交一个转换任务
+
+        Args:
+            input_file: 输入文件路径
+            output_file: 输出文件路径，None表示在输入文件旁自动生成（*_h265）
+            **params: 转换参数，如crf、preset、audio_codec、moov_mode、result_cache、checkpoint
+
+        Returns:
+            concurrent.futures.Future: 结果为ConversionResult；转换失败不会抛出异常，见result.success
+        """
+        reserved = None
+        if not output_file:
+            with self._lock:
+                output_file = reserved = make_output_path(input_file, self._outputs)
+                self._outputs.add(reserved)
+        params = dict(self.defaults, **params)
+        future = self._executor.submit(self._run, input_file, output_file, time.monotonic(), params)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(lambda done: self._discard(done, reserved))
+        return future
+
+    def _discard(self, future, output_file=None):
+        with self._lock:
+            self._futures.discard(future)
+            self._outputs.discard(output_file)
+
+    def map(self, input_files, output_files=None, timeout=None, **params):
+        """
+        转换多个文件，按输入顺序返回结果
+
+        Args:
+            input_files: 输入文件路径的可迭代对象
+            output_files: 对应的输出文件路径，None表示自动生成
+            timeout: 等待全部结果的最长秒数
+            **params: 所有任务共用的转换参数
+
+        Returns:
+            iterator: ConversionResult，按输入顺序
+        """
+        input_files = list(input_files)
+        output_files = list(output_files) if output_files is not None else [None] * len(input_files)
+        futures = [self.submit(input_file, output_file, **params)
+                   for input_file, output_file in zip(input_files, output_files)]
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        def results():
+            try:
+                for future in futures:
+                    yield future.result(None if deadline is None else max(0, deadline - time.monotonic()))
+            finally:
+                for future in futures:
+                    future.cancel()
+        return results()
+
+    def as_completed(self, futures=None, timeout=None):
+        """
+        按完成顺序返回Future
+
+        Args:
+            futures: Future列表，None表示本执行器中所有未完成的任务
+            timeout: 最长等待秒数
+        """
+        if futures is None:
+            with self._lock:
+                futures = list(self._futures)
+        return as_completed(futures, timeout)
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        关闭执行器
+
+        Args:
+            wait: 是否等待进行中的转换结束
+            cancel: 取消尚未开始的任务，并终止进行中的ffmpeg（删除未完成的输出）
+        """
+        if cancel:
+            self._cancel_event.set()
+        self._executor.shutdown(wait=wait, cancel_futures=cancel)
@@ -0,0 +1,697 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GUI的多文件转换队列
+
+队列数据保存在QAbstractTableModel中，QTableView只为可见的行请求数据，
+拖入上千个文件也不会卡顿；进度条由委托直接绘制，不为每一行创建控件。
+ConversionQueue用QProcess同时运行可配置数量的ffmpeg，支持真正的取消、暂停和重新排序。
+QProcess归属后台线程，ffmpeg输出的解码和解析都在后台线程进行，
+界面线程只按固定频率（10 Hz）刷新有变化的进度，GUI进程的CPU占用相对ffmpeg可以忽略。
+ffmpeg的输出按"ffmpeg"日志类别限速记录（默认不记录，见logging_setup.py）。
+"""
+
+import os
+import time
+import signal
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import (
+    Qt, QAbstractTableModel, QItemSelectionModel, QModelIndex, QObject, QProcess, QThread, QTimer,
+    QCoreApplication, QMetaObject, pyqtSignal, pyqtSlot
+)
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import (
+    QApplication, QStyle, QStyledItemDelegate, QStyleOptionProgressBar,
+    QTableView, QHeaderView, QAbstractItemView
+)
+
+from logging_setup import RateLimitedLog
+from preflight import output_extension
+from mp4_layout import MOOV_TOO_SMALL_ERROR
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+STATUS_TEXT = {
+    JOB_QUEUED: "等待中",
+    JOB_RUNNING: "转换中",
+    JOB_PAUSED: "已暂停",
+    JOB_DONE: "完成",
+    JOB_FAILED: "失败",
+    JOB_CANCELLED: "已取消",
+}
+
+STATUS_COLOR = {
+    JOB_RUNNING: "#e67e22",
+    JOB_PAUSED: "#7f8c8d",
+    JOB_DONE: "#27ae60",
+    JOB_FAILED: "#c0392b",
+    JOB_CANCELLED: "#7f8c8d",
+}
+
+# 暂停依赖SIGSTOP/SIGCONT，Windows下不可用
+PAUSE_SUPPORTED = hasattr(signal, "SIGSTOP")
+
+# 界面刷新进度的间隔（毫秒）
+REFRESH_INTERVAL_MS = 100
+# 每个任务写入日志的进度间隔（秒）
+PROGRESS_LOG_INTERVAL = 10
+
+COLUMN_FILE, COLUMN_STATUS, COLUMN_PROGRESS, COLUMN_RESULT = range(4)
+HEADERS = ["文件", "状态", "进度", "结果"]
+
+def make_queue_output_path(input_file, ext=None, reserved=()):
+    """
+    生成不与现有文件和队列中其他输出冲突的输出路径
+
+    Args:
+        input_file: 输入文件路径
+        ext: 输出扩展名（含点），None表示按输入的容器决定（不能封装H.265的容器改为.mp4）
+        reserved: 队列中已占用的输出路径
+
+    Returns:
+        str: 输出文件路径，如 video_h265.mp4、video_h265_1.mp4
+    """
+    base_name, input_ext = os.path.splitext(input_file)
+    ext = ext or output_extension(input_ext)
+    output_file = f"{base_name}_h265{ext}"
+    counter = 1
+    while os.path.exists(output_file) or output_file in reserved:
+        output_file = f"{base_name}_h265_{counter}{ext}"
+        counter += 1
+    return output_file
+
+def parse_ffmpeg_duration(line):
+    """从ffmpeg日志的 "Duration: 00:01:02.03" 行解析时长（秒），没有时返回None"""
+    marker = line.find("Duration:")
+    if marker < 0:
+        return None
+    value = line[marker + len("Duration:"):].split(",", 1)[0].strip()
+    try:
+        hours, minutes, seconds = value.split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+class ConversionJob:
+    """
+    队列中的一个转换任务
+
+    Args:
+        input_file: 输入文件路径
+        output_file: 输出文件路径
+    """
+
+    def __init__(self, input_file, output_file):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.status = JOB_QUEUED
+        self.progress = 0
+        self.duration = None
+        self.input_size = None
+        self.output_size = None
+        self.elapsed = None
+        self.message = ""
+        self.pid = None
+        self._started = None
+        # 以下字段只由后台线程写入
+        self._stdout_buffer = ""
+        self._stderr_buffer = ""
+        self._stderr_tail = deque(maxlen=20)
+        self._output_log = None
+        self._last_logged = 0
+        # 界面上显示的进度，与progress不同时才刷新
+        self._shown_progress = 0
+
+    @property
+    def active(self):
+        return self.status in (JOB_RUNNING, JOB_PAUSED)
+
+    def result_text(self):
+        if self.status == JOB_DONE and self.input_size and self.output_size is not None:
+            ratio = (1 - self.output_size / self.input_size) * 100
+            return f"{self.output_size/1024/1024:.2f} MB，压缩率 {ratio:.1f}%，耗时 {self.elapsed:.0f} 秒"
+        return self.message
+
+class ConversionQueueModel(QAbstractTableModel):
+    """转换队列的表格模型，每行一个ConversionJob"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._jobs = []
+        self._rows = {}
+        self._outputs = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._jobs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        job = self._jobs[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == COLUMN_FILE:
+                return os.path.basename(job.input_file)
+            if column == COLUMN_STATUS:
+                return STATUS_TEXT[job.status]
+            if column == COLUMN_PROGRESS:
+                return job.progress
+            if column == COLUMN_RESULT:
+                return job.result_text()
+        elif role == Qt.ToolTipRole:
+            if column == COLUMN_FILE:
+                return f"{job.input_file}\n→ {job.output_file}"
+            if column == COLUMN_RESULT:
+                return job.result_text() or None
+        elif role == Qt.ForegroundRole and column == COLUMN_STATUS:
+            color = STATUS_COLOR.get(job.status)
+            return QColor(color) if color else None
+        elif role == Qt.UserRole:
+            return job
+        return None
+
+    def jobs(self):
+        return list(self._jobs)
+
+    def job_at(self, row):
+        return self._jobs[row]
+
+    def add_files(self, paths, output_ext=None):
+        """
+        把文件加入队列末尾，已在队列中的输入文件会被忽略
+
+        Args:
+            paths: 输入文件路径的可迭代对象
+            output_ext: 输出扩展名，None表示按输入的容器决定
+
+        Returns:
+            int: 新加入的任务数
+        """
+        queued = {job.input_file for job in self._jobs}
+        new_jobs = []
+        for path in paths:
+            if path in queued:
+                continue
+            queued.add(path)
+            output_file = make_queue_output_path(path, output_ext, self._outputs)
+            self._outputs.add(output_file)
+            new_jobs.append(ConversionJob(path, output_file))
+        if new_jobs:
+            # 一次插入全部行，视图只刷新一次
+            first = len(self._jobs)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_jobs) - 1)
+            self._jobs.extend(new_jobs)
+            self._reindex(first)
+            self.endInsertRows()
+        return len(new_jobs)
+
+    def remove_rows(self, rows):
+        """移除未在运行的任务，返回移除的数量"""
+        removed = 0
+        for row in sorted(set(rows), reverse=True):
+            job = self._jobs[row]
+            if job.active:
+                continue
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._jobs[row]
+            self.endRemoveRows()
+            self._outputs.discard(job.output_file)
+            removed += 1
+        if removed:
+            self._reindex()
+        return removed
+
+    def move_rows(self, rows, target):
+        """
+        把选中的行移动到target之前，保持它们的相对顺序
+
+        Args:
+            rows: 行号列表
+            target: 目标位置（0表示移到最前）
+
+        Returns:
+            list: 移动后这些任务所在的行号
+        """
+        jobs = [self._jobs[row] for row in sorted(set(rows))]
+        for job in jobs:
+            row = self._rows[id(job)]
+            destination = min(max(0, target), len(self._jobs))
+            if row != destination and row + 1 != destination:
+                self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+                # beginMoveRows的目标位置按移除前计算，列表插入位置按移除后计算
+                self._jobs.insert(destination - 1 if destination > row else destination, self._jobs.pop(row))
+                self.endMoveRows()
+                self._reindex()
+            target = self._rows[id(job)] + 1
+        return [self._rows[id(job)] for job in jobs]
+
+    def row_of(self, job):
+        return self._rows.get(id(job))
+
+    def next_queued(self):
+        """队列中第一个等待中的任务"""
+        for job in self._jobs:
+            if job.status == JOB_QUEUED:
+                return job
+        return None
+
+    def counts(self):
+        """各状态的任务数"""
+        counts = dict.fromkeys(STATUS_TEXT, 0)
+        for job in self._jobs:
+            counts[job.status] += 1
+        return counts
+
+    def job_changed(self, job, first_column=COLUMN_FILE, last_column=COLUMN_RESULT):
+        """通知视图刷新任务所在行的指定列"""
+        row = self._rows.get(id(job))
+        if row is not None:
+            self.dataChanged.emit(self.index(row, first_column), self.index(row, last_column))
+
+    def _reindex(self, start=0):
+        for row in range(start, len(self._jobs)):
+            self._rows[id(self._jobs[row])] = row
+        if start == 0:
+            live = {id(job) for job in self._jobs}
+            for key in [key for key in self._rows if key not in live]:
+                del self._rows[key]
+
+class ProgressDelegate(QStyledItemDelegate):
+    """在进度列中直接绘制进度条"""
+
+    def paint(self, painter, option, index):
+        progress = index.data(Qt.DisplayRole) or 0
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(2, 3, -2, -3)
+        bar.minimum = 0
+        bar.maximum = 100
+        bar.progress = progress
+        bar.text = f"{progress}%"
+        bar.textVisible = True
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
+
+class ConversionQueueView(QTableView):
+    """
+    转换队列的表格视图
+
+    固定行高，视图不需要逐行计算高度，上千行也能流畅滚动。
+    """
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+        self.setItemDelegateForColumn(COLUMN_PROGRESS, ProgressDelegate(self))
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setAlternatingRowColors(True)
+        self.setWordWrap(False)
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(26)
+        header = self.horizontalHeader()
+        header.setSectionResizeMode(COLUMN_FILE, QHeaderView.Stretch)
+        header.setSectionResizeMode(COLUMN_STATUS, QHeaderView.Fixed)
+        header.setSectionResizeMode(COLUMN_PROGRESS, QHeaderView.Fixed)
+        header.setSectionResizeMode(COLUMN_RESULT, QHeaderView.Stretch)
+        header.resizeSection(COLUMN_STATUS, 70)
+        header.resizeSection(COLUMN_PROGRESS, 120)
+
+    def selected_rows(self):
+        return sorted(index.row() for index in self.selectionModel().selectedRows())
+
+    def selected_jobs(self):
+        return [self.model().job_at(row) for row in self.selected_rows()]
+
+    def move_selected(self, step):
+        """选中的任务上移(step<0)/下移(step>0)一行，step为None时移到最前"""
+        rows = self.selected_rows()
+        if not rows:
+            return
+        if step is None:
+            target = 0
+        elif step < 0:
+            target = rows[0] - 1
+        else:
+            target = rows[-1] + 2
+        moved = self.model().move_rows(rows, target)
+        selection = self.selectionModel()
+        selection.clearSelection()
+        for row in moved:
+            selection.select(self.model().index(row, 0), QItemSelectionModel.Select | QItemSelectionModel.Rows)
+
+class ProcessWorker(QObject):
+    """
+    在后台线程中运行ffmpeg进程并解析输出
+
+    进度只写入job.progress，不逐块通知界面；进程结束时发出finished信号。
+    """
+
+    started = pyqtSignal(object, int)
+    finished = pyqtSignal(object, int, bool)
+
+    def __init__(self):
+        super().__init__()
+        self._processes = {}
+
+    @pyqtSlot(object, object)
+    def start(self, job, cmd):
+        if job.status == JOB_CANCELLED:
+            # 准备期间被取消
+            self.finished.emit(job, -1, False)
+            return
+
+        # 进度以key=value形式输出到标准输出，日志保留在标准错误
+        program, args = cmd[0], ["-hide_banner", "-nostats", "-progress", "pipe:1"] + cmd[1:]
+        logger.debug(f"执行FFmpeg命令: {program} {' '.join(args)}")
+        process = QProcess(self)
+        process.readyReadStandardOutput.connect(lambda: self._read_progress(job, process))
+        process.readyReadStandardError.connect(lambda: self._read_log(job, process))
+        process.started.connect(lambda: self.started.emit(job, int(process.processId())))
+        process.finished.connect(
+            lambda exit_code, exit_status: self._finished(job, process, exit_code, exit_status == QProcess.NormalExit))
+        # 启动失败时不会再收到finished信号
+        process.errorOccurred.connect(
+            lambda error: error == QProcess.FailedToStart and self._finished(job, process, -1, False))
+        self._processes[id(job)] = process
+        process.start(program, args)
+
+    @pyqtSlot(object)
+    def terminate(self, job):
+        process = self._processes.get(id(job))
+        if process is None:
+            return
+        process.terminate()
+        # ffmpeg在几秒内没有退出时强制结束
+        QTimer.singleShot(5000, lambda: self._processes.get(id(job)) is process and process.kill())
+
+    @pyqtSlot()
+    def shutdown(self):
+        """终止所有进程并等待退出"""
+        for process in list(self._processes.values()):
+            process.terminate()
+            if not process.waitForFinished(5000):
+                process.kill()
+                process.waitForFinished(1000)
+
+    def _read_progress(self, job, process):
+        data = bytes(process.readAllStandardOutput()).decode(errors="replace")
+        if job.status != JOB_RUNNING:
+            return
+        job._stdout_buffer += data
+        lines = job._stdout_buffer.split("\n")
+        job._stdout_buffer = lines.pop()
+        progress = job.progress
+        for line in lines:
+            key, _, value = line.strip().partition("=")
+            # out_time_us和out_time_ms的单位都是微秒
+            if key in ("out_time_us", "out_time_ms") and job.duration:
+                try:
+                    progress = int(int(value) / 1000000 / job.duration * 100)
+                except ValueError:
+                    continue
+            elif key == "progress" and value == "end":
+                progress = 100
+        job.progress = max(0, min(100, progress))
+
+        # 日志按时间间隔采样，避免每个输出块都写入
+        now = time.monotonic()
+        if now - job._last_logged >= PROGRESS_LOG_INTERVAL:
+            job._last_logged = now
+            logger.debug(f"转换进度: {os.path.basename(job.input_file)} {job.progress}%")
+
+    def _read_log(self, job, process):
+        # 读取到的数据块可能在行中间截断，不完整的最后一行留到下次处理
+        job._stderr_buffer += bytes(process.readAllStandardError()).decode(errors="replace")
+        lines = job._stderr_buffer.replace("\r", "\n").split("\n")
+        job._stderr_buffer = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            job._stderr_tail.append(line)
+            job._output_log.log(line)
+            if job.duration is None:
+                job.duration = parse_ffmpeg_duration(line)
+
+    def _finished(self, job, process, exit_code, normal_exit):
+        if self._processes.get(id(job)) is not process:
+            return
+        del self._processes[id(job)]
+        process.deleteLater()
+        job._output_log.flush()
+        self.finished.emit(job, exit_code, normal_exit)
+
+class ConversionQueue(QObject):
+    """
+    按队列顺序调度ffmpeg进程
+
+    Args:
+        model: ConversionQueueModel
+        build_command: 函数，参数为ConversionJob，返回ffmpeg命令列表（第一项为可执行文件，
+                       输出路径为job.output_file）；抛出异常时该任务标记为失败。
+                       在线程池中调用，可以运行探测、试解码等耗时操作，不影响其他任务的进度读取和取消，
+                       但不能访问界面控件
+        max_concurrent: 同时运行的进程数
+    """
+
+    job_started = pyqtSignal(object)
+    job_finished = pyqtSignal(object)
+    queue_finished = pyqtSignal()
+
+    _start_requested = pyqtSignal(object, object)
+    _terminate_requested = pyqtSignal(object)
+    _command_rejected = pyqtSignal(object, str)
+
+    def __init__(self, model, build_command, max_concurrent=2, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.build_command = build_command
+        self.max_concurrent = max(1, max_concurrent)
+        self.running = False
+        self._active = []
+
+        self._thread = QThread(self)
+        self._worker = ProcessWorker()
+        self._worker.moveToThread(self._thread)
+        self._thread.finished.connect(self._worker.deleteLater)
+        self._start_requested.connect(self._worker.start)
+        self._terminate_requested.connect(self._worker.terminate)
+        self._worker.started.connect(self._process_started)
+        self._worker.finished.connect(self._finished)
+        self._command_rejected.connect(self._rejected)
+        self._thread.start()
+        # 生成命令（探测、预检）在单独的线程池中进行，不占用运行ffmpeg的后台线程
+        self._builder = ThreadPoolExecutor(thread_name_prefix="queue-command")
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+        # 进度由后台线程更新，界面按固定频率只刷新变化的行
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setInterval(REFRESH_INTERVAL_MS)
+        self._refresh_timer.timeout.connect(self._refresh_progress)
+
+    def active_jobs(self):
+        return list(self._active)
+
+    def start(self):
+        """开始（或继续）按顺序处理等待中的任务"""
+        self.running = True
+        self._schedule()
+
+    def stop(self):
+        """不再开始新的任务，进行中的任务继续完成"""
+        self.running = False
+
+    def set_max_concurrent(self, value):
+        self.max_concurrent = max(1, value)
+        if self.running:
+            self._schedule()
+
+    def cancel(self, job):
+        """取消任务：等待中的直接标记取消，运行中的终止ffmpeg进程并删除未完成的输出"""
+        if job.status == JOB_QUEUED:
+            job.status = JOB_CANCELLED
+            self.model.job_changed(job)
+        elif job.active:
+            if job.status == JOB_PAUSED:
+                self._signal(job, signal.SIGCONT)
+            job.status = JOB_CANCELLED
+            self.model.job_changed(job)
+            self._terminate_requested.emit(job)
+
+    def cancel_all(self):
+        self.running = False
+        for job in self.model.jobs():
+            self.cancel(job)
+
+    def shutdown(self):
+        """取消所有任务，等待ffmpeg退出并清理未完成的输出（关闭窗口时调用）"""
+        self.cancel_all()
+        # 正在生成的命令完成后发现任务已取消，不会再启动ffmpeg
+        self._builder.shutdown(wait=False, cancel_futures=True)
+        if self._thread.isRunning():
+            QMetaObject.invokeMethod(self._worker, "shutdown", Qt.BlockingQueuedConnection)
+            # 处理已排队的结束通知，删除未完成的输出文件
+            QCoreApplication.processEvents()
+            self._thread.quit()
+            self._thread.wait()
+
+    def requeue(self, job):
+        """把已结束（失败或取消）的任务重新放回队列"""
+        if job.status in (JOB_FAILED, JOB_CANCELLED) and job not in self._active:
+            job.status = JOB_QUEUED
+            job.progress = 0
+            job.message = ""
+            self.model.job_changed(job)
+            if self.running:
+                self._schedule()
+
+    def pause(self, job):
+        """
+        暂停运行中的任务（SIGSTOP），暂停期间仍占用并发名额；
+        ffmpeg进程还未启动（正在准备命令）时标记为暂停，进程启动后立即暂停
+        """
+        if job.status != JOB_RUNNING or not PAUSE_SUPPORTED:
+            return
+        if job.pid is None or self._signal(job, signal.SIGSTOP):
+            job.status = JOB_PAUSED
+            self.model.job_changed(job)
+
+    def resume(self, job):
+        if job.status == JOB_PAUSED and (job.pid is None or self._signal(job, signal.SIGCONT)):
+            job.status = JOB_RUNNING
+            self.model.job_changed(job)
+
+    def _signal(self, job, signum):
+        if not job.pid:
+            return False
+        try:
+            os.kill(job.pid, signum)
+            return True
+        except OSError as e:
+            logger.warning(f"向ffmpeg进程发送信号失败: {str(e)}")
+            return False
+
+    def _schedule(self):
+        while self.running and len(self._active) < self.max_concurrent:
+            job = self.model.next_queued()
+            if job is None:
+                break
+            self._start_job(job)
+        if not self._active and self.model.next_queued() is None:
+            self.running = False
+            self.queue_finished.emit()
+
+    def _start_job(self, job):
+        job.status = JOB_RUNNING
+        job.progress = 0
+        job._shown_progress = 0
+        job.message = ""
+        job.pid = None
+        job.input_size = os.path.getsize(job.input_file) if os.path.exists(job.input_file) else None
+        job._stdout_buffer = ""
+        job._stderr_buffer = ""
+        job._stderr_tail.clear()
+        job._output_log = RateLimitedLog(os.path.basename(job.input_file))
+        job._last_logged = 0
+
+        logger.info(f"开始转换: {job.input_file} -> {job.output_file}")
+        job._started = time.monotonic()
+        self._active.append(job)
+        self._builder.submit(self._build_command, job)
+        if not self._refresh_timer.isActive():
+            self._refresh_timer.start()
+        self.model.job_changed(job)
+        self.job_started.emit(job)
+
+    def _build_command(self, job):
+        # 在线程池中运行，结果通过信号交给后台线程（启动ffmpeg）或界面线程（失败）
+        try:
+            cmd = self.build_command(job)
+        except Exception as e:
+            self._command_rejected.emit(job, str(e))
+            return
+        self._start_requested.emit(job, cmd)
+
+    def _process_started(self, job, pid):
+        job.pid = pid
+        # 进程启动前就请求了暂停
+        if job.status == JOB_PAUSED:
+            self._signal(job, signal.SIGSTOP)
+
+    def _refresh_progress(self):
+        for job in self._active:
+            if job.progress != job._shown_progress:
+                job._shown_progress = job.progress
+                self.model.job_changed(job, COLUMN_PROGRESS, COLUMN_PROGRESS)
+
+    def _rejected(self, job, message):
+        logger.error(f"准备转换命令失败: {job.input_file}: {message}")
+        self._finished(job, -1, False, message)
+
+    def _finished(self, job, exit_code, normal_exit, error=None):
+        if job not in self._active:
+            return
+        self._active.remove(job)
+        if not self._active:
+            self._refresh_timer.stop()
+        job.pid = None
+        job.elapsed = time.monotonic() - job._started
+        if job.status == JOB_CANCELLED:
+            job.message = "已取消"
+            if error is None:
+                self._remove_output(job)
+            logger.info(f"转换已取消: {job.input_file}")
+        elif error is not None:
+            # 没有启动ffmpeg，输出文件不是本任务创建的，不删除
+            job.status = JOB_FAILED
+            job.message = error
+        elif exit_code == 0 and normal_exit and os.path.exists(job.output_file) \
+                and not any(MOOV_TOO_SMALL_ERROR in line for line in job._stderr_tail):
+            # 预留的moov空间不足时ffmpeg仍可能返回0，输出不完整
+            job.status = JOB_DONE
+            job.progress = 100
+            job.output_size = os.path.getsize(job.output_file)
+            logger.info(f"转换成功: {job.output_file}")
+        else:
+            job.status = JOB_FAILED
+            moov_errors = [line for line in job._stderr_tail if MOOV_TOO_SMALL_ERROR in line]
+            job.message = moov_errors[0] if moov_errors else job._stderr_tail[-1] if job._stderr_tail \
+                else f"FFmpeg进程退出，返回码: {exit_code}"
+            self._remove_output(job)
+            logger.error(f"转换失败: {job.input_file}, 返回码: {exit_code}")
+            for line in job._stderr_tail:
+                logger.error(f"FFmpeg: {line}")
+        job._shown_progress = job.progress
+        self.model.job_changed(job)
+        self.job_finished.emit(job)
+        if self.running:
+            self._schedule()
+        elif not self._active:
+            self.queue_finished.emit()
+
+    def _remove_output(self, job):
+        try:
+            if os.path.exists(job.output_file):
+                os.remove(job.output_file)
+        except OSError as e:
+            logger.warning(f"删除未完成的输出文件失败: {job.output_file}: {str(e)}")
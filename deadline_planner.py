@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按截止时间选择x265预设
+
+根据探测到的时长、分辨率和帧率估算剩余工作量（像素数），结合实测的编码速度，
+选择仍能在截止时间前完成的最慢（压缩率最高）的预设。批量转换进行中持续用实测速度修正：
+落后时改用更快的预设，提前时改用更慢的预设。
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import datetime
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# 从快到慢
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+# 各预设相对medium的编码耗时（近似值，实际速度用medium等效速度的实测值修正）
+PRESET_COST = {
+    "ultrafast": 0.12,
+    "superfast": 0.16,
+    "veryfast": 0.25,
+    "faster": 0.35,
+    "fast": 0.55,
+    "medium": 1.0,
+    "slow": 2.2,
+    "slower": 6.0,
+    "veryslow": 12.0,
+}
+# 预留的时间余量，估算的完成时间不超过剩余时间的这一比例
+SAFETY_MARGIN = 0.9
+# 实测速度的指数移动平均权重
+RATE_WEIGHT = 0.3
+# 无法探测时长时假设的码率（用于从文件大小估算时长）
+ASSUMED_BITRATE = 5_000_000
+# 校准时编码的秒数
+CALIBRATION_SECONDS = 5
+
+def default_history_file():
+    """编码速度记录，默认为 ~/.cache/video-optimizer/encode_speed.json"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "video-optimizer", "encode_speed.json")
+
+def parse_deadline(value, now=None):
+    """
+    解析截止时间
+
+    支持时刻（"06:00"，已过去时表示明天）、时长（"8h"、"90m"、"1h30m"）和日期时间（"2026-10-20 06:00"）。
+
+    Returns:
+        float: 截止时间的时间戳
+
+    Raises:
+        ValueError: 无法解析
+    """
+    now = now or datetime.datetime.now()
+    value = value.strip()
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})", value)
+    if match:
+        deadline = now.replace(hour=int(match.group(1)), minute=int(match.group(2)), second=0, microsecond=0)
+        if deadline <= now:
+            deadline += datetime.timedelta(days=1)
+        return deadline.timestamp()
+    match = re.fullmatch(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m)?", value.lower())
+    if match and any(match.groups()):
+        hours, minutes = (float(part or 0) for part in match.groups())
+        return (now + datetime.timedelta(hours=hours, minutes=minutes)).timestamp()
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"无法解析截止时间: {value}（示例: 06:00、8h、1h30m、2026-10-20 06:00）")
+
+def work_units(info):
+    """
+    一个文件的编码工作量（像素数 = 宽 × 高 × 帧数）
+
+    Args:
+        info: get_video_info()的结果
+
+    Returns:
+        float: 工作量，缺少的信息按1080p、30fps估算
+    """
+    width = info.get("width") or 1920
+    height = info.get("height") or 1080
+    fps = info.get("fps") or 30.0
+    duration = info.get("duration") or info.get("file_size", 0) * 8 / ASSUMED_BITRATE
+    return width * height * fps * duration
+
+def measure_encode_rate(input_file, info, ffmpeg="ffmpeg", threads=0, seconds=CALIBRATION_SECONDS):
+    """
+    编码输入文件开头几秒（medium预设，不写输出），测量medium等效速度
+
+    测得的是单个任务独占机器时的速度，x265通常已能用满所有核，作为并发时合计速度的保守初始值。
+
+    Returns:
+        float: 每秒编码的像素数，失败时返回None
+    """
+    cmd = [ffmpeg, "-hide_banner", "-nostats", "-i", input_file, "-t", str(seconds), "-map", "0:v:0",
+           "-c:v", "libx265", "-preset", "medium", "-x265-params", "log-level=error"]
+    if threads > 0:
+        cmd.extend(["-threads", str(threads)])
+    cmd.extend(["-f", "null", "-"])
+    started = time.monotonic()
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, timeout=seconds * 60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"编码速度校准失败: {str(e)}")
+        return None
+    elapsed = time.monotonic() - started
+    if result.returncode != 0 or elapsed <= 0:
+        logger.warning(f"编码速度校准失败，FFmpeg返回码: {result.returncode}")
+        return None
+    sample = dict(info, duration=min(seconds, info.get("duration") or seconds))
+    return work_units(sample) / elapsed
+
+class DeadlinePlanner:
+    """
+    按截止时间选择预设
+
+    速度用"medium等效速度"表示：所有并发任务合计每秒能以medium预设编码的像素数。
+    每完成一个文件就用实测值修正，并按最新速度重新选择之后开始的文件的预设。
+
+    Args:
+        deadline: 截止时间的时间戳
+        total_units: 全部文件的工作量（work_units之和）
+        workers: 同时进行的转换数量
+        history_file: 编码速度记录文件，None表示不保存
+    """
+
+    def __init__(self, deadline, total_units, workers=1, history_file=None):
+        self.deadline = deadline
+        self.workers = max(1, workers)
+        self.history_file = history_file
+        self._lock = threading.Lock()
+        self._pending_units = total_units
+        # 进行中的文件: 编号 -> (工作量, 预设)
+        self._running = {}
+        self._rate = None
+        self._history = {}
+        self.preset = None
+        if history_file and os.path.exists(history_file):
+            try:
+                with open(history_file, "r", encoding="utf-8") as f:
+                    self._history = json.load(f)
+                self._rate = self._history.get(str(self.workers))
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取编码速度记录失败: {str(e)}")
+
+    @property
+    def calibrated(self):
+        return self._rate is not None
+
+    def set_rate(self, rate):
+        """设置medium等效速度（如校准的结果）"""
+        with self._lock:
+            self._rate = rate
+
+    def _remaining_seconds(self, preset):
+        """用指定预设完成剩余工作需要的秒数（进行中的文件按已完成一半估算）"""
+        running_cost = sum(units * PRESET_COST[running_preset] / 2
+                           for units, running_preset in self._running.values())
+        return (self._pending_units * PRESET_COST[preset] + running_cost) / self._rate
+
+    def choose_preset(self):
+        """
+        选择下一个文件的预设：能在截止时间前完成的最慢预设，都来不及时选最快的
+
+        Returns:
+            str: 预设名
+        """
+        with self._lock:
+            time_left = (self.deadline - time.time()) * SAFETY_MARGIN
+            chosen = PRESETS[0]
+            if self._rate:
+                for preset in PRESETS:
+                    if self._remaining_seconds(preset) <= time_left:
+                        chosen = preset
+            if chosen != self.preset:
+                needed = self._remaining_seconds(chosen) if self._rate else float("inf")
+                if self.preset is None:
+                    logger.info(f"按截止时间选择预设: {chosen}（预计需要 {needed/3600:.2f} 小时，"
+                                f"剩余 {time_left/SAFETY_MARGIN/3600:.2f} 小时）")
+                    print(f"⏱️  按截止时间选择预设: {chosen}（预计需要 {needed/3600:.2f} 小时）")
+                elif PRESETS.index(chosen) < PRESETS.index(self.preset):
+                    logger.warning(f"进度落后，改用更快的预设: {self.preset} -> {chosen}")
+                    print(f"⏩ 进度落后，改用更快的预设: {self.preset} -> {chosen}")
+                else:
+                    logger.info(f"进度提前，改用更慢（压缩率更高）的预设: {self.preset} -> {chosen}")
+                    print(f"⏪ 进度提前，改用更慢的预设: {self.preset} -> {chosen}")
+                self.preset = chosen
+            if chosen == PRESETS[0] and self._rate and self._remaining_seconds(chosen) > time_left:
+                logger.warning("使用最快的预设也无法在截止时间前完成")
+            return chosen
+
+    def start(self, job_id, units, preset):
+        """文件开始转换"""
+        with self._lock:
+            self._pending_units -= units
+            self._running[job_id] = (units, preset)
+
+    def finish(self, job_id, encode_seconds, success=True, encoded_fraction=1.0):
+        """
+        文件转换结束，成功时用实测耗时修正速度
+
+        并发时每个任务的耗时已包含与其他任务争抢CPU的影响，合计速度 = 单个任务的速度 × 并发数。
+
+        Args:
+            job_id: start()时的任务标识
+            encode_seconds: 实际编码的耗时，0表示没有编码（如使用了缓存的结果），不修正速度
+            success: 是否成功
+            encoded_fraction: 本次实际编码的工作量比例（从检查点继续时小于1）
+        """
+        with self._lock:
+            units, preset = self._running.pop(job_id)
+            if not success or encode_seconds <= 0 or encoded_fraction <= 0:
+                return
+            measured = units * encoded_fraction * PRESET_COST[preset] / encode_seconds * self.workers
+            self._rate = measured if self._rate is None else self._rate + RATE_WEIGHT * (measured - self._rate)
+            logger.info(f"实测medium等效速度: {measured/1e6:.1f} M像素/秒，修正后: {self._rate/1e6:.1f} M像素/秒")
+            if self.history_file:
+                self._history[str(self.workers)] = self._rate
+                self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.history_file)), exist_ok=True)
+            temp_file = f"{self.history_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self._history, f, indent=1)
+            os.replace(temp_file, self.history_file)
+        except OSError as e:
+            logger.warning(f"保存编码速度记录失败: {str(e)}")
@@ -11,6 +11,8 @@ import logging
 import time
 import platform
 
+from ffmpeg_capabilities import find_ffmpeg, get_capabilities
+
 # 配置详细日志到工作目录
 logging.basicConfig(
     level=logging.DEBUG,
@@ -25,62 +27,35 @@ logger = logging.getLogger(__name__)
 def get_ffmpeg_path():
     """获取FFmpeg路径，优先使用内置的FFmpeg"""
     logger.debug("开始获取FFmpeg路径")
+    logger.debug(f"当前系统架构: {platform.machine()}")
     
-    # 获取当前系统架构
-    system_arch = platform.machine()
-    logger.debug(f"当前系统架构: {system_arch}")
-    
-    # 尝试使用内置FFmpeg路径
-    if system_arch == 'arm64':
-        ffmpeg_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ffmpeg_bin', 'ffmpeg_macos_arm64', 'ffmpeg')
-    else:
-        ffmpeg_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ffmpeg_bin', 'ffmpeg_macos_x64', 'ffmpeg')
-    
-    logger.debug(f"尝试内置FFmpeg路径: {ffmpeg_path}")
-    
-    # 检查文件是否存在且可执行
-    if os.path.isfile(ffmpeg_path) and os.access(ffmpeg_path, os.X_OK):
-        logger.debug(f"找到可用的内置FFmpeg: {ffmpeg_path}")
-        return ffmpeg_path
+    ffmpeg_path = find_ffmpeg()
+    if ffmpeg_path:
+        logger.debug(f"找到可用的FFmpeg: {ffmpeg_path}")
     else:
-        logger.warning(f"未找到可用的内置FFmpeg，尝试使用系统FFmpeg")
-        # 尝试使用系统FFmpeg
-        try:
-            result = subprocess.run(['which', 'ffmpeg'], capture_output=True, text=True, check=True)
-            system_ffmpeg = result.stdout.strip()
-            logger.debug(f"找到系统FFmpeg: {system_ffmpeg}")
-            return system_ffmpeg
-        except (subprocess.SubprocessError, FileNotFoundError) as e:
-            logger.error(f"未找到系统FFmpeg: {str(e)}")
-            return None
+        logger.error("未找到内置或系统FFmpeg")
+    return ffmpeg_path
 
 def check_ffmpeg_installed(ffmpeg_path):
-    """检查FFmpeg是否正确安装并支持H265编码"""
+    """检查FFmpeg是否正确安装并支持H265编码（功能按二进制文件缓存，只在首次运行时探测）"""
     if not ffmpeg_path:
         logger.error("FFmpeg路径为空")
         return False
     
     try:
-        # 检查FFmpeg版本
-        result = subprocess.run([ffmpeg_path, '-version'], capture_output=True, text=True, timeout=10)
-        logger.debug(f"FFmpeg版本信息:\n{result.stdout}")
-        
-        # 检查libx265编码器
-        encoders_result = subprocess.run([ffmpeg_path, '-encoders'], capture_output=True, text=True, timeout=10)
-        logger.debug(f"FFmpeg编码器列表中包含x265: {'libx265' in encoders_result.stdout}")
-        
-        # 测试简单的编码命令
-        test_cmd = [ffmpeg_path, '-f', 'lavfi', '-i', 'color=c=black:s=128x72:d=1', 
-                   '-c:v', 'libx265', '-preset', 'ultrafast', '-crf', '30', 
-                   '-f', 'mp4', '-y', '/dev/null']
-        test_result = subprocess.run(test_cmd, capture_output=True, text=True, timeout=15)
-        logger.debug(f"H265编码测试输出:\n{test_result.stdout}")
-        logger.debug(f"H265编码测试错误:\n{test_result.stderr}")
-        
-        return test_result.returncode == 0
-    except (subprocess.SubprocessError, FileNotFoundError, TimeoutError) as e:
+        capabilities = get_capabilities(ffmpeg_path, timeout=10)
+    except (subprocess.SubprocessError, OSError) as e:
         logger.error(f"FFmpeg检查失败: {str(e)}")
         return False
+    if capabilities is None:
+        logger.error(f"FFmpeg文件不存在: {ffmpeg_path}")
+        return False
+    
+    logger.debug(f"FFmpeg版本: {capabilities.version}")
+    logger.debug(f"FFmpeg编译配置: {' '.join(capabilities.configuration)}")
+    logger.debug(f"FFmpeg编码器列表中包含x265: {capabilities.has_x265}")
+    logger.debug(f"libx265支持的像素格式: {' '.join(capabilities.x265_pix_fmts)}")
+    return capabilities.has_x265
 
 def convert_video(input_path, output_path, ffmpeg_path):
     """执行视频转换"""
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FFmpeg可执行文件的查找和能力缓存
+
+每个FFmpeg二进制文件只探测一次（版本、编译配置、编码器、滤镜、封装格式、硬件加速、libx265支持的像素格式和版本），
+结果按可执行文件的路径、大小和修改时间缓存在内存和磁盘上。之后的启动和转换直接读取缓存，
+不再启动额外的进程就能判断某个编码器或滤镜是否可用，选择有效且最快的命令。
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import logging
+import platform
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+# 磁盘缓存最多保留的二进制文件数
+MAX_CACHED_BINARIES = 16
+
+_memory_cache = {}
+_lock = threading.Lock()
+
+def default_cache_file():
+    """磁盘缓存路径，默认为 ~/.cache/video-optimizer/ffmpeg_capabilities.json"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "video-optimizer", "ffmpeg_capabilities.json")
+
+def find_ffmpeg():
+    """
+    获取FFmpeg可执行文件路径，优先使用内置版本（ffmpeg_bin/<平台>/ffmpeg），否则使用PATH中的ffmpeg
+
+    Returns:
+        str: FFmpeg路径，未找到时返回None
+    """
+    # 获取当前可执行文件所在目录
+    if getattr(sys, 'frozen', False):
+        # 打包后的环境
+        base_dir = os.path.dirname(sys.executable)
+        # 在Mac应用中，实际可执行文件在Contents/MacOS/目录
+        if base_dir.endswith('/Contents/MacOS'):
+            base_dir = os.path.dirname(os.path.dirname(base_dir))
+            ffmpeg_dir = os.path.join(base_dir, 'Contents', 'Resources', 'ffmpeg')
+        else:
+            ffmpeg_dir = os.path.join(base_dir, 'ffmpeg')
+    else:
+        # 开发环境
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        ffmpeg_dir = os.path.join(base_dir, 'ffmpeg_bin')
+
+    # 根据系统架构选择对应的FFmpeg目录
+    system = platform.system()
+    architecture = platform.machine()
+    if system == 'Darwin':
+        if architecture in ['arm64', 'aarch64']:
+            ffmpeg_dir = os.path.join(ffmpeg_dir, 'ffmpeg_macos_arm64')
+        else:
+            ffmpeg_dir = os.path.join(ffmpeg_dir, 'ffmpeg_macos_x64')
+    elif system == 'Windows':
+        ffmpeg_dir = os.path.join(ffmpeg_dir, 'ffmpeg_windows_x64')
+    else:  # Linux
+        ffmpeg_dir = os.path.join(ffmpeg_dir, 'ffmpeg_linux_x64')
+    ffmpeg_path = os.path.join(ffmpeg_dir, 'ffmpeg.exe' if system == 'Windows' else 'ffmpeg')
+
+    # 如果内置FFmpeg存在，返回它的路径
+    if os.path.isfile(ffmpeg_path):
+        return ffmpeg_path
+    return shutil.which('ffmpeg')
+
+def binary_key(ffmpeg_path):
+    """
+    可执行文件的缓存键
+
+    Returns:
+        str: "绝对路径|大小|修改时间"，文件不存在时返回None
+    """
+    try:
+        path = os.path.realpath(ffmpeg_path if os.sep in ffmpeg_path else (shutil.which(ffmpeg_path) or ffmpeg_path))
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{path}|{st.st_size}|{st.st_mtime_ns}"
+
+class FfmpegCapabilities:
+    """
+    一个FFmpeg二进制文件支持的功能
+
+    Attributes:
+        path: 可执行文件路径
+        version: 版本号，如 "6.0-static"
+        configuration: 编译配置参数列表
+        encoders/filters/muxers: 名称集合
+        hwaccels: 硬件加速方法列表
+        x265_pix_fmts: libx265支持的像素格式
+        x265_version: libx265的版本，如 "3.5+1-f0c1022b6"
+        partial: 只有-version的结果（完整探测超时），编码器等列表未知，不会被缓存
+    """
+
+    def __init__(self, path, version=None, configuration=None, encoders=None, filters=None,
+                 muxers=None, hwaccels=None, x265_pix_fmts=None, x265_version=None, partial=False):
+        self.path = path
+        self.version = version
+        self.configuration = list(configuration or [])
+        self.encoders = set(encoders or ())
+        self.filters = set(filters or ())
+        self.muxers = set(muxers or ())
+        self.hwaccels = list(hwaccels or [])
+        self.x265_pix_fmts = list(x265_pix_fmts or [])
+        self.x265_version = x265_version
+        self.partial = partial
+
+    def has_encoder(self, name):
+        return name in self.encoders
+
+    def has_filter(self, name):
+        return name in self.filters
+
+    def has_muxer(self, name):
+        return name in self.muxers
+
+    @property
+    def has_x265(self):
+        return "libx265" in self.encoders
+
+    @property
+    def x265_10bit(self):
+        """libx265是否为支持10位的编译版本"""
+        return any("10le" in pix_fmt or "10be" in pix_fmt for pix_fmt in self.x265_pix_fmts)
+
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "configuration": self.configuration,
+            "encoders": sorted(self.encoders),
+            "filters": sorted(self.filters),
+            "muxers": sorted(self.muxers),
+            "hwaccels": self.hwaccels,
+            "x265_pix_fmts": self.x265_pix_fmts,
+            "x265_version": self.x265_version,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def describe(self):
+        if self.partial:
+            return f"FFmpeg {self.version or '未知版本'}（功能探测超时，编码器未知）"
+        return (f"FFmpeg {self.version or '未知版本'}，libx265: {'支持' if self.has_x265 else '不支持'}"
+                f"{'（10位）' if self.x265_10bit else ''}，硬件加速: {', '.join(self.hwaccels) or '无'}")
+
+def _run(ffmpeg_path, args, timeout):
+    completed = subprocess.run([ffmpeg_path, "-hide_banner"] + args,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, errors="replace", timeout=timeout)
+    return completed.stdout + completed.stderr
+
+def _parse_listing(text, pattern, separator=True):
+    """解析 -encoders/-filters/-muxers 的输出，返回名称集合（-filters的说明部分没有分隔线）"""
+    names = set()
+    listing = not separator
+    for line in text.splitlines():
+        if not listing:
+            # 说明部分以 "------" 或 " --" 结束
+            listing = line.strip().startswith("--")
+            continue
+        match = pattern.match(line)
+        if match:
+            names.update(match.group(1).split(","))
+    return names
+
+_ENCODER_LINE = re.compile(r"^\s*[VASFXBD.]{6}\s+(\S+)")
+_FILTER_LINE = re.compile(r"^\s*[TSC.|]{2,3}\s+(\S+)\s+\S*->\S*")
+_MUXER_LINE = re.compile(r"^\s*D?E\s*d?\s+(\S+)")
+
+def _parse_version(text):
+    """解析 -version 的输出，返回 (版本号, 编译配置参数列表)"""
+    version = None
+    configuration = []
+    for line in text.splitlines():
+        if line.startswith("ffmpeg version "):
+            version = line[len("ffmpeg version "):].split()[0]
+        elif line.startswith("configuration:"):
+            configuration = line[len("configuration:"):].split()
+    return version, configuration
+
+def probe_version(ffmpeg_path, timeout=15):
+    """
+    只运行 -version（完整探测超时时的后备），结果的partial为True，不缓存
+
+    Raises:
+        OSError: 无法执行
+        subprocess.TimeoutExpired: 超时
+    """
+    version, configuration = _parse_version(_run(ffmpeg_path, ["-version"], timeout))
+    return FfmpegCapabilities(path=ffmpeg_path, version=version, configuration=configuration, partial=True)
+
+def probe_capabilities(ffmpeg_path, timeout=15):
+    """
+    运行FFmpeg探测功能（并行运行几个查询命令）
+
+    Raises:
+        OSError: 无法执行
+        subprocess.TimeoutExpired: 超时
+    """
+    queries = {
+        "version": ["-version"],
+        "encoders": ["-encoders"],
+        "filters": ["-filters"],
+        "muxers": ["-muxers"],
+        "hwaccels": ["-hwaccels"],
+        "x265": ["-h", "encoder=libx265"],
+        # libx265的版本只在编码时输出，编码一帧很小的测试图像
+        "x265_version": ["-f", "lavfi", "-i", "color=s=64x64:d=0.04", "-frames:v", "1",
+                         "-c:v", "libx265", "-f", "null", "-"],
+    }
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = {name: executor.submit(_run, ffmpeg_path, args, timeout) for name, args in queries.items()}
+        outputs = {name: future.result() for name, future in futures.items()}
+
+    version, configuration = _parse_version(outputs["version"])
+
+    hwaccels = []
+    for line in outputs["hwaccels"].splitlines():
+        line = line.strip()
+        if line and not line.endswith(":"):
+            hwaccels.append(line)
+
+    x265_pix_fmts = []
+    for line in outputs["x265"].splitlines():
+        if "Supported pixel formats:" in line:
+            x265_pix_fmts = line.split(":", 1)[1].split()
+
+    match = re.search(r"HEVC encoder version (\S+)", outputs["x265_version"])
+    x265_version = match.group(1) if match else None
+
+    return FfmpegCapabilities(
+        path=ffmpeg_path,
+        version=version,
+        configuration=configuration,
+        encoders=_parse_listing(outputs["encoders"], _ENCODER_LINE),
+        filters=_parse_listing(outputs["filters"], _FILTER_LINE, separator=False),
+        muxers=_parse_listing(outputs["muxers"], _MUXER_LINE),
+        hwaccels=hwaccels,
+        x265_pix_fmts=x265_pix_fmts,
+        x265_version=x265_version,
+    )
+
+def _load_disk_cache(cache_file):
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == CACHE_VERSION:
+            return data.get("binaries", {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+def _save_disk_cache(cache_file, key, capabilities):
+    binaries = _load_disk_cache(cache_file)
+    binaries.pop(key, None)
+    binaries[key] = capabilities.to_dict()
+    # 只保留最近探测的几个二进制文件
+    for old_key in list(binaries)[:-MAX_CACHED_BINARIES]:
+        del binaries[old_key]
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "binaries": binaries}, f, ensure_ascii=False)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        logger.warning(f"保存FFmpeg能力缓存失败: {str(e)}")
+
+def get_capabilities(ffmpeg_path=None, timeout=15, cache_file=None, refresh=False):
+    """
+    获取FFmpeg的功能，优先使用内存和磁盘缓存
+
+    Args:
+        ffmpeg_path: FFmpeg路径，None表示使用find_ffmpeg()的结果
+        timeout: 每个探测命令的超时时间（秒）
+        cache_file: 磁盘缓存文件，None表示default_cache_file()
+        refresh: 忽略缓存重新探测
+
+    Returns:
+        FfmpegCapabilities: 找不到FFmpeg时返回None
+
+    Raises:
+        OSError: 无法执行
+        subprocess.TimeoutExpired: 探测超时（不会被缓存）
+    """
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    key = binary_key(ffmpeg_path) if ffmpeg_path else None
+    if key is None:
+        return None
+    cache_file = cache_file or default_cache_file()
+
+    # 探测进行中时，其他调用者等待它的结果而不是再启动进程
+    with _lock:
+        if not refresh:
+            capabilities = _memory_cache.get(key)
+            if capabilities is not None:
+                return capabilities
+            data = _load_disk_cache(cache_file).get(key)
+            if data is not None:
+                capabilities = FfmpegCapabilities.from_dict(data)
+                capabilities.path = ffmpeg_path
+                _memory_cache[key] = capabilities
+                logger.debug(f"使用缓存的FFmpeg能力: {ffmpeg_path}")
+                return capabilities
+
+        capabilities = probe_capabilities(ffmpeg_path, timeout)
+        _memory_cache[key] = capabilities
+        _save_disk_cache(cache_file, key, capabilities)
+    logger.info(f"FFmpeg能力探测完成: {ffmpeg_path}, {capabilities.describe()}")
+    return capabilities
+
+def check_ffmpeg(ffmpeg_path, timeout=15):
+    """
+    检查FFmpeg能否执行（结果来自能力缓存）
+
+    Args:
+        ffmpeg_path: FFmpeg可执行文件路径
+        timeout: 探测命令的超时时间（秒）
+
+    Returns:
+        dict: path, available, version, timed_out, error, capabilities
+    """
+    result = {"path": ffmpeg_path, "available": False, "version": None, "timed_out": False,
+              "error": None, "capabilities": None}
+    try:
+        capabilities = get_capabilities(ffmpeg_path, timeout=timeout) if ffmpeg_path else None
+    except subprocess.TimeoutExpired:
+        # 超时不代表不可用（打包后的应用首次启动可能很慢），不缓存，下次重新检查
+        logger.warning("FFmpeg版本检查超时，但将继续")
+        result["available"] = True
+        result["timed_out"] = True
+        return result
+    except OSError as e:
+        result["error"] = str(e)
+        return result
+    if capabilities is None:
+        result["error"] = "FFmpeg文件不存在"
+        return result
+    result["available"] = True
+    result["version"] = capabilities.version
+    result["capabilities"] = capabilities
+    return result
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行批量转换的优雅停止
+
+第一次收到SIGINT/SIGTERM：不再开始新的任务，等待进行中的转换完成（drain）；
+第二次收到：终止所有ffmpeg进程组，删除未完成的输出，保存可恢复的状态。
+在可抢占的云主机上，几秒内干净地停止决定了已完成的工作能否保留。
+
+信号处理函数只设置Event：日志的队列和标准输出的缓冲区都有不可重入的锁，在处理函数中
+记录日志或print可能与被打断的主线程死锁，提示和回调由后台线程在处理函数之外执行。
+"""
+
+import signal
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ShutdownController:
+    """
+    信号处理和停止状态
+
+    Attributes:
+        draining: threading.Event，已请求停止，不应再开始新任务
+        cancel_event: threading.Event，已请求立即停止，进行中的ffmpeg应被终止
+    """
+
+    def __init__(self):
+        self.draining = threading.Event()
+        self.cancel_event = threading.Event()
+        self._callbacks = []
+        self._previous_handlers = {}
+        # 收到的信号名称，由信号处理函数写入，后台线程读取
+        self._signal_names = []
+        self._reporter = None
+
+    @property
+    def stop_requested(self):
+        return self.draining.is_set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def on_drain(self, callback):
+        """注册第一次收到信号时的回调（如停止监视循环），在后台线程中调用"""
+        self._callbacks.append(callback)
+
+    def install(self):
+        """为SIGINT和SIGTERM安装处理函数（只能在主线程调用）"""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._previous_handlers[signum] = signal.signal(signum, self._handle_signal)
+        if self._reporter is None:
+            self._reporter = threading.Thread(target=self._report, name="shutdown", daemon=True)
+            self._reporter.start()
+        return self
+
+    def uninstall(self):
+        """恢复原来的信号处理函数"""
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers.clear()
+
+    def _handle_signal(self, signum, frame):
+        # 只设置状态，不记录日志、不输出、不调用回调
+        self._signal_names.append(signal.Signals(signum).name)
+        if not self.draining.is_set():
+            self.draining.set()
+        elif not self.cancel_event.is_set():
+            self.cancel_event.set()
+
+    def _report(self):
+        """后台线程：状态变化后输出提示并调用回调"""
+        self.draining.wait()
+        name = self._signal_names[0] if self._signal_names else "停止信号"
+        logger.warning(f"收到{name}，不再开始新的转换，等待进行中的转换完成（再次发送将立即停止）")
+        print(f"\n⚠️  收到{name}，等待进行中的转换完成，再按一次Ctrl-C立即停止")
+        for callback in self._callbacks:
+            callback()
+        self.cancel_event.wait()
+        name = self._signal_names[-1] if self._signal_names else "停止信号"
+        logger.warning(f"再次收到{name}，终止进行中的转换")
+        print(f"\n⛔ 再次收到{name}，正在终止进行中的转换...")
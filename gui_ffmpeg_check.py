@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GUI启动时在后台线程检查FFmpeg，窗口先显示，检查结果通过信号返回界面线程
+"""
+
+import shutil
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from ffmpeg_capabilities import check_ffmpeg
+
+class FfmpegCheckThread(QThread):
+    """
+    后台检查FFmpeg
+
+    Args:
+        probe: 无参数函数，返回check_ffmpeg格式的结果字典（可以包含查找路径等准备工作）
+    """
+
+    checked = pyqtSignal(object)
+
+    def __init__(self, probe, parent=None):
+        super().__init__(parent)
+        self.probe = probe
+
+    def run(self):
+        self.checked.emit(self.probe())
+
+def check_ffmpeg_on_path():
+    """检查PATH中的ffmpeg"""
+    return check_ffmpeg(shutil.which("ffmpeg"))
@@ -3,142 +3,60 @@
 """
 视频H264转H265工具 - GUI版本
 使用PyQt5创建图形界面，使用FFmpeg引擎进行视频转码
-仅支持单个文件转换
+支持多文件队列（可拖入文件或文件夹），同时转换多个文件，可取消、暂停和调整顺序
 """
 
 import os
 import sys
 import logging
-import subprocess
-import time
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QLabel, QPushButton, QFileDialog, QComboBox, QSlider, QMessageBox,
-    QProgressBar, QFrame, QGroupBox
+    QGroupBox, QSpinBox
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont, QIcon
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("video_conversion_gui.log"),
-        logging.StreamHandler()
-    ]
+from conversion_queue import (
+    ConversionQueue, ConversionQueueModel, ConversionQueueView, PAUSE_SUPPORTED,
+    JOB_RUNNING, JOB_PAUSED, JOB_DONE, JOB_FAILED, JOB_CANCELLED
 )
+from video_scanner import iter_video_files
+from gui_ffmpeg_check import FfmpegCheckThread, check_ffmpeg_on_path
+from logging_setup import setup_logging
+from index import is_generated_output
+
 logger = logging.getLogger(__name__)
 
-class ConversionThread(QThread):
-    """转换线程，用于在后台执行视频转换，避免界面卡顿"""
-    progress = pyqtSignal(int)
-    finished = pyqtSignal(bool, str, float, str)
-    
-    def __init__(self, input_file, output_file, crf, preset, audio_codec, audio_bitrate, threads):
-        super().__init__()
-        self.input_file = input_file
-        self.output_file = output_file
-        self.crf = crf
-        self.preset = preset
-        self.audio_codec = audio_codec
-        self.audio_bitrate = audio_bitrate
-        self.threads = threads
-    
-    def run(self):
-        try:
-            # 获取文件信息
-            input_info = self.get_video_info(self.input_file)
-            if not input_info:
-                self.finished.emit(False, "无法获取输入文件信息", 0, "")
-                return
-            
-            # 构建ffmpeg命令
-            cmd = ["ffmpeg", "-i", self.input_file]
-            cmd.extend(["-c:v", "libx265", "-crf", str(self.crf), "-preset", self.preset, "-tag:v", "hvc1"])
-            
-            # 添加线程参数
-            if self.threads > 0:
-                cmd.extend(["-threads", str(self.threads)])
-            
-            # 添加音频参数
-            cmd.extend(["-c:a", self.audio_codec, "-b:a", self.audio_bitrate])
-            cmd.extend(["-y", self.output_file])
-            
-            logger.info(f"开始转换: {self.input_file} -> {self.output_file}")
-            logger.info(f"使用参数: CRF={self.crf}, 预设={self.preset}, 音频={self.audio_codec}@{self.audio_bitrate}")
-            logger.info(f"执行的FFmpeg命令: {' '.join(cmd)}")
-            
-            start_time = time.time()
-            
-            # 执行ffmpeg命令
-            process = subprocess.run(cmd, 
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   text=True)
-            
-            end_time = time.time()
-            duration = end_time - start_time
-            
-            if process.returncode != 0:
-                error_msg = f"FFmpeg执行失败，返回码: {process.returncode}\n错误信息: {process.stderr[:200]}..."
-                logger.error(error_msg)
-                self.finished.emit(False, error_msg, duration, "")
-                return
-            
-            # 检查输出文件是否存在
-            if not os.path.exists(self.output_file):
-                error_msg = "输出文件未生成"
-                logger.error(error_msg)
-                self.finished.emit(False, error_msg, duration, "")
-                return
-            
-            # 获取输出文件信息
-            output_info = self.get_video_info(self.output_file)
-            if output_info:
-                # 计算压缩率
-                compression_ratio = (1 - output_info['file_size'] / input_info['file_size']) * 100
-                output_size = output_info['human_size']
-                logger.info(f"转换成功完成！耗时: {duration:.2f} 秒")
-                logger.info(f"输出文件信息: {output_size}, 压缩率: {compression_ratio:.2f}%")
-                self.finished.emit(True, "转换成功", duration, output_size)
-            else:
-                self.finished.emit(True, "转换成功", duration, "未知")
-                
-        except Exception as e:
-            error_msg = f"转换过程中出错: {str(e)}"
-            logger.error(error_msg)
-            self.finished.emit(False, error_msg, 0, "")
-    
-    def get_video_info(self, file_path):
-        """获取视频文件信息"""
-        try:
-            # 获取文件大小
-            file_size = os.path.getsize(file_path)
-            return {
-                "file_size": file_size,
-                "human_size": f"{file_size/1024/1024:.2f} MB"
-            }
-        except Exception as e:
-            logger.error(f"获取视频信息失败: {str(e)}")
-            return None
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi', '.wmv', '.flv', '.webm')
+
+def is_video_file(name):
+    return name.lower().endswith(VIDEO_EXTENSIONS) and not is_generated_output(name)
 
 class VideoConverterApp(QMainWindow):
     """视频转换工具主窗口"""
     
     def __init__(self):
         super().__init__()
-        self.input_file = ""
-        self.output_file = ""
-        self.conversion_thread = None
+        self.ffmpeg_path = "ffmpeg"
+        # 后台检查FFmpeg的结果（是否可以转换），返回之前不能开始转换
+        self.ffmpeg_ready = None
+        # 编码参数的副本，由控件的信号更新；生成命令在后台线程进行，不能直接读取控件
+        self.encode_settings = {"crf": 28, "preset": "medium", "audio_bitrate": "128k"}
+        self.queue_model = ConversionQueueModel(self)
+        self.queue = ConversionQueue(self.queue_model, self.build_command, max_concurrent=2, parent=self)
+        self.queue.job_finished.connect(self.job_finished)
+        self.queue.queue_finished.connect(self.queue_finished)
         self.init_ui()
-        self.check_ffmpeg_installed()
+        self.setAcceptDrops(True)
+        # 窗口先显示，FFmpeg在后台检查
+        self.start_ffmpeg_check()
     
     def init_ui(self):
         """初始化用户界面"""
         # 设置窗口属性
         self.setWindowTitle("视频H264转H265转换工具")
-        self.setGeometry(300, 300, 600, 450)
+        self.setGeometry(300, 300, 800, 650)
         
         # 创建主部件和布局
         central_widget = QWidget()
@@ -156,34 +74,31 @@ class VideoConverterApp(QMainWindow):
         title_label.setAlignment(Qt.AlignCenter)
         main_layout.addWidget(title_label)
         
-        # 文件选择区域
-        file_group = QGroupBox("文件选择")
-        file_layout = QVBoxLayout()
+        # 转换队列区域（可直接拖入文件或文件夹）
+        queue_group = QGroupBox("转换队列（可拖入文件或文件夹）")
+        queue_layout = QVBoxLayout()
         
-        # 输入文件选择
-        input_layout = QHBoxLayout()
-        self.input_label = QLabel("未选择文件")
-        self.input_label.setFixedHeight(30)
-        self.input_label.setStyleSheet("border: 1px solid #ccc; padding: 5px;")
-        input_button = QPushButton("选择输入文件")
-        input_button.clicked.connect(self.select_input_file)
-        input_layout.addWidget(self.input_label, 1)
-        input_layout.addWidget(input_button)
+        self.queue_view = ConversionQueueView(self.queue_model)
+        queue_layout.addWidget(self.queue_view)
         
-        # 输出文件选择
-        output_layout = QHBoxLayout()
-        self.output_label = QLabel("自动生成")
-        self.output_label.setFixedHeight(30)
-        self.output_label.setStyleSheet("border: 1px solid #ccc; padding: 5px;")
-        output_button = QPushButton("选择输出文件")
-        output_button.clicked.connect(self.select_output_file)
-        output_layout.addWidget(self.output_label, 1)
-        output_layout.addWidget(output_button)
-        
-        file_layout.addLayout(input_layout)
-        file_layout.addLayout(output_layout)
-        file_group.setLayout(file_layout)
-        main_layout.addWidget(file_group)
+        queue_buttons = QHBoxLayout()
+        add_button = QPushButton("添加文件")
+        add_button.clicked.connect(self.select_input_files)
+        up_button = QPushButton("上移")
+        up_button.clicked.connect(lambda: self.queue_view.move_selected(-1))
+        down_button = QPushButton("下移")
+        down_button.clicked.connect(lambda: self.queue_view.move_selected(1))
+        top_button = QPushButton("置顶")
+        top_button.clicked.connect(lambda: self.queue_view.move_selected(None))
+        remove_button = QPushButton("移除")
+        remove_button.clicked.connect(self.remove_selected)
+        retry_button = QPushButton("重试")
+        retry_button.clicked.connect(self.retry_selected)
+        for button in (add_button, up_button, down_button, top_button, remove_button, retry_button):
+            queue_buttons.addWidget(button)
+        queue_layout.addLayout(queue_buttons)
+        queue_group.setLayout(queue_layout)
+        main_layout.addWidget(queue_group, 1)
         
         # 参数设置区域
         params_group = QGroupBox("参数设置")
@@ -208,6 +123,7 @@ class VideoConverterApp(QMainWindow):
         self.preset_combo = QComboBox()
         self.preset_combo.addItems(["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"])
         self.preset_combo.setCurrentText("medium")
+        self.preset_combo.currentTextChanged.connect(lambda text: self.encode_settings.update(preset=text))
         preset_layout.addWidget(preset_label)
         preset_layout.addWidget(self.preset_combo, 1)
         
@@ -217,21 +133,28 @@ class VideoConverterApp(QMainWindow):
         self.audio_combo = QComboBox()
         self.audio_combo.addItems(["64k", "96k", "128k", "192k", "256k", "320k"])
         self.audio_combo.setCurrentText("128k")
+        self.audio_combo.currentTextChanged.connect(lambda text: self.encode_settings.update(audio_bitrate=text))
         audio_layout.addWidget(audio_label)
         audio_layout.addWidget(self.audio_combo, 1)
         
+        # 并发设置
+        concurrent_layout = QHBoxLayout()
+        concurrent_label = QLabel("同时转换数:")
+        self.concurrent_spin = QSpinBox()
+        self.concurrent_spin.setRange(1, max(1, os.cpu_count() or 1))
+        self.concurrent_spin.setValue(min(2, self.concurrent_spin.maximum()))
+        self.concurrent_spin.valueChanged.connect(self.queue.set_max_concurrent)
+        self.queue.set_max_concurrent(self.concurrent_spin.value())
+        concurrent_layout.addWidget(concurrent_label)
+        concurrent_layout.addWidget(self.concurrent_spin, 1)
+        
         params_layout.addLayout(crf_layout)
         params_layout.addLayout(preset_layout)
         params_layout.addLayout(audio_layout)
+        params_layout.addLayout(concurrent_layout)
         params_group.setLayout(params_layout)
         main_layout.addWidget(params_group)
         
-        # 进度条区域
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setValue(0)
-        self.progress_bar.setFixedHeight(25)
-        main_layout.addWidget(self.progress_bar)
-        
         # 状态标签
         self.status_label = QLabel("准备就绪")
         self.status_label.setAlignment(Qt.AlignCenter)
@@ -244,59 +167,100 @@ class VideoConverterApp(QMainWindow):
         self.convert_button.clicked.connect(self.start_conversion)
         self.convert_button.setStyleSheet("background-color: #4CAF50; color: white; font-weight: bold;")
         
-        cancel_button = QPushButton("取消")
+        self.pause_button = QPushButton("暂停/继续")
+        self.pause_button.setFixedHeight(40)
+        self.pause_button.setEnabled(PAUSE_SUPPORTED)
+        self.pause_button.clicked.connect(self.toggle_pause_selected)
+        
+        cancel_button = QPushButton("取消选中")
         cancel_button.setFixedHeight(40)
         cancel_button.clicked.connect(self.cancel_conversion)
         
+        cancel_all_button = QPushButton("全部取消")
+        cancel_all_button.setFixedHeight(40)
+        cancel_all_button.clicked.connect(self.cancel_all)
+        
         buttons_layout.addWidget(self.convert_button, 2)
+        buttons_layout.addWidget(self.pause_button, 1)
         buttons_layout.addWidget(cancel_button, 1)
+        buttons_layout.addWidget(cancel_all_button, 1)
         main_layout.addLayout(buttons_layout)
     
     def update_crf_label(self):
         """更新CRF值显示"""
         self.crf_value_label.setText(str(self.crf_slider.value()))
+        self.encode_settings["crf"] = self.crf_slider.value()
     
-    def select_input_file(self):
-        """选择输入文件"""
-        file_path, _ = QFileDialog.getOpenFileName(
+    def select_input_files(self):
+        """选择输入文件（可多选）"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self, "选择视频文件", "", "视频文件 (*.mp4 *.mov *.mkv *.avi *.wmv *.flv *.webm)"
         )
-        if file_path:
-            self.input_file = file_path
-            self.input_label.setText(os.path.basename(file_path))
-            
-            # 自动生成输出文件名
-            base_name, ext = os.path.splitext(file_path)
-            self.output_file = f"{base_name}_h265{ext}"
-            self.output_label.setText(os.path.basename(self.output_file))
+        if file_paths:
+            self.add_files(file_paths)
     
-    def select_output_file(self):
-        """选择输出文件"""
-        if not self.input_file:
-            QMessageBox.warning(self, "警告", "请先选择输入文件")
-            return
-        
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "保存输出文件", self.output_file,
-            "MP4文件 (*.mp4);;所有文件 (*)"
-        )
-        if file_path:
-            self.output_file = file_path
-            self.output_label.setText(os.path.basename(file_path))
+    def add_files(self, paths):
+        """把文件或文件夹（递归查找视频文件）加入队列"""
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(iter_video_files(path, recursive=True, is_video=is_video_file))
+            elif os.path.isfile(path):
+                files.append(path)
+        added = self.queue_model.add_files(files)
+        logger.info(f"加入队列: {added} 个文件")
+        self.update_status()
+        if self.queue.running:
+            self.queue.start()
+    
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
     
-    def check_ffmpeg_installed(self):
-        """检查FFmpeg是否安装"""
-        try:
-            subprocess.run(["ffmpeg", "-version"], 
-                         stdout=subprocess.PIPE, 
-                         stderr=subprocess.PIPE, 
-                         timeout=5)
+    def dropEvent(self, event):
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        self.add_files(paths)
+        event.acceptProposedAction()
+    
+    def remove_selected(self):
+        """从队列中移除选中的任务（运行中的任务需要先取消）"""
+        self.queue_model.remove_rows(self.queue_view.selected_rows())
+        self.update_status()
+    
+    def retry_selected(self):
+        for job in self.queue_view.selected_jobs():
+            self.queue.requeue(job)
+        self.update_status()
+    
+    def start_ffmpeg_check(self):
+        """在后台线程检查FFmpeg，结果返回后更新状态"""
+        self.status_label.setText("正在检查FFmpeg...")
+        self.convert_button.setEnabled(False)
+        self.ffmpeg_check_thread = FfmpegCheckThread(check_ffmpeg_on_path, self)
+        self.ffmpeg_check_thread.checked.connect(self.ffmpeg_checked)
+        self.ffmpeg_check_thread.start()
+    
+    def ffmpeg_checked(self, result):
+        """保存后台检查的结果，之后开始转换时不再检查"""
+        self.ffmpeg_ready = self.show_ffmpeg_status(result, warn=True)
+        self.convert_button.setEnabled(not self.queue.running)
+    
+    def show_ffmpeg_status(self, result, warn=False):
+        """显示FFmpeg检查结果，warn为True时未找到FFmpeg会弹出安装提示"""
+        if result["path"]:
+            self.ffmpeg_path = result["path"]
+        capabilities = result.get("capabilities")
+        if capabilities is not None and not capabilities.has_x265:
+            self.status_label.setText("⚠️  当前FFmpeg不支持libx265编码")
+            self.status_label.setStyleSheet("color: red;")
+            return False
+        if result["available"]:
             self.status_label.setText("FFmpeg检查通过")
             self.status_label.setStyleSheet("color: green;")
             return True
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            self.status_label.setText("⚠️  未找到FFmpeg，请先安装")
-            self.status_label.setStyleSheet("color: red;")
+        self.status_label.setText("⚠️  未找到FFmpeg，请先安装")
+        self.status_label.setStyleSheet("color: red;")
+        if warn:
             # 显示警告但不阻止应用继续运行
             QMessageBox.warning(
                 self, "FFmpeg未找到", 
@@ -305,89 +269,109 @@ class VideoConverterApp(QMainWindow):
                 "Windows用户: 从官网下载并安装\n" \
                 "Linux用户: sudo apt-get install ffmpeg"
             )
-            return False
+        return False
+    
+    def build_command(self, job):
+        """按当前参数生成任务的ffmpeg命令（任务开始时在后台线程调用）"""
+        # 检查输出目录
+        output_dir = os.path.dirname(job.output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        
+        settings = dict(self.encode_settings)
+        crf = settings["crf"]
+        preset = settings["preset"]
+        audio_codec = "aac"  # 固定使用AAC编码器
+        audio_bitrate = settings["audio_bitrate"]
+        
+        cmd = [self.ffmpeg_path, "-i", job.input_file]
+        cmd.extend(["-c:v", "libx265", "-crf", str(crf), "-preset", preset, "-tag:v", "hvc1"])
+        cmd.extend(["-c:a", audio_codec, "-b:a", audio_bitrate])
+        cmd.extend(["-y", job.output_file])
+        logger.info(f"使用参数: CRF={crf}, 预设={preset}, 音频={audio_codec}@{audio_bitrate}")
+        return cmd
     
     def start_conversion(self):
-        """开始转换"""
-        # 检查输入文件
-        if not self.input_file or not os.path.exists(self.input_file):
-            QMessageBox.warning(self, "警告", "请选择有效的输入文件")
+        """开始处理队列"""
+        if self.queue_model.next_queued() is None:
+            QMessageBox.warning(self, "警告", "队列中没有等待转换的文件，请先添加文件")
             return
         
-        # 检查FFmpeg
-        if not self.check_ffmpeg_installed():
+        # 使用后台检查的结果（检查完成前开始按钮不可用）
+        if self.ffmpeg_ready is None:
+            return
+        if not self.ffmpeg_ready:
             QMessageBox.critical(self, "无法开始转换", "FFmpeg未安装，无法进行视频转换。\n请按照提示安装FFmpeg后再重试。")
             return
         
-        # 检查输出目录
-        output_dir = os.path.dirname(self.output_file)
-        if output_dir and not os.path.exists(output_dir):
-            try:
-                os.makedirs(output_dir)
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"创建输出目录失败: {str(e)}")
-                return
-        
-        # 准备转换参数
-        crf = self.crf_slider.value()
-        preset = self.preset_combo.currentText()
-        audio_codec = "aac"  # 固定使用AAC编码器
-        audio_bitrate = self.audio_combo.currentText()
-        threads = 0  # 使用所有可用线程
-        
-        # 禁用按钮
         self.convert_button.setEnabled(False)
-        self.progress_bar.setValue(0)
-        self.status_label.setText("正在转换中...")
-        
-        # 创建并启动转换线程
-        self.conversion_thread = ConversionThread(
-            self.input_file, self.output_file, crf, preset, audio_codec, audio_bitrate, threads
-        )
-        self.conversion_thread.finished.connect(self.conversion_finished)
-        self.conversion_thread.start()
+        self.status_label.setStyleSheet("")
+        self.queue.start()
+        self.update_status()
+    
+    def toggle_pause_selected(self):
+        """暂停或继续选中的任务"""
+        for job in self.queue_view.selected_jobs():
+            if job.status == JOB_RUNNING:
+                self.queue.pause(job)
+            elif job.status == JOB_PAUSED:
+                self.queue.resume(job)
+        self.update_status()
     
     def cancel_conversion(self):
-        """取消转换"""
-        if self.conversion_thread and self.conversion_thread.isRunning():
-            # 这里可以尝试终止ffmpeg进程，但通常不建议强制终止
-            # 可以提示用户等待完成，或者实现更优雅的终止方式
-            QMessageBox.information(self, "提示", "转换已提交，请等待完成")
-        else:
-            # 如果不在转换中，重置界面
-            self.reset_ui()
+        """取消选中的任务（运行中的任务会终止ffmpeg进程并删除未完成的输出）"""
+        for job in self.queue_view.selected_jobs():
+            self.queue.cancel(job)
+        self.update_status()
     
-    def conversion_finished(self, success, message, duration, output_size):
-        """转换完成后的处理"""
-        # 更新进度条和状态
-        self.progress_bar.setValue(100)
-        
-        if success:
-            self.status_label.setText(f"转换成功！耗时: {duration:.2f}秒, 输出大小: {output_size}")
-            self.status_label.setStyleSheet("color: green;")
-            QMessageBox.information(
-                self, "成功", 
-                f"转换成功完成！\n" \
-                f"耗时: {duration:.2f}秒\n" \
-                f"输出文件: {os.path.basename(self.output_file)}\n" \
-                f"输出大小: {output_size}"
-            )
-        else:
-            self.status_label.setText(f"转换失败: {message}")
-            self.status_label.setStyleSheet("color: red;")
-            QMessageBox.critical(self, "失败", message)
-        
-        # 启用按钮
+    def cancel_all(self):
+        if not self.queue.active_jobs() and self.queue_model.next_queued() is None:
+            return
+        confirm = QMessageBox.question(self, "确认取消", "确定要取消队列中所有未完成的转换吗？",
+                                       QMessageBox.Yes | QMessageBox.No)
+        if confirm == QMessageBox.Yes:
+            self.queue.cancel_all()
+            self.update_status()
+    
+    def job_finished(self, job):
+        """单个任务结束"""
+        if job.status == JOB_FAILED:
+            logger.error(f"转换失败: {job.input_file}: {job.message}")
+        self.update_status()
+    
+    def queue_finished(self):
+        """队列中没有可开始的任务且没有进行中的任务"""
         self.convert_button.setEnabled(True)
+        counts = self.queue_model.counts()
+        self.update_status()
+        if counts[JOB_FAILED]:
+            self.status_label.setStyleSheet("color: red;")
+        elif counts[JOB_DONE]:
+            self.status_label.setStyleSheet("color: green;")
     
-    def reset_ui(self):
-        """重置界面状态"""
-        self.status_label.setText("准备就绪")
-        self.status_label.setStyleSheet("")
-        self.progress_bar.setValue(0)
+    def update_status(self):
+        """显示队列汇总"""
+        counts = self.queue_model.counts()
+        running = counts[JOB_RUNNING] + counts[JOB_PAUSED]
+        self.status_label.setText(
+            f"共 {len(self.queue_model.jobs())} 个文件：转换中 {running}，完成 {counts[JOB_DONE]}，"
+            f"失败 {counts[JOB_FAILED]}，已取消 {counts[JOB_CANCELLED]}"
+        )
+    
+    def closeEvent(self, event):
+        """关闭窗口时终止进行中的转换，避免留下孤儿ffmpeg进程"""
+        if self.queue.active_jobs():
+            confirm = QMessageBox.question(self, "确认退出", "还有正在进行的转换，退出将取消它们。确定退出吗？",
+                                           QMessageBox.Yes | QMessageBox.No)
+            if confirm != QMessageBox.Yes:
+                event.ignore()
+                return
+        self.queue.shutdown()
+        event.accept()
 
 def main():
     """主函数"""
+    setup_logging("video_conversion_gui.log")
     try:
         # 确保中文显示正常
         font = QFont("SimHei")
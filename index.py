@@ -8,21 +8,62 @@
 import os
 import sys
 import argparse
+import contextlib
+import json
 import logging
+import re
+import shutil
+import stat
 import subprocess
 import time
+import uuid
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from mp4_layout import MOOV_MODES, MP4_EXTENSIONS, MOOV_TOO_SMALL_ERROR, movflags_args
+from process_priority import IO_CLASSES, ProcessPriority, CoreAllocator, parse_cpu_list, available_cpus
+from video_scanner import iter_video_files, iter_probed
+from library_catalog import LibraryCatalog, STATUSES, STATUS_NEW, STATUS_PENDING, STATUS_CONVERTED, STATUS_FAILED
+from job_state import JobState
+from graceful_shutdown import ShutdownController
+from ffmpeg_capabilities import get_capabilities, probe_version
+from deadline_planner import DeadlinePlanner, parse_deadline, work_units, measure_encode_rate
+from deadline_planner import default_history_file as default_speed_history_file
+from memory_admission import MemoryBudget, MemoryHistory, default_history_file, read_peak_rss
+from result_cache import ResultCache
+from content_hash import file_hash
+from preflight import preflight, output_extension
+from logging_setup import setup_logging, parse_levels, RateLimitedLog
+from small_clips import SMALL_CLIP_SECONDS, is_small_clip, build_group_command
+from segment_checkpoint import (SEGMENT_SECONDS, DURATION_TOLERANCE, SegmentCheckpoint, checkpoint_dir_for,
+                                probe_video_packets, probe_frame_count, plan_segments, segment_file)
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("video_conversion.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# 支持的视频文件扩展名
+VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.mov', '.avi', '.wmv', '.flv', '.webm'}
+
+# 按内存预算调度时，从多少个等待的文件中挑选放得下的
+PACKING_WINDOW = 8
+
+# libx265的编码预设，越慢压缩率越高
+FFMPEG_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+
+def parse_size(value):
+    """
+    解析带单位的大小字符串，如 "500M"、"1.5G"、"1048576"
+    
+    Returns:
+        int: 字节数
+    """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
 def print_banner():
     """
     打印程序横幅
@@ -37,23 +78,42 @@ def print_banner():
 
 def check_ffmpeg_installed():
     """
-    检查系统是否安装了FFmpeg
+    检查系统是否安装了FFmpeg（功能按二进制文件缓存在磁盘上，再次运行不会启动额外的进程）
+    
+    首次探测（冷启动、网络文件系统上的二进制文件）超时时改为只检查 -version，
+    此时返回的功能partial为True，编码器未知。
     
     Returns:
-        bool: 如果安装了FFmpeg返回True，否则返回False
+        FfmpegCapabilities: 安装了FFmpeg时返回其功能，否则返回None
     """
+    ffmpeg_path = shutil.which("ffmpeg")
     try:
-        # 直接运行命令并捕获输出
-        subprocess.run(["ffmpeg", "-version"], 
-                      stdout=subprocess.PIPE, 
-                      stderr=subprocess.PIPE, 
-                      timeout=5)  # 添加超时，避免命令卡住
-        logger.info("FFmpeg已正确安装")
-        print("✅ FFmpeg检查通过")
-        return True
-    except (FileNotFoundError, subprocess.TimeoutExpired):
+        capabilities = get_capabilities(ffmpeg_path, timeout=5)  # 添加超时，避免命令卡住
+    except subprocess.TimeoutExpired:
+        logger.warning("FFmpeg功能探测超时，改为只检查版本")
+        try:
+            capabilities = probe_version(ffmpeg_path, timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            capabilities = None
+    except OSError:
+        capabilities = None
+    if capabilities is None:
         logger.warning("FFmpeg未找到或命令超时")
-        return False
+        return None
+    logger.info(f"FFmpeg已正确安装: {capabilities.describe()}")
+    print("✅ FFmpeg检查通过")
+    return capabilities
+
+def parse_frame_rate(value):
+    """
+    解析ffprobe的帧率字符串（如"30000/1001"），无法解析时返回None
+    """
+    try:
+        numerator, _, denominator = (value or "").partition("/")
+        rate = float(numerator) / float(denominator or 1)
+        return rate if rate > 0 else None
+    except (ValueError, ZeroDivisionError):
+        return None
 
 def get_video_info(input_file):
     """
@@ -71,155 +131,793 @@ def get_video_info(input_file):
         
         # 尝试使用ffprobe获取详细信息
         try:
-            result = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0", 
-                                    "-show_entries", "stream=codec_name,width,height", 
-                                    "-of", "json", input_file],
+            result = subprocess.run(video_info_command(input_file),
                                   stdout=subprocess.PIPE,
                                   stderr=subprocess.PIPE,
                                   text=True)
             
             if result.returncode == 0:
-                import json
-                data = json.loads(result.stdout)
-                if "streams" in data and len(data["streams"]) > 0:
-                    stream = data["streams"][0]
-                    return {
-                        "codec": stream.get("codec_name", "未知"),
-                        "width": stream.get("width", 0),
-                        "height": stream.get("height", 0),
-                        "file_size": file_size,
-                        "human_size": f"{file_size/1024/1024:.2f} MB"
-                    }
+                info = parse_video_info(result.stdout, file_size)
+                if info:
+                    return info
         except Exception:
             logger.warning("ffprobe不可用，使用基本文件信息")
         
         # 返回基本信息
-        return {
-            "codec": "未知",
-            "width": 0,
-            "height": 0,
-            "file_size": file_size,
-            "human_size": f"{file_size/1024/1024:.2f} MB"
-        }
+        return basic_video_info(file_size)
     except Exception as e:
         logger.error(f"获取视频信息失败: {str(e)}")
         return None
 
-def convert_h264_to_h265(input_file, output_file, 
-                       crf=28, 
-                       preset="medium",
-                       audio_codec="aac",
-                       audio_bitrate="128k",
-                       threads=0):
+def video_info_command(input_file):
+    """get_video_info使用的ffprobe命令"""
+    return ["ffprobe", "-v", "error",
+            "-show_entries", "stream=codec_type,codec_name,width,height,r_frame_rate,bit_rate:format=duration",
+            "-of", "json", input_file]
+
+def parse_stream_bitrate(value):
+    """ffprobe的bit_rate字段，未知（"N/A"或缺少）时返回None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_video_info(output, file_size):
     """
-    使用ffmpeg将H264视频转换为H265
+    解析video_info_command()的JSON输出
+    
+    Returns:
+        dict: 视频信息，没有视频流时返回None
+    """
+    data = json.loads(output)
+    streams = data.get("streams", [])
+    video_streams = [s for s in streams if s.get("codec_type") == "video"]
+    if not video_streams:
+        return None
+    stream = video_streams[0]
+    audio_streams = [s for s in streams if s.get("codec_type") == "audio"]
+    return {
+        "codec": stream.get("codec_name", "未知"),
+        "width": stream.get("width", 0),
+        "height": stream.get("height", 0),
+        "fps": parse_frame_rate(stream.get("r_frame_rate")),
+        "duration": float(data.get("format", {}).get("duration", 0)) or None,
+        "has_audio": bool(audio_streams),
+        "audio_codec": audio_streams[0].get("codec_name") if audio_streams else None,
+        "audio_bitrate": parse_stream_bitrate(audio_streams[0].get("bit_rate")) if audio_streams else None,
+        "file_size": file_size,
+        "human_size": f"{file_size/1024/1024:.2f} MB"
+    }
+
+def basic_video_info(file_size):
+    """ffprobe不可用时的基本文件信息"""
+    return {
+        "codec": "未知",
+        "width": 0,
+        "height": 0,
+        "fps": None,
+        "duration": None,
+        "has_audio": True,
+        "audio_codec": None,
+        "audio_bitrate": None,
+        "file_size": file_size,
+        "human_size": f"{file_size/1024/1024:.2f} MB"
+    }
+
+def estimate_output_size(input_size, crf=28):
+    """
+    根据输入文件大小和CRF粗略预测H.265输出文件大小
+    
+    经验值：CRF 28时输出约为H.264源文件的一半，CRF每降低6码率约翻倍
+    
+    Args:
+        input_size: 输入文件大小（字节）
+        crf: 恒定速率因子
+    
+    Returns:
+        int: 预测的输出文件大小（字节）
+    """
+    ratio = 0.5 * 2 ** ((28 - crf) / 6.0)
+    ratio = min(max(ratio, 0.1), 1.5)
+    return int(input_size * ratio)
+
+def check_free_space(directory, required_bytes):
+    """
+    检查目录所在磁盘是否有足够的剩余空间
+    
+    Args:
+        directory: 要检查的目录
+        required_bytes: 需要的字节数
+    
+    Returns:
+        tuple: (是否足够, 剩余字节数)
+    """
+    free_bytes = shutil.disk_usage(directory).free
+    return free_bytes >= required_bytes, free_bytes
+
+def make_temp_output_path(output_file, work_dir):
+    """
+    生成临时输出文件路径：隐藏文件名并带有.part标记，保留扩展名以便ffmpeg识别容器格式
+    
+    每次调用生成不同的名称，同一进程中输出文件名相同的并发转换不会写入同一个临时文件。
+    
+    Args:
+        output_file: 最终输出文件路径
+        work_dir: 临时文件所在目录
+    
+    Returns:
+        str: 临时文件路径
+    """
+    base_name, ext = os.path.splitext(os.path.basename(output_file))
+    return os.path.join(work_dir, f".{base_name}.{uuid.uuid4().hex[:12]}.part{ext}")
+
+def is_temp_output(file_name):
+    """
+    判断文件名是否为未完成的临时输出文件
+    """
+    name = os.path.basename(file_name)
+    return name.startswith(".") and ".part" in name
+
+def is_video_file(file_name):
+    """
+    判断文件名是否为支持的视频文件（排除未完成的临时输出文件）
+    """
+    _, ext = os.path.splitext(file_name)
+    return ext.lower() in VIDEO_EXTENSIONS and not is_temp_output(file_name)
+
+def make_output_path(input_file, reserved=None):
+    """
+    为输入文件生成不会覆盖已有文件的输出路径，如 video.mp4 -> video_h265.mp4
+    
+    输入的容器不能封装H.265时（如.avi、.flv、.wmv、.webm）输出改为.mp4，所以同一目录中的
+    clip.avi和clip.mp4会得到相同的名称；并发转换时需要传入进行中的转换已占用的输出路径。
     
     Args:
         input_file: 输入文件路径
-        output_file: 输出文件路径
-        crf: 恒定速率因子，范围0-51，值越小质量越高，H.265推荐28-31
-        preset: 编码预设(slow, medium, fast等)，越慢压缩率越高
-        audio_codec: 音频编码器
-        audio_bitrate: 音频比特率
-        threads: 使用的线程数，0表示使用所有可用线程
+        reserved: 进行中（或等待开始）的转换占用的输出路径集合，生成的路径不会与其重复
     
     Returns:
-        bool: 如果转换成功返回True，否则返回False
+        str: 输出文件路径
     """
-    logger.info(f"开始转换函数处理，输入文件: {input_file}, 输出文件: {output_file}")
+    base_name, ext = os.path.splitext(input_file)
+    ext = output_extension(ext)
+    output_file = f"{base_name}_h265{ext}"
     
-    # 检查输入文件是否存在
-    if not os.path.exists(input_file):
-        logger.error(f"输入文件不存在: {input_file}")
-        print(f"❌ 错误: 输入文件不存在: {input_file}")
-        return False
+    # 避免覆盖已存在的文件
+    counter = 1
+    while os.path.exists(output_file) or (reserved and output_file in reserved):
+        output_file = f"{base_name}_h265_{counter}{ext}"
+        counter += 1
+    return output_file
+
+def is_generated_output(file_name):
+    """
+    文件名是否为make_output_path()生成的输出名称（*_h265或*_h265_N）
+    """
+    base_name = os.path.splitext(os.path.basename(file_name))[0]
+    return re.search(r"_h265(_\d+)?$", base_name) is not None
+
+def move_into_place(temp_file, output_file):
+    """
+    将临时文件原子地移动到最终位置
     
-    logger.info(f"输入文件存在，大小: {os.path.getsize(input_file)/1024/1024:.2f} MB")
+    同一文件系统内直接rename；跨文件系统时先复制到目标目录下的临时文件，再rename，
+    保证最终路径上要么没有文件，要么是完整的文件。
     
-    # 检查输出目录是否存在，如果不存在则创建
-    output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        try:
-            os.makedirs(output_dir)
-            logger.info(f"创建输出目录: {output_dir}")
-        except Exception as e:
-            logger.error(f"创建输出目录失败: {str(e)}")
-            print(f"❌ 错误: 创建输出目录失败: {str(e)}")
-            return False
+    Args:
+        temp_file: 已完成的临时文件路径
+        output_file: 最终输出文件路径
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    if os.stat(os.path.dirname(os.path.abspath(temp_file))).st_dev == os.stat(output_dir).st_dev:
+        os.replace(temp_file, output_file)
+        return
     
-    # 获取输入文件信息
-    input_info = get_video_info(input_file)
-    if input_info:
-        logger.info(f"输入文件信息: {input_info['codec']}, {input_info['width']}x{input_info['height']}, {input_info['human_size']}")
+    staging_file = make_temp_output_path(output_file, output_dir)
+    try:
+        shutil.copyfile(temp_file, staging_file)
+        with open(staging_file, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(staging_file, output_file)
+    except Exception:
+        if os.path.exists(staging_file):
+            os.remove(staging_file)
+        raise
+    os.remove(temp_file)
+
+def ffmpeg_log_name(cmd, pid):
+    """FFmpeg输出日志中标识进程的名称：输入文件名和进程号"""
+    source = cmd[cmd.index("-i") + 1] if "-i" in cmd[:-1] else "?"
+    return f"{os.path.basename(source) or source} pid={pid}"
+
+def run_ffmpeg(cmd, priority=None, cancel_event=None, stderr_lines=200, progress_callback=None, stats=None):
+    """
+    运行ffmpeg并等待结束，支持中途取消
     
-    # 构建ffmpeg命令
-    cmd = ["ffmpeg", "-i", input_file]
+    ffmpeg在独立的进程组中运行，终端的Ctrl-C不会直接打断它（由调用方决定是等待完成还是取消）；
+    cancel_event被设置时终止整个进程组。
     
-    # 添加视频参数
-    cmd.extend(["-c:v", "libx265", "-crf", str(crf), "-preset", preset, "-tag:v", "hvc1"])
+    Args:
+        cmd: ffmpeg命令
+        priority: ProcessPriority，应用到子进程的优先级设置
+        cancel_event: threading.Event，设置后终止ffmpeg
+        stderr_lines: 保留的stderr末尾行数
+        progress_callback: 可选的回调，参数为已编码到的位置（秒），在读取stderr的线程中调用
+        stats: 可选的dict，写入ffmpeg的峰值内存 stats["peak_rss"]（字节，仅Linux），
+            并把ffmpeg的运行时间累加到 stats["encode_seconds"]
+    
+    Returns:
+        tuple: (返回码, stderr末尾内容, 是否被取消)
+    """
+    started = time.monotonic()
+    process = subprocess.Popen(cmd,
+                               stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE,
+                               text=True,
+                               errors="replace",
+                               start_new_session=True)
+    if priority and not priority.is_empty():
+        priority.apply(process.pid)
+    
+    # 后台线程持续读取stderr，避免管道写满阻塞ffmpeg
+    tail = deque(maxlen=stderr_lines)
+    output_log = RateLimitedLog(ffmpeg_log_name(cmd, process.pid))
+    
+    def read_stderr():
+        for line in process.stderr:
+            tail.append(line)
+            output_log.log(line)
+            if progress_callback is not None and "time=" in line:
+                position = parse_ffmpeg_time(line.split("time=", 1)[1])
+                if position is not None:
+                    progress_callback(position)
+    
+    reader = threading.Thread(target=read_stderr, daemon=True)
+    reader.start()
+    
+    cancelled = False
+    try:
+        while True:
+            try:
+                process.wait(timeout=0.2)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if stats is not None:
+                peak_rss = read_peak_rss(process.pid)
+                if peak_rss:
+                    stats["peak_rss"] = max(peak_rss, stats.get("peak_rss", 0))
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                terminate_process_group(process)
+                break
+    except BaseException:
+        terminate_process_group(process)
+        raise
+    finally:
+        reader.join(timeout=5)
+        output_log.flush()
+        if stats is not None:
+            stats["encode_seconds"] = stats.get("encode_seconds", 0) + time.monotonic() - started
+    return process.returncode, "".join(tail), cancelled
+
+def terminate_process_group(process, timeout=5):
+    """
+    终止进程所在的整个进程组：先发送SIGTERM，超时后发送SIGKILL
+    """
+    if process.poll() is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.warning(f"ffmpeg未在 {timeout} 秒内退出，强制结束")
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+def build_convert_command(input_file, temp_file, crf=28, preset="medium", audio_codec="aac",
+                          audio_bitrate="128k", threads=0, moov_mode="reserve", priority=None,
+                          input_info=None, ffmpeg="ffmpeg"):
+    """
+    构建H264转H265的ffmpeg命令（命令行、异步接口和执行器共用）
+    
+    Args:
+        input_file: 输入文件路径
+        temp_file: ffmpeg写入的临时输出文件，扩展名决定封装格式
+        input_info: get_video_info()的结果，用于估算MP4的moov预留空间
+        ffmpeg: ffmpeg可执行文件
+        其余参数同convert_h264_to_h265
+    
+    Returns:
+        list: ffmpeg命令
+    """
+    cmd = [ffmpeg, "-i", input_file]
+    
+    # 添加视频参数（hvc1标签只用于MP4/MOV，提高QuickTime兼容性）
+    cmd.extend(["-c:v", "libx265", "-crf", str(crf), "-preset", preset])
+    if os.path.splitext(temp_file)[1].lower() in MP4_EXTENSIONS:
+        cmd.extend(["-tag:v", "hvc1"])
     
     # 添加线程参数
     if threads > 0:
         cmd.extend(["-threads", str(threads)])
+    elif priority and priority.x265_params():
+        cmd.extend(["-x265-params", ":".join(priority.x265_params())])
     
     # 添加音频参数
     cmd.extend(["-c:a", audio_codec, "-b:a", audio_bitrate])
     
-    # 简化处理，不使用ffprobe检查字幕流
-    logger.info("跳过字幕流检查，简化处理")
+    # MP4/MOV的moov布局，避免faststart在结束时重写整个文件
+    if os.path.splitext(temp_file)[1].lower() in MP4_EXTENSIONS:
+        if input_info:
+            cmd.extend(movflags_args(moov_mode, input_info['duration'], input_info['fps'], input_info['has_audio']))
+        else:
+            cmd.extend(movflags_args(moov_mode))
     
     # 添加输出文件和覆盖参数
-    cmd.extend(["-y", output_file])
+    cmd.extend(["-y", temp_file])
+    return cmd
+
+def build_segment_command(input_file, segment_output, seek, frames, crf=28, preset="medium",
+                          threads=0, priority=None, ffmpeg="ffmpeg"):
+    """
+    构建分段编码中一个视频片段的ffmpeg命令（只编码视频，音频在拼接时编码）
+    
+    Args:
+        input_file: 输入文件路径
+        segment_output: 片段输出路径（MP4）
+        seek: 片段开头的位置（秒），None表示从头开始
+        frames: 片段的帧数（输入的数据包数）
+        其余参数同convert_h264_to_h265
+    
+    Returns:
+        list: ffmpeg命令
+    """
+    cmd = [ffmpeg]
+    if seek is not None:
+        cmd.extend(["-ss", f"{seek:.6f}"])
+    # MP4默认按恒定帧率输出，可变帧率的输入会被补帧或丢帧，-frames:v也就不再对应输入的数据包数；
+    # passthrough保留每一帧原来的时间戳
+    cmd.extend(["-i", input_file, "-map", "0:v:0", "-fps_mode", "passthrough", "-frames:v", str(frames),
+                "-an", "-sn", "-c:v", "libx265", "-crf", str(crf), "-preset", preset])
+    if threads > 0:
+        cmd.extend(["-threads", str(threads)])
+    elif priority and priority.x265_params():
+        cmd.extend(["-x265-params", ":".join(priority.x265_params())])
+    cmd.extend(["-f", "mp4", "-y", segment_output])
+    return cmd
+
+def build_concat_command(list_file, input_file, temp_file, audio_codec="aac", audio_bitrate="128k",
+                         moov_mode="reserve", input_info=None, ffmpeg="ffmpeg"):
+    """
+    构建拼接视频片段并编码音频的ffmpeg命令（视频无损复制，保留第一个视频流和第一个音频流）
+    
+    Returns:
+        list: ffmpeg命令
+    """
+    cmd = [ffmpeg, "-f", "concat", "-safe", "0", "-i", list_file, "-i", input_file,
+           "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy"]
+    is_mp4_output = os.path.splitext(temp_file)[1].lower() in MP4_EXTENSIONS
+    if is_mp4_output:
+        cmd.extend(["-tag:v", "hvc1"])
+    cmd.extend(["-c:a", audio_codec, "-b:a", audio_bitrate])
+    if is_mp4_output:
+        if input_info:
+            cmd.extend(movflags_args(moov_mode, input_info['duration'], input_info['fps'], input_info['has_audio']))
+        else:
+            cmd.extend(movflags_args(moov_mode))
+    cmd.extend(["-y", temp_file])
+    return cmd
+
+def encode_segmented(input_file, temp_file, checkpoint_dir, crf=28, preset="medium", audio_codec="aac",
+                     audio_bitrate="128k", threads=0, moov_mode="reserve", priority=None, input_info=None,
+                     cancel_event=None, progress_callback=None, stats=None, segment_seconds=SEGMENT_SECONDS):
+    """
+    分段编码：在关键帧处切分，逐段编码并记录到检查点目录，最后拼接为temp_file
+    
+    中断后再次调用时跳过已完成的片段。
+    
+    Args:
+        checkpoint_dir: 检查点目录
+        segment_seconds: 片段的目标时长（秒）
+        progress_callback: 可选的回调，参数为整个文件中已编码到的位置（秒）
+        其余参数同convert_h264_to_h265
+    
+    Returns:
+        tuple: 与run_ffmpeg相同的 (返回码, stderr, 是否被取消)；无法分段（如读不到关键帧）或拼接结果的
+            帧数、时长与输入不一致时返回None
+    """
+    identity = {
+        "content": file_hash(input_file),
+        "size": os.path.getsize(input_file),
+        "crf": crf,
+        "preset": preset,
+        "segment_seconds": segment_seconds,
+    }
+    checkpoint = SegmentCheckpoint(checkpoint_dir, identity)
+    if checkpoint.load():
+        done = checkpoint.completed()
+        logger.info(f"从检查点继续: 已完成 {len(done)}/{len(checkpoint.segments)} 个片段")
+        print(f"♻️  从检查点继续: 已完成 {len(done)}/{len(checkpoint.segments)} 个片段，只编码剩余的片段")
+    else:
+        start_time, packets = probe_video_packets(input_file)
+        if not packets:
+            return None
+        checkpoint.create(start_time, plan_segments(packets, segment_seconds))
+        logger.info(f"分段编码: {len(checkpoint.segments)} 个片段，检查点目录: {checkpoint_dir}")
+        print(f"🧩 分段编码: {len(checkpoint.segments)} 个片段，中断后再次运行会从已完成的片段继续")
+    
+    total_frames = sum(segment["frames"] for segment in checkpoint.segments)
+    encoded_frames = 0
+    offset = 0.0
+    for i, segment in enumerate(checkpoint.segments):
+        duration = checkpoint.segment_duration(i)
+        if checkpoint.is_done(i):
+            offset += duration or 0
+            continue
+        if cancel_event is not None and cancel_event.is_set():
+            return 1, "", True
+        
+        final_file = segment_file(checkpoint_dir, i)
+        part_file = f"{final_file}.part"
+        cmd = build_segment_command(input_file, part_file, checkpoint.seek_position(i), segment["frames"],
+                                    crf, preset, threads, priority)
+        logger.info(f"编码片段 {i + 1}/{len(checkpoint.segments)}: {' '.join(cmd)}")
+        on_progress = None
+        if progress_callback is not None:
+            on_progress = lambda position, offset=offset: progress_callback(offset + position)
+        segment_stats = {}
+        returncode, stderr, cancelled = run_ffmpeg(cmd, priority=priority, cancel_event=cancel_event,
+                                                   progress_callback=on_progress, stats=segment_stats)
+        if stats is not None:
+            if segment_stats.get("peak_rss"):
+                stats["peak_rss"] = max(stats.get("peak_rss", 0), segment_stats["peak_rss"])
+            stats["encode_seconds"] = stats.get("encode_seconds", 0) + segment_stats["encode_seconds"]
+        if cancelled or returncode != 0:
+            if os.path.exists(part_file):
+                os.remove(part_file)
+            return returncode, stderr, cancelled
+        # 编码完成后才改为正式的片段文件名，存在即表示已完成
+        os.replace(part_file, final_file)
+        offset += duration or 0
+        encoded_frames += segment["frames"]
+        if stats is not None:
+            # 从检查点继续时只编码了一部分，速度按实际编码的部分计算
+            stats["encoded_fraction"] = encoded_frames / total_frames if total_frames else 1.0
+    
+    list_file = checkpoint.write_concat_list()
+    cmd = build_concat_command(list_file, input_file, temp_file, audio_codec, audio_bitrate, moov_mode, input_info)
+    logger.info(f"拼接片段: {' '.join(cmd)}")
+    returncode, stderr, cancelled = run_ffmpeg(cmd, priority=priority, cancel_event=cancel_event)
+    if cancelled or returncode != 0:
+        return returncode, stderr, cancelled
+    
+    # 拼接结果的帧数和时长必须与输入一致，否则音画会逐渐错开
+    input_frames, input_duration = probe_frame_count(input_file)
+    output_frames, output_duration = probe_frame_count(temp_file)
+    if (output_frames is None or output_frames != total_frames or
+            (input_duration is not None and abs(output_duration - input_duration) > DURATION_TOLERANCE)):
+        logger.warning(f"分段拼接的结果与输入不一致（帧数 {output_frames}/{total_frames}，"
+                       f"时长 {output_duration}/{input_duration} 秒），丢弃检查点: {input_file}")
+        print(f"⚠️  分段拼接的帧数或时长与输入不一致，改为一次性编码")
+        checkpoint.remove()
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return None
+    return returncode, stderr, cancelled
+
+class ConversionError(Exception):
+    """准备或完成一次转换失败，消息可以直接显示给用户"""
+
+class PreparedConversion:
+    """
+    prepare_conversion()的结果：一次转换的输入信息、临时文件和ffmpeg命令
+
+    Attributes:
+        input_file/output_file: 输入和输出文件路径
+        work_dir: 临时文件所在目录
+        input_info: get_video_info()的结果，无法探测或使用缓存的结果时为None
+        input_size: 输入文件大小（字节）
+        probe_seconds: 探测输入文件信息的时间
+        warnings: 预检的警告
+        audio_codec: 预检后实际使用的音频编码器
+        temp_file: ffmpeg写入的临时文件
+        cmd: ffmpeg命令（一次性编码时使用）
+        cache_key: 结果缓存键，不使用缓存时为None
+        cached: 已使用缓存的结果时为取得方式（如"reflink"），此时没有temp_file和cmd
+        checkpoint_dir: 分段编码的检查点目录，一次性编码时为None
+    """
+
+    def __init__(self, input_file, output_file, params, result_cache=None):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.params = params
+        self.result_cache = result_cache
+        self.work_dir = None
+        self.input_info = None
+        self.input_size = None
+        self.probe_seconds = 0.0
+        self.warnings = []
+        self.audio_codec = params["audio_codec"]
+        self.temp_file = None
+        self.cmd = None
+        self.cache_key = None
+        self.cached = None
+        self.checkpoint_dir = None
+
+def prepare_conversion(input_file, output_file, crf=28, preset="medium", audio_codec="aac", audio_bitrate="128k",
+                       threads=0, scratch_dir=None, moov_mode="reserve", priority=None, result_cache=None,
+                       ffmpeg="ffmpeg"):
+    """
+    转换前的准备（命令行、执行器和异步接口共用）：检查输入、创建目录、查找结果缓存、探测输入、
+    预检（容器兼容性、剩余空间、目录是否可写、试解码开头几秒），生成临时文件路径和ffmpeg命令
+
+    只记录日志不打印，由调用方决定如何显示；会阻塞（探测和试解码），异步接口在线程中调用。
+
+    Args:
+        参数同convert_h264_to_h265
+        ffmpeg: ffmpeg可执行文件
+
+    Returns:
+        PreparedConversion: 准备好的转换；cached不为None时结果已从缓存取得
+
+    Raises:
+        ConversionError: 输入文件不存在、无法创建目录或预检失败
+    """
+    if not os.path.exists(input_file):
+        raise ConversionError(f"输入文件不存在: {input_file}")
+    params = {"crf": crf, "preset": preset, "audio_codec": audio_codec, "audio_bitrate": audio_bitrate,
+              "threads": threads, "moov_mode": moov_mode, "priority": priority}
+    prepared = PreparedConversion(input_file, output_file, params, result_cache)
+    prepared.input_size = os.path.getsize(input_file)
+    logger.info(f"输入文件存在，大小: {prepared.input_size/1024/1024:.2f} MB")
+    
+    output_dir = os.path.dirname(output_file)
+    prepared.work_dir = scratch_dir or output_dir or "."
+    for directory, name in ((output_dir, "输出目录"), (prepared.work_dir, "临时文件目录")):
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory, exist_ok=True)
+                logger.info(f"创建{name}: {directory}")
+            except OSError as e:
+                raise ConversionError(f"创建{name}失败: {str(e)}")
+    
+    # 相同内容、相同参数的输入已经转换过时直接使用缓存的结果
+    if result_cache is not None:
+        try:
+            prepared.cache_key = result_cache.key(input_file, output_file, {
+                "crf": crf, "preset": preset, "audio_codec": audio_codec,
+                "audio_bitrate": audio_bitrate, "moov_mode": moov_mode})
+        except OSError as e:
+            logger.warning(f"计算结果缓存键失败: {str(e)}")
+        if prepared.cache_key is not None:
+            prepared.cached = result_cache.fetch(prepared.cache_key, output_file)
+            if prepared.cached is not None:
+                return prepared
+    
+    started = time.monotonic()
+    input_info = prepared.input_info = get_video_info(input_file)
+    prepared.probe_seconds = time.monotonic() - started
+    if input_info:
+        prepared.input_size = input_info['file_size']
+        logger.info(f"输入文件信息: {input_info['codec']}, {input_info['width']}x{input_info['height']}, {input_info['human_size']}")
+    
+    # 开始编码前检查，避免转换数小时后才失败
+    required_bytes = int(estimate_output_size(prepared.input_size, crf) * 1.1)
+    check = preflight(input_file, output_file, input_info, prepared.work_dir, required_bytes, audio_codec,
+                      ffmpeg=ffmpeg)
+    prepared.warnings = check.warnings
+    for warning in check.warnings:
+        logger.warning(f"预检: {warning}")
+    if not check.ok:
+        raise ConversionError("；".join(check.errors))
+    prepared.audio_codec = check.audio_codec
+    
+    prepared.temp_file = make_temp_output_path(output_file, prepared.work_dir)
+    prepared.cmd = build_convert_command(input_file, prepared.temp_file, crf, preset, prepared.audio_codec,
+                                         audio_bitrate, threads, moov_mode, priority, input_info, ffmpeg=ffmpeg)
+    return prepared
+
+def encode_prepared(prepared, cancel_event=None, progress_callback=None, stats=None, checkpoint=False,
+                    segment_seconds=SEGMENT_SECONDS):
+    """
+    运行准备好的转换，写入prepared.temp_file
+
+    Args:
+        prepared: prepare_conversion()的结果
+        checkpoint: 分段编码并记录完成的片段（使用PATH中的ffmpeg），无法分段时改为一次性编码
+        其余参数同convert_h264_to_h265
+
+    Returns:
+        tuple: 与run_ffmpeg相同的 (返回码, stderr, 是否被取消)
+    """
+    params = prepared.params
+    on_progress = None
+    if progress_callback is not None:
+        total_duration = prepared.input_info['duration'] if prepared.input_info else None
+        on_progress = lambda position: progress_callback(position, total_duration)
+    if checkpoint:
+        prepared.checkpoint_dir = checkpoint_dir_for(prepared.output_file, prepared.work_dir)
+        result = encode_segmented(prepared.input_file, prepared.temp_file, prepared.checkpoint_dir, params["crf"],
+                                  params["preset"], prepared.audio_codec, params["audio_bitrate"], params["threads"],
+                                  params["moov_mode"], params["priority"], prepared.input_info,
+                                  cancel_event, on_progress, stats, segment_seconds)
+        if result is not None:
+            return result
+        logger.warning("分段编码不可用，改为一次性编码")
+        prepared.checkpoint_dir = None
+        if stats is not None:
+            stats.pop("encoded_fraction", None)
+    return run_ffmpeg(prepared.cmd, priority=params["priority"], cancel_event=cancel_event,
+                      progress_callback=on_progress, stats=stats)
+
+def finalize_conversion(prepared, returncode, stderr):
+    """
+    检查ffmpeg的结果，成功时把临时文件移动到最终路径，删除检查点并加入结果缓存
+
+    Args:
+        prepared: prepare_conversion()的结果
+        returncode/stderr: ffmpeg的返回码和stderr
+
+    Raises:
+        ConversionError: ffmpeg失败或输出不完整
+        OSError: 移动输出文件失败
+    """
+    if returncode != 0:
+        raise ConversionError(f"FFmpeg返回码: {returncode}")
+    # 预留的moov空间不足时ffmpeg仍返回0，但文件尾部写入失败
+    if MOOV_TOO_SMALL_ERROR in stderr:
+        raise ConversionError("预留的moov空间不足，输出文件不完整，请改用fragmented或faststart的moov布局重试")
+    if not os.path.exists(prepared.temp_file):
+        raise ConversionError(f"输出文件未生成: {prepared.output_file}")
+    
+    # 转换完成后再移动到最终位置
+    move_into_place(prepared.temp_file, prepared.output_file)
+    logger.info(f"输出文件已移动到最终位置: {prepared.output_file}")
+    if prepared.checkpoint_dir and os.path.isdir(prepared.checkpoint_dir):
+        shutil.rmtree(prepared.checkpoint_dir, ignore_errors=True)
+    if prepared.cache_key is not None:
+        prepared.result_cache.store(prepared.cache_key, prepared.output_file)
+
+def remove_temp_output(prepared):
+    """删除未完成的临时文件（转换失败、取消或出错后）"""
+    if prepared.temp_file and os.path.exists(prepared.temp_file):
+        try:
+            os.remove(prepared.temp_file)
+            logger.info(f"已删除未完成的临时文件: {prepared.temp_file}")
+        except OSError as e:
+            logger.warning(f"删除临时文件失败: {str(e)}")
+
+def convert_h264_to_h265(input_file, output_file, 
+                       crf=28, 
+                       preset="medium",
+                       audio_codec="aac",
+                       audio_bitrate="128k",
+                       threads=0,
+                       scratch_dir=None,
+                       moov_mode="reserve",
+                       priority=None,
+                       core_allocator=None,
+                       cancel_event=None,
+                       progress_callback=None,
+                       stats=None,
+                       result_cache=None,
+                       checkpoint=False,
+                       segment_seconds=SEGMENT_SECONDS):
+    """
+    使用ffmpeg将H264视频转换为H265
+    
+    输出先写入临时文件，完成后再原子地移动到最终路径，中断的转换不会留下残缺的输出文件。
+    
+    Args:
+        input_file: 输入文件路径
+        output_file: 输出文件路径
+        crf: 恒定速率因子，范围0-51，值越小质量越高，H.265推荐28-31
+        preset: 编码预设(slow, medium, fast等)，越慢压缩率越高
+        audio_codec: 音频编码器
+        audio_bitrate: 音频比特率
+        threads: 使用的线程数，0表示使用所有可用线程
+        scratch_dir: 临时文件目录（如本地SSD或tmpfs），None表示使用输出目录
+        moov_mode: MP4/MOV输出的moov布局，reserve/fragmented可避免faststart的整文件二次重写
+        priority: ProcessPriority，应用到ffmpeg子进程的nice/IO优先级/CPU亲和性
+        core_allocator: CoreAllocator，并发转换时为本任务分配独立的CPU核组
+        cancel_event: threading.Event，设置后终止ffmpeg并删除未完成的输出
+        progress_callback: 可选的回调，参数为 (已编码到的位置秒数, 总时长秒数或None)
+        stats: 可选的dict，写入ffmpeg的峰值内存 stats["peak_rss"]（字节，仅Linux）、视频编码的实际耗时
+            stats["encode_seconds"]（使用缓存的结果时没有），分段编码时还有本次编码的比例stats["encoded_fraction"]
+        result_cache: ResultCache，内容和参数相同的输入已转换过时直接使用缓存的结果，转换成功后加入缓存
+        checkpoint: 分段编码并记录完成的片段，崩溃或中断后再次转换同一文件时只编码剩余的片段
+        segment_seconds: 分段编码时每个片段的目标时长（秒）
+    
+    Returns:
+        bool: 如果转换成功返回True，否则返回False
+    """
+    # 并发任务各自占用独立的CPU核组
+    if core_allocator is not None:
+        with core_allocator.acquire() as cores:
+            priority = (priority or ProcessPriority()).with_cpus(cores)
+            return convert_h264_to_h265(input_file, output_file, crf, preset, audio_codec, audio_bitrate,
+                                        threads, scratch_dir, moov_mode, priority=priority,
+                                        cancel_event=cancel_event, progress_callback=progress_callback,
+                                        stats=stats, result_cache=result_cache, checkpoint=checkpoint,
+                                        segment_seconds=segment_seconds)
+    
+    logger.info(f"开始转换函数处理，输入文件: {input_file}, 输出文件: {output_file}")
+    
+    try:
+        prepared = prepare_conversion(input_file, output_file, crf, preset, audio_codec, audio_bitrate,
+                                      threads, scratch_dir, moov_mode, priority, result_cache)
+    except (ConversionError, OSError) as e:
+        logger.error(str(e))
+        print(f"❌ 错误: {str(e)}")
+        return False
+    if prepared.cached is not None:
+        print(f"♻️  内容相同的文件已转换过，使用缓存的结果（{prepared.cached}）: {output_file}")
+        return True
+    for warning in prepared.warnings:
+        print(f"⚠️  {warning}")
+    audio_codec = prepared.audio_codec
+    is_mp4_output = os.path.splitext(output_file)[1].lower() in MP4_EXTENSIONS
     
     logger.info(f"开始转换: {input_file} -> {output_file}")
     logger.info(f"使用参数: CRF={crf}, 预设={preset}, 音频={audio_codec}@{audio_bitrate}")
-    logger.info(f"执行的FFmpeg命令: {' '.join(cmd)}")
+    logger.info(f"执行的FFmpeg命令: {' '.join(prepared.cmd)}")
+    logger.info(f"临时输出文件: {prepared.temp_file}")
+    if priority:
+        logger.info(f"进程优先级: {priority.describe()}")
     print(f"🔄 开始转换: {input_file} -> {output_file}")
     print(f"   参数: CRF={crf}, 预设={preset}, 音频={audio_codec}@{audio_bitrate}")
     
     start_time = time.time()
     try:
-        # 执行ffmpeg命令，并显示输出
-        process = subprocess.run(cmd, 
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                text=True)
+        # 执行ffmpeg命令
+        returncode, stderr, cancelled = encode_prepared(prepared, cancel_event, progress_callback, stats,
+                                                        checkpoint, segment_seconds)
+        if checkpoint and prepared.checkpoint_dir is None:
+            print("⚠️  分段编码不可用，已改为一次性编码")
         
-        if process.returncode != 0:
-            logger.error(f"FFmpeg执行失败，返回码: {process.returncode}")
-            logger.error(f"FFmpeg输出: {process.stderr}")
-            print(f"❌ 转换失败！FFmpeg返回码: {process.returncode}")
-            print(f"   错误信息: {process.stderr[:200]}...")
+        if cancelled:
+            logger.warning(f"转换已取消: {input_file}")
+            print(f"⚠️  转换已取消: {input_file}")
             return False
         
-        end_time = time.time()
-        duration = end_time - start_time
-        
-        # 检查输出文件是否存在
-        if not os.path.exists(output_file):
-            logger.error(f"输出文件未生成: {output_file}")
-            print(f"❌ 错误: 输出文件未生成: {output_file}")
+        if returncode != 0:
+            logger.error(f"FFmpeg输出: {stderr}")
+        try:
+            finalize_conversion(prepared, returncode, stderr)
+        except ConversionError as e:
+            logger.error(f"转换失败: {input_file}: {str(e)}")
+            print(f"❌ 转换失败！{str(e)}")
+            if returncode != 0:
+                print(f"   错误信息: {stderr[-200:]}...")
             return False
+        duration = time.time() - start_time
         
         # 获取输出文件信息
         output_info = get_video_info(output_file)
         if output_info:
             # 计算压缩率
-            compression_ratio = (1 - output_info['file_size'] / input_info['file_size']) * 100 if input_info else 0
+            compression_ratio = (1 - output_info['file_size'] / prepared.input_size) * 100 if prepared.input_size else 0
             logger.info(f"转换成功完成！耗时: {duration:.2f} 秒")
             logger.info(f"输出文件信息: {output_info['codec']}, {output_info['human_size']}, 压缩率: {compression_ratio:.2f}%")
             print(f"✅ 转换成功完成！耗时: {duration:.2f} 秒")
             print(f"   输出文件大小: {output_info['human_size']}, 压缩率: {compression_ratio:.2f}%")
+            if is_mp4_output:
+                logger.info(f"moov布局: {moov_mode}")
         else:
             logger.info(f"转换成功完成！耗时: {duration:.2f} 秒")
             print(f"✅ 转换成功完成！耗时: {duration:.2f} 秒")
         
         return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"转换失败，返回代码: {e.returncode}")
-        logger.error(f"错误输出: {e.stderr}")
-        print(f"❌ 转换失败！返回代码: {e.returncode}")
-        return False
     except KeyboardInterrupt:
         logger.warning("转换被用户中断")
         print(f"⚠️  转换被用户中断")
@@ -228,14 +926,334 @@ def convert_h264_to_h265(input_file, output_file,
         logger.error(f"转换过程中出错: {str(e)}")
         print(f"❌ 转换过程中出错: {str(e)}")
         return False
+    finally:
+        # 清理未完成的临时文件
+        remove_temp_output(prepared)
+
+def convert_clip_group(clips, crf=28, preset="medium", audio_codec="aac", audio_bitrate="128k",
+                       threads=0, scratch_dir=None, moov_mode="reserve", priority=None, core_allocator=None,
+                       cancel_event=None, result_cache=None, workers=1, **kwargs):
+    """
+    用一次ffmpeg调用转换一组短视频（见small_clips.py）
+
+    使用扫描时探测的结果，不再逐个探测输入和输出，预检不试解码（编码本身就是检查）。
+    整组失败时（如其中一个文件损坏），逐个用convert_h264_to_h265重新转换，找出有问题的文件。
+
+    Args:
+        clips: [(输入文件, 输出文件, 视频信息), ...]
+        workers: 同时进行的转换数，未绑定独立核组时各组的x265线程池共同平分CPU
+        **kwargs: 逐个重新转换时传给convert_h264_to_h265的其他参数
+        其余参数同convert_h264_to_h265
+
+    Returns:
+        list: 每个文件是否转换成功，顺序与clips相同
+    """
+    params = dict(crf=crf, preset=preset, audio_codec=audio_codec, audio_bitrate=audio_bitrate, threads=threads,
+                  scratch_dir=scratch_dir, moov_mode=moov_mode, priority=priority, core_allocator=core_allocator,
+                  cancel_event=cancel_event, result_cache=result_cache, **kwargs)
+    if len(clips) == 1:
+        return [convert_h264_to_h265(clips[0][0], clips[0][1], **params)]
+
+    results = [False] * len(clips)
+    group = []
+    for position, (input_file, output_file, info) in enumerate(clips):
+        cache_key = None
+        if result_cache is not None:
+            try:
+                cache_key = result_cache.key(input_file, output_file, {
+                    "crf": crf, "preset": preset, "audio_codec": audio_codec,
+                    "audio_bitrate": audio_bitrate, "moov_mode": moov_mode})
+            except OSError as e:
+                logger.warning(f"计算结果缓存键失败: {str(e)}")
+            if cache_key is not None and result_cache.fetch(cache_key, output_file) is not None:
+                print(f"♻️  内容相同的文件已转换过，使用缓存的结果: {output_file}")
+                results[position] = True
+                continue
+        work_dir = scratch_dir or os.path.dirname(output_file) or "."
+        required_bytes = int(estimate_output_size(info["file_size"], crf) * 1.1)
+        check = preflight(input_file, output_file, info, work_dir, required_bytes, audio_codec, decode=False)
+        for warning in check.warnings:
+            logger.warning(f"预检: {input_file}: {warning}")
+        if not check.ok:
+            for error in check.errors:
+                logger.error(f"预检失败: {input_file}: {error}")
+                print(f"❌ {input_file}: {error}")
+            continue
+        temp_file = make_temp_output_path(output_file, work_dir)
+        group.append((position, input_file, output_file, temp_file, check.audio_codec, info, cache_key))
+    if not group:
+        return results
+
+    with (core_allocator.acquire() if core_allocator else contextlib.nullcontext()) as cores:
+        if cores:
+            priority = (priority or ProcessPriority()).with_cpus(cores)
+        cmd = build_group_command([(item[1], item[3], item[4], item[5]) for item in group],
+                                  crf, preset, audio_bitrate, threads, moov_mode, priority,
+                                  workers=1 if cores else workers)
+        logger.info(f"合并转换 {len(group)} 个短视频: {' '.join(cmd)}")
+        print(f"🔄 合并转换 {len(group)} 个短视频: {', '.join(os.path.basename(item[1]) for item in group)}")
+        start_time = time.time()
+        try:
+            returncode, stderr, cancelled = run_ffmpeg(cmd, priority=priority, cancel_event=cancel_event)
+            if cancelled:
+                logger.warning("合并转换已取消")
+                return results
+            failed = returncode != 0 or MOOV_TOO_SMALL_ERROR in stderr
+            if not failed:
+                for position, input_file, output_file, temp_file, _, info, cache_key in group:
+                    if not os.path.exists(temp_file):
+                        failed = True
+                        break
+            if not failed:
+                for position, input_file, output_file, temp_file, _, info, cache_key in group:
+                    move_into_place(temp_file, output_file)
+                    results[position] = True
+                    if cache_key is not None:
+                        result_cache.store(cache_key, output_file)
+                    logger.info(f"转换成功: {output_file}")
+                elapsed = time.time() - start_time
+                logger.info(f"合并转换完成，{len(group)} 个文件耗时 {elapsed:.2f} 秒")
+                print(f"✅ 合并转换完成: {len(group)} 个文件，耗时 {elapsed:.2f} 秒")
+                return results
+            logger.warning(f"合并转换失败，返回码: {returncode}，改为逐个转换。FFmpeg输出: {stderr[-500:]}")
+            print(f"⚠️  合并转换失败，改为逐个转换这 {len(group)} 个文件")
+        finally:
+            for item in group:
+                if os.path.exists(item[3]):
+                    os.remove(item[3])
+
+    for position, input_file, output_file, _, _, _, _ in group:
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        results[position] = convert_h264_to_h265(input_file, output_file, **params)
+    return results
+
+def is_stream_path(path):
+    """
+    判断路径是否为不可寻址的流（标准输入/输出或命名管道FIFO）
+    """
+    if not path:
+        return False
+    if path == "-":
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
 
-def batch_convert(directory, recursive=False, **kwargs):
+def parse_ffmpeg_time(value):
+    """
+    将ffmpeg统计信息中的时间（HH:MM:SS.xx）转换为秒数，无法解析时返回None
+    """
+    match = re.match(r"(-?\d+):(\d+):(\d+(?:\.\d+)?)", value)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def convert_stream(input_file, output_file,
+                   duration=None,
+                   input_format=None,
+                   crf=28,
+                   preset="medium",
+                   audio_codec="aac",
+                   audio_bitrate="128k",
+                   threads=0,
+                   priority=None):
+    """
+    流式转换：从标准输入/管道读取，向标准输出/FIFO写入分片MP4
+    
+    分片MP4（frag_keyframe+empty_moov）在开头写入空的moov，之后每个关键帧输出一个片段，
+    下游可以在编码进行中就开始读取，不需要可寻址的输出文件。
+    流式输入无法预先用ffprobe探测，进度按duration提示计算。
+    
+    Args:
+        input_file: 输入路径，"-"表示标准输入
+        output_file: 输出路径，"-"表示标准输出，也可以是FIFO
+        duration: 输入时长提示（秒），用于计算进度，None表示不计算百分比
+        input_format: 输入容器格式（如mpegts、matroska），None表示由ffmpeg自动识别
+        crf: 恒定速率因子
+        preset: 编码预设
+        audio_codec: 音频编码器
+        audio_bitrate: 音频比特率
+        threads: 使用的线程数，0表示使用所有可用线程
+        priority: ProcessPriority，应用到ffmpeg子进程的nice/IO优先级/CPU亲和性
+    
+    Returns:
+        bool: 如果转换成功返回True，否则返回False
+    """
+    logger.info(f"开始流式转换，输入: {input_file}, 输出: {output_file}, 时长提示: {duration}")
+    
+    if input_file != "-" and not os.path.exists(input_file):
+        logger.error(f"输入文件不存在: {input_file}")
+        print(f"❌ 错误: 输入文件不存在: {input_file}")
+        return False
+    
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin"] if input_file != "-" else ["ffmpeg", "-hide_banner"]
+    if input_format:
+        cmd.extend(["-f", input_format])
+    cmd.extend(["-i", "pipe:0" if input_file == "-" else input_file])
+    cmd.extend(["-c:v", "libx265", "-crf", str(crf), "-preset", preset, "-tag:v", "hvc1"])
+    if threads > 0:
+        cmd.extend(["-threads", str(threads)])
+    elif priority and priority.x265_params():
+        cmd.extend(["-x265-params", ":".join(priority.x265_params())])
+    cmd.extend(["-c:a", audio_codec, "-b:a", audio_bitrate])
+    
+    # 分片MP4，不需要在结束时回写moov，可以直接写入管道
+    cmd.extend(["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"])
+    cmd.extend(["-y", "pipe:1" if output_file == "-" else output_file])
+    
+    logger.info(f"执行的FFmpeg命令: {' '.join(cmd)}")
+    
+    start_time = time.time()
+    try:
+        # 标准输入/输出直接继承给ffmpeg，只读取stderr获取进度和错误信息
+        process = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+        if priority and not priority.is_empty():
+            priority.apply(process.pid)
+        
+        stderr_tail = []
+        output_log = RateLimitedLog(ffmpeg_log_name(cmd, process.pid))
+        last_percent = -1
+        buffer = b""
+        while True:
+            chunk = process.stderr.read1(4096)
+            if not chunk:
+                break
+            buffer += chunk
+            # ffmpeg的统计行以\r结尾，其他信息以\n结尾
+            lines = re.split(rb"[\r\n]", buffer)
+            buffer = lines.pop()
+            for raw_line in lines:
+                line = raw_line.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                stderr_tail = (stderr_tail + [line])[-20:]
+                output_log.log(line)
+                match = re.search(r"time=(\S+)", line)
+                if match and duration:
+                    current = parse_ffmpeg_time(match.group(1))
+                    if current is not None:
+                        percent = min(int(current / duration * 100), 100)
+                        if percent // 5 > last_percent // 5:
+                            logger.info(f"流式转换进度: {percent}%")
+                            last_percent = percent
+        
+        returncode = process.wait()
+        output_log.flush()
+        elapsed = time.time() - start_time
+        if returncode != 0:
+            logger.error(f"FFmpeg执行失败，返回码: {returncode}")
+            logger.error("FFmpeg输出: " + "\n".join(stderr_tail))
+            print(f"❌ 转换失败！FFmpeg返回码: {returncode}")
+            return False
+        
+        logger.info(f"流式转换完成！耗时: {elapsed:.2f} 秒")
+        print(f"✅ 流式转换完成！耗时: {elapsed:.2f} 秒")
+        return True
+    except KeyboardInterrupt:
+        logger.warning("转换被用户中断")
+        print(f"⚠️  转换被用户中断")
+        return False
+    except Exception as e:
+        logger.error(f"流式转换过程中出错: {str(e)}")
+        print(f"❌ 流式转换过程中出错: {str(e)}")
+        return False
+
+def iter_catalog_candidates(catalog, directory, recursive=False, include=None, exclude=None, probe_workers=4,
+                            full=False, retry_failed=False, include_hidden=False):
+    """
+    增量扫描目录并产出候选文件：先是本次新增或变化的文件，再是之前发现但没来得及探测的文件
+    （上次扫描中途停止），最后是之前记录为待转换的文件
+    
+    Args:
+        catalog: LibraryCatalog
+        directory: 要扫描的目录
+        recursive: 是否递归扫描子目录
+        include: 包含的glob模式列表
+        exclude: 排除的glob模式列表
+        probe_workers: 并行探测文件信息的线程数
+        full: 忽略目录修改时间全部重新列出，用于发现原地改写的文件
+        retry_failed: 重新处理探测或转换失败的文件
+        include_hidden: 递归时也扫描隐藏目录
+    
+    Yields:
+        tuple: (文件路径, 视频信息)
+    """
+    changed_files = catalog.rescan(directory, recursive, include, exclude, is_video=is_video_file, full=full,
+                                   include_hidden=include_hidden)
+    
+    def probe(input_file):
+        # 被移动、重命名或复制的文件内容没有变化，直接使用之前的探测结果
+        try:
+            st = os.stat(input_file)
+            digest = file_hash(input_file, st=st)
+        except OSError as e:
+            logger.warning(f"计算内容哈希失败: {input_file}: {str(e)}")
+            return None, get_video_info(input_file)
+        row = catalog.find_probed(digest, st.st_size)
+        if row is not None:
+            logger.info(f"内容与已探测的文件相同，使用之前的探测结果: {input_file} = {row['path']}")
+            return digest, catalog.to_video_info(row)
+        return digest, get_video_info(input_file)
+    
+    seen = set()
+    
+    def probe_all(files):
+        for input_file, (digest, info) in iter_probed(files, probe, workers=probe_workers,
+                                                      max_pending=probe_workers * 2):
+            catalog.record_probe(input_file, info, digest)
+            seen.add(input_file)
+            if info:
+                yield input_file, info
+    
+    yield from probe_all(changed_files)
+    
+    # 上次扫描中途停止时已写入目录但未探测的文件，以及要重试的探测失败的文件
+    stale_statuses = [STATUS_NEW] + ([STATUS_FAILED] if retry_failed else [])
+    stale_files = [row["path"] for status in stale_statuses for row in catalog.query(root=directory, status=status)
+                   if row["path"] not in seen and row["codec"] is None and os.path.exists(row["path"])]
+    if stale_files:
+        logger.info(f"重新探测 {len(stale_files)} 个之前未完成探测的文件")
+        yield from probe_all(stale_files)
+    
+    candidate_statuses = [STATUS_PENDING] + ([STATUS_FAILED] if retry_failed else [])
+    for status in candidate_statuses:
+        for row in catalog.query(root=directory, status=status):
+            if row["path"] not in seen and os.path.exists(row["path"]):
+                yield row["path"], catalog.to_video_info(row)
+
+def batch_convert(directory, recursive=False, include=None, exclude=None,
+                  workers=1, probe_workers=4, catalog=None, full_rescan=False, retry_failed=False,
+                  include_hidden=False, shutdown=None, state_file=None,
+                  memory_budget=None, memory_history=None, deadline=None,
+                  small_clips=0, small_clip_seconds=SMALL_CLIP_SECONDS, **kwargs):
     """
     批量转换目录中的视频文件
     
+    扫描、探测和转换以流水线方式进行：找到第一个需要转换的文件后立即开始编码，
+    不需要先收集完整的文件列表，内存占用只取决于队列深度。
+    
     Args:
         directory: 要扫描的目录
         recursive: 是否递归扫描子目录
+        include: 包含的glob模式列表，None表示全部视频文件
+        exclude: 排除的glob模式列表
+        workers: 同时进行的转换数量
+        probe_workers: 并行探测文件信息的线程数
+        catalog: LibraryCatalog，指定时只扫描变化过的目录，并记录转换状态
+        full_rescan: 使用catalog时忽略目录修改时间全部重新列出，发现原地改写的文件
+        retry_failed: 使用catalog时重新处理之前探测或转换失败的文件
+        include_hidden: 递归时也扫描隐藏目录（默认跳过以.开头的目录）
+        shutdown: ShutdownController，收到停止信号后不再开始新任务，再次收到时终止进行中的转换
+        state_file: 可恢复状态文件，默认为目录下的.h265_batch_state.json（仅在被中断时写入）
+        memory_budget: 内存预算（字节），指定时按估算的峰值内存决定同时进行的转换，workers为并发上限
+        memory_history: MemoryHistory，用于估算峰值内存并记录实测值，None表示只在本次运行中校准
+        deadline: 截止时间的时间戳，指定时先探测全部文件，为每个文件选择能按时完成的最慢预设
+        small_clips: 大于1时把不超过small_clip_seconds秒的短视频每small_clips个合并为一次ffmpeg调用
+            （不能与memory_budget、deadline同时使用）
+        small_clip_seconds: 走快速通道的短视频的最大时长（秒）
         **kwargs: 传递给convert_h264_to_h265的其他参数
     
     Returns:
@@ -245,57 +1263,239 @@ def batch_convert(directory, recursive=False, **kwargs):
         logger.error(f"目录不存在: {directory}")
         return 0
     
-    # 支持的视频文件扩展名
-    video_extensions = {'.mp4', '.mkv', '.mov', '.avi', '.wmv', '.flv', '.webm'}
-    
-    # 收集所有视频文件
-    video_files = []
-    if recursive:
-        for root, _, files in os.walk(directory):
-            for file in files:
-                _, ext = os.path.splitext(file)
-                if ext.lower() in video_extensions:
-                    video_files.append(os.path.join(root, file))
+    # 上次被中断时保存的状态，已完成的文件不再重复转换
+    default_state_file = os.path.join(directory, ".h265_batch_state.json")
+    state = JobState(state_file or (default_state_file if os.path.exists(default_state_file) else None))
+    
+    if catalog is not None:
+        probed_files = iter_catalog_candidates(catalog, directory, recursive, include, exclude, probe_workers,
+                                               full=full_rescan, retry_failed=retry_failed,
+                                               include_hidden=include_hidden)
     else:
-        for file in os.listdir(directory):
-            file_path = os.path.join(directory, file)
-            if os.path.isfile(file_path):
-                _, ext = os.path.splitext(file)
-                if ext.lower() in video_extensions:
-                    video_files.append(file_path)
-    
-    logger.info(f"找到 {len(video_files)} 个视频文件")
+        video_files = iter_video_files(directory, recursive, include, exclude, is_video=is_video_file,
+                                       include_hidden=include_hidden)
+        probed_files = iter_probed(video_files, get_video_info, workers=probe_workers,
+                                   max_pending=max(probe_workers, workers) * 2)
+    # 上次被中断时正在转换的文件先处理，不必等扫描到它们
+    probed_files = state.resume_first(probed_files, get_video_info)
+    if shutdown is not None:
+        kwargs["cancel_event"] = shutdown.cancel_event
+    
+    planner = None
+    units = {}
+    if deadline is not None:
+        # 按截止时间选择预设需要先知道全部工作量
+        probed_files = list(probed_files)
+        infos = {}
+        for input_file, info in probed_files:
+            if info and info['codec'] == 'hevc':
+                continue
+            try:
+                if state.is_handled(input_file, os.stat(input_file)):
+                    continue
+                infos[input_file] = info or {"file_size": os.path.getsize(input_file)}
+            except OSError:
+                continue
+            units[input_file] = work_units(infos[input_file])
+        planner = DeadlinePlanner(deadline, sum(units.values()), workers, default_speed_history_file())
+        print(f"⏱️  共 {len(units)} 个文件需要转换，合计 {sum(units.values())/1e9:.1f} G像素")
+        if units and not planner.calibrated:
+            first_file = next(iter(units))
+            print(f"⏱️  正在测量编码速度: {first_file}")
+            rate = measure_encode_rate(first_file, infos[first_file], threads=kwargs.get("threads", 0))
+            if rate:
+                planner.set_rate(rate)
+    
+    found_count = 0
     success_count = 0
+    running = set()
+    # 进行中和等待开始的转换占用的输出路径
+    reserved_outputs = set()
+    lock = threading.Lock()
+    # 准入控制：进行中的转换不超过workers个，指定内存预算时估算的峰值内存之和也不超过预算
+    admission = MemoryBudget(memory_budget, workers)
+    history = memory_history if memory_history is not None else (MemoryHistory() if memory_budget else None)
+    preset = kwargs.get("preset", "medium")
+    # 每个ffmpeg可用的核数决定x265的帧线程数，是峰值内存的主要因素之一
+    if kwargs.get("threads"):
+        job_cpu_count = kwargs["threads"]
+    elif kwargs.get("core_allocator") is not None:
+        job_cpu_count = kwargs["core_allocator"].cores_per_job
+    else:
+        job_priority = kwargs.get("priority")
+        job_cpu_count = len((job_priority and job_priority.cpus) or available_cpus())
+    # 等待开始的文件，窗口有上限，保证排队的文件数量有上限；内存放不下时先开始窗口中后面能放下的文件
+    waiting = []
+    window = max(workers * 2, PACKING_WINDOW) if memory_budget else 1
+    # 最早等待的文件被跳过的次数，达到窗口大小后只等它，避免大文件一直被小文件插队
+    head_skips = 0
     
-    for idx, input_file in enumerate(video_files, 1):
-        # 检查是否已经是H.265编码
-        info = get_video_info(input_file)
-        if info and info['codec'] == 'hevc':  # HEVC就是H.265
-            logger.info(f"跳过已使用H.265编码的文件: {input_file}")
-            continue
-        
-        # 生成输出文件名
-        base_name, ext = os.path.splitext(input_file)
-        output_file = f"{base_name}_h265{ext}"
-        
-        # 避免覆盖已存在的文件
-        counter = 1
-        while os.path.exists(output_file):
-            output_file = f"{base_name}_h265_{counter}{ext}"
-            counter += 1
+    def should_stop():
+        return shutdown is not None and shutdown.stop_requested
+    
+    def run_conversion(number, input_file, output_file, input_stat, info, estimate, job_preset):
+        nonlocal success_count
+        success = False
+        stats = {}
+        try:
+            success = convert_h264_to_h265(input_file, output_file, stats=stats, **dict(kwargs, preset=job_preset))
+            cancelled = shutdown is not None and shutdown.cancelled
+            with lock:
+                if success:
+                    success_count += 1
+                if success or not cancelled:
+                    running.discard(input_file)
+            if success:
+                state.record(input_file, input_stat, "done", output_file)
+                # 用实测的峰值内存校准之后的估算
+                if history is not None and info and stats.get("peak_rss"):
+                    history.record(info["width"], info["height"], job_preset, stats["peak_rss"],
+                                   cpu_count=job_cpu_count)
+            # 被取消的文件保持待转换状态，恢复时重新处理
+            if catalog is not None and not (cancelled and not success):
+                catalog.set_status(input_file, STATUS_CONVERTED if success else STATUS_FAILED,
+                                   output_file if success else None)
+        finally:
+            with lock:
+                reserved_outputs.discard(output_file)
+            admission.release(estimate)
+            if planner is not None:
+                # 只用实际编码的耗时修正速度：使用缓存的结果或从检查点继续的文件耗时不代表编码速度
+                planner.finish(number, stats.get("encode_seconds", 0), success, stats.get("encoded_fraction", 1.0))
+    
+    # 等待合并转换的短视频
+    small_group = []
+    
+    def run_group(group):
+        nonlocal success_count
+        # 停止后不再开始排队中的组，文件保持待转换状态
+        if should_stop():
+            with lock:
+                reserved_outputs.difference_update(item[2] for item in group)
+            return
+        results = [False] * len(group)
+        try:
+            results = convert_clip_group([(input_file, output_file, info)
+                                          for _, input_file, output_file, _, info in group],
+                                         workers=workers, **kwargs)
+        finally:
+            cancelled = shutdown is not None and shutdown.cancelled
+            for (_, input_file, output_file, input_stat, _), success in zip(group, results):
+                with lock:
+                    reserved_outputs.discard(output_file)
+                    if success:
+                        success_count += 1
+                    if success or not cancelled:
+                        running.discard(input_file)
+                if success:
+                    state.record(input_file, input_stat, "done", output_file)
+                if catalog is not None and not (cancelled and not success):
+                    catalog.set_status(input_file, STATUS_CONVERTED if success else STATUS_FAILED,
+                                       output_file if success else None)
+    
+    def submit_group(executor):
+        group = list(small_group)
+        small_group.clear()
+        with lock:
+            running.update(item[1] for item in group)
+        logger.info(f"\n合并转换第 {', '.join(str(item[0]) for item in group)} 个文件")
+        executor.submit(run_group, group)
+    
+    def start_next(executor, block):
+        """开始等待中第一个放得下的文件，没有开始任何文件时返回False"""
+        nonlocal head_skips
+        candidates = waiting if head_skips < window else waiting[:1]
+        chosen = admission.choose([item[-1] for item in candidates], block, should_stop)
+        if chosen is None:
+            return False
+        head_skips = head_skips + 1 if chosen > 0 else 0
+        number, input_file, output_file, input_stat, info, estimate = waiting.pop(chosen)
+        if should_stop():
+            admission.release(estimate)
+            waiting.insert(chosen, (number, input_file, output_file, input_stat, info, estimate))
+            return False
+        with lock:
+            running.add(input_file)
+        job_preset = preset
+        if planner is not None:
+            job_preset = planner.choose_preset()
+            planner.start(number, units.get(input_file, 0), job_preset)
+        logger.info(f"\n处理第 {number} 个文件: {input_file}")
+        if memory_budget:
+            logger.info(f"预计峰值内存 {estimate/1024/1024:.0f} MB，已占用预算 "
+                        f"{admission.used/1024/1024:.0f}/{memory_budget/1024/1024:.0f} MB")
+        executor.submit(run_conversion, number, input_file, output_file, input_stat, info, estimate, job_preset)
+        return True
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="convert") as executor:
+        for input_file, info in probed_files:
+            if should_stop():
+                break
+            found_count += 1
+            # 检查是否已经是H.265编码
+            if info and info['codec'] == 'hevc':  # HEVC就是H.265
+                logger.info(f"跳过已使用H.265编码的文件: {input_file}")
+                continue
+            
+            try:
+                input_stat = os.stat(input_file)
+            except OSError as e:
+                logger.warning(f"无法读取文件信息，跳过: {input_file}: {str(e)}")
+                continue
+            if state.is_handled(input_file, input_stat):
+                logger.info(f"跳过上次已完成的文件: {input_file}")
+                continue
+            
+            # 生成输出文件名，不与进行中的转换重复
+            with lock:
+                output_file = make_output_path(input_file, reserved_outputs)
+                reserved_outputs.add(output_file)
+            
+            # 短视频先攒够一组再合并转换
+            if small_clips > 1 and is_small_clip(info, small_clip_seconds):
+                small_group.append((found_count, input_file, output_file, input_stat, info))
+                if len(small_group) >= small_clips:
+                    submit_group(executor)
+                continue
+            estimate = history.estimate(info["width"] if info else None, info["height"] if info else None,
+                                        (planner and planner.preset) or preset,
+                                        cpu_count=job_cpu_count) if history is not None else 0
+            waiting.append((found_count, input_file, output_file, input_stat, info, estimate))
+            
+            # 转换文件：先开始所有放得下的，窗口满时等待
+            while waiting and start_next(executor, block=False):
+                pass
+            while len(waiting) >= window and start_next(executor, block=True):
+                pass
+            if should_stop():
+                break
         
-        # 转换文件
-        logger.info(f"\n处理文件 {idx}/{len(video_files)}: {input_file}")
-        if convert_h264_to_h265(input_file, output_file, **kwargs):
-            success_count += 1
+        while waiting and start_next(executor, block=True):
+            pass
+        if small_group and not should_stop():
+            submit_group(executor)
     
-    logger.info(f"\n批量转换完成！成功转换 {success_count}/{len(video_files)} 个文件")
+    if shutdown is not None and shutdown.stop_requested:
+        # 保存可恢复状态：已完成的文件和被终止的文件
+        state.save(state.state_file or default_state_file, pending=sorted(running))
+        logger.warning(f"批量转换被中断，可恢复状态已保存到: {state.state_file}")
+        print(f"💾 批量转换被中断，可恢复状态已保存到: {state.state_file}（再次运行相同命令即可继续）")
+    elif state.state_file == default_state_file and not state_file:
+        # 全部完成后不再需要上次中断时留下的状态
+        os.remove(default_state_file)
+    
+    logger.info(f"\n批量转换完成！共找到 {found_count} 个视频文件，成功转换 {success_count} 个")
     return success_count
 
 def main():
     """
     主函数 - 程序入口点
     """
+    # 输出到标准输出时，程序自身的提示信息改为写入标准错误，避免混入视频数据
+    argv = sys.argv[1:]
+    if "--output=-" in argv or any(arg in ("-o", "--output") and value == "-"
+                                   for arg, value in zip(argv, argv[1:])):
+        sys.stdout = sys.stderr
     print_banner()
     
     # 创建命令行参数解析器
@@ -303,33 +1503,189 @@ def main():
     
     # 添加互斥组，用于选择单个文件转换还是批量转换
     group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("-i", "--input", help="输入视频文件路径")
+    group.add_argument("-i", "--input", help="输入视频文件路径，\"-\"表示从标准输入读取")
     group.add_argument("-d", "--directory", help="要批量转换的目录路径")
+    group.add_argument("--catalog-query", action="store_true", help="查询--catalog中记录的文件（可用--codec/--min-size/--status过滤）")
+    group.add_argument("--serve", action="store_true", help="运行本机HTTP任务服务，通过REST接口提交和管理转换任务")
     
     # 通用参数
-    parser.add_argument("-o", "--output", help="输出视频文件路径（仅单个文件转换时需要）")
+    parser.add_argument("-o", "--output", help="输出视频文件路径（仅单个文件转换时需要），\"-\"表示写入标准输出")
     parser.add_argument("-r", "--recursive", action="store_true", help="递归处理子目录（仅批量转换时有效）")
+    parser.add_argument("--include", action="append", help="只处理匹配的文件（glob，匹配相对路径或文件名，可多次指定）")
+    parser.add_argument("--exclude", action="append", help="跳过匹配的文件或目录（glob，可多次指定）")
+    parser.add_argument("--include-hidden", action="store_true",
+                        help="递归扫描和监视时也进入隐藏目录（以.开头，默认跳过；转换自己的检查点目录始终跳过）")
+    parser.add_argument("--probe-workers", type=int, default=4, help="批量转换时并行探测文件信息的线程数")
+    
+    # 进程优先级参数（适合在共享机器上后台运行）
+    parser.add_argument("--nice", type=int, help="ffmpeg进程的nice值(-20~19)，值越大优先级越低")
+    parser.add_argument("--io-class", choices=list(IO_CLASSES), help="ffmpeg进程的IO调度类别（仅Linux），后台任务建议idle")
+    parser.add_argument("--io-level", type=int, default=4, choices=range(8), help="IO优先级0-7，值越小优先级越高（best-effort/realtime有效）")
+    parser.add_argument("--cpu-affinity", help="ffmpeg允许使用的CPU列表，如'0-7,12'（仅Linux）")
+    parser.add_argument("--pin-cores", type=int, help="每个转换任务绑定的核数，并发任务分配互不重叠的核组")
+    
+    # 流式转换参数
+    parser.add_argument("--duration", type=float, help="输入时长提示（秒），标准输入无法预先探测时用于计算进度")
+    parser.add_argument("--input-format", help="输入容器格式（如mpegts、matroska），从标准输入读取时可指定")
+    
+    # 视频库目录参数
+    parser.add_argument("--catalog", help="视频库目录数据库路径，批量转换时只扫描变化过的目录并记录转换状态")
+    parser.add_argument("--full-rescan", action="store_true",
+                        help="使用--catalog时忽略目录修改时间全部重新列出，发现原地改写的文件")
+    parser.add_argument("--retry-failed", action="store_true", help="使用--catalog时重新处理之前探测或转换失败的文件")
+    parser.add_argument("--codec", help="查询条件：视频编码，如h264")
+    parser.add_argument("--min-size", help="查询条件：最小文件大小，如'500M'、'1G'")
+    parser.add_argument("--status", choices=STATUSES, help="查询条件：转换状态")
+    
+    # 监视文件夹参数
+    parser.add_argument("--watch", action="store_true", help="持续监视目录，自动转换新放入的视频文件（需配合-d使用）")
+    parser.add_argument("--stable-seconds", type=float, default=30, help="文件大小和修改时间保持不变多少秒后视为写入完成（监视模式）")
+    parser.add_argument("--workers", type=int, help="同时进行的转换数量（批量转换、监视模式和任务服务），默认1；"
+                                                 "指定--memory-budget时为并发上限，默认为CPU核数")
+    parser.add_argument("--memory-budget", help="批量转换的内存预算，如'24G'：按分辨率和预设估算每个转换的峰值内存，"
+                                                "估算之和不超过预算时才开始新的转换")
+    parser.add_argument("--deadline", help="批量转换的截止时间，如'06:00'、'8h'、'2026-10-20 06:00'：按剩余工作量和实测编码速度"
+                                           "选择能按时完成的最慢预设，进行中落后或提前时自动调整（忽略--preset）")
+    parser.add_argument("--memory-history", help="峰值内存实测记录，用于校准估算，默认~/.cache/video-optimizer/memory_history.json")
+    parser.add_argument("--state-file", help="状态文件路径：监视模式默认保存在监视目录下；批量转换被中断时默认保存为目录下的.h265_batch_state.json；"
+                                             "任务服务的队列默认保存为~/.cache/video-optimizer/job_server.json")
+    
+    # 任务服务参数
+    parser.add_argument("--port", type=int, default=8765, help="任务服务监听的端口（只监听127.0.0.1）")
+    parser.add_argument("--max-queue", type=int, default=100, help="任务服务最多排队的任务数，超过时返回HTTP 429")
     
     # FFmpeg参数
     parser.add_argument("--crf", type=int, default=28, help="恒定速率因子，范围0-51，H.265推荐28-31")
-    parser.add_argument("--preset", default="medium", 
-                       choices=["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"], 
-                       help="编码预设")
+    parser.add_argument("--preset", default="medium", choices=FFMPEG_PRESETS, help="编码预设")
     parser.add_argument("--audio-codec", default="aac", help="音频编码器")
     parser.add_argument("--audio-bitrate", default="128k", help="音频比特率，如'128k'")
     parser.add_argument("--threads", type=int, default=0, help="使用的线程数，0表示使用所有可用线程")
+    parser.add_argument("--moov-mode", default="reserve", choices=MOOV_MODES,
+                       help="MP4/MOV的moov布局：reserve预留空间/fragmented分片，两者都避免faststart的整文件重写")
+    parser.add_argument("--scratch-dir", help="临时文件目录（如本地SSD或tmpfs），转换完成后再移动到输出位置")
+    
+    # 分段编码参数
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="分段编码并记录完成的片段，断电或崩溃后再次运行相同命令只编码剩余的片段")
+    parser.add_argument("--segment-seconds", type=float, default=SEGMENT_SECONDS,
+                        help=f"分段编码时每个片段的目标时长（秒），在之后的第一个关键帧处切分，默认{SEGMENT_SECONDS}")
+    
+    # 转换结果缓存参数
+    parser.add_argument("--result-cache", action="store_true",
+                        help="按输入内容和转换参数缓存转换结果，内容相同的文件（即使文件名和路径不同）不再重新编码")
+    parser.add_argument("--cache-dir", help="结果缓存目录，默认~/.cache/video-optimizer/results")
+    parser.add_argument("--cache-max-size", default="50G", help="结果缓存的大小上限，超出时淘汰最久未用的结果，默认50G")
+    parser.add_argument("--cache-hardlink", action="store_true",
+                        help="结果缓存命中时允许用硬链接放到输出路径（输出与缓存共用数据，不能原地修改输出），默认reflink或复制")
+    parser.add_argument("--full-hash", action="store_true",
+                        help="结果缓存用完整哈希识别输入（读取整个文件，用于校验），默认只读取抽样块")
+    
+    # 短视频快速通道参数
+    parser.add_argument("--small-clips", type=int, default=0, metavar="N",
+                        help="批量转换时把短视频每N个合并为一次FFmpeg调用，减少每个文件的启动开销")
+    parser.add_argument("--small-clip-seconds", type=float, default=SMALL_CLIP_SECONDS,
+                        help=f"走快速通道的短视频的最大时长（秒），默认{SMALL_CLIP_SECONDS}")
+    
+    # 迁移计划参数
+    parser.add_argument("--plan", action="store_true",
+                        help="只扫描和探测不编码：按批量转换的处理方式归类每个文件并给出重新封装/排除建议，"
+                             "估算输出大小、节省的空间、CPU小时数和--workers个并发的耗时；--catalog只读不写")
+    parser.add_argument("--plan-output", default="migration_plan.csv",
+                        help="迁移计划文件，扩展名为.json时写出JSON（含汇总），否则为CSV，默认migration_plan.csv")
+    
+    # 日志参数
+    parser.add_argument("--log-file", default="video_conversion.log",
+                        help="日志文件，超过--log-max-size时轮转（保留5个旧文件），默认video_conversion.log")
+    parser.add_argument("--log-max-size", default="10M", help="日志文件的大小上限，默认10M")
+    parser.add_argument("--log-level", default="info", choices=["debug", "info", "warning", "error"],
+                        help="默认日志级别，默认info")
+    parser.add_argument("--log-levels", help="各类日志的级别，如'ffmpeg=debug,library_catalog=warning'"
+                                             "（ffmpeg为FFmpeg的输出，限速记录）")
     
     # 解析命令行参数
     args = parser.parse_args()
+    for option in ("log_max_size", "memory_budget", "cache_max_size", "min_size"):
+        value = getattr(args, option)
+        if value:
+            try:
+                parse_size(value)
+            except ValueError:
+                parser.error(f"--{option.replace('_', '-')} 不是有效的大小: {value}")
+    try:
+        category_levels = parse_levels(args.log_levels)
+    except ValueError as e:
+        parser.error(str(e))
+    log_max_bytes = parse_size(args.log_max_size)
+    setup_logging(args.log_file, level=getattr(logging, args.log_level.upper()),
+                  category_levels=category_levels, max_bytes=log_max_bytes)
+    if args.watch and not args.directory:
+        parser.error("--watch 需要配合 -d/--directory 使用")
+    if args.catalog_query and not args.catalog:
+        parser.error("--catalog-query 需要配合 --catalog 使用")
+    if (args.full_rescan or args.retry_failed) and not args.catalog:
+        parser.error("--full-rescan/--retry-failed 需要配合 --catalog 使用")
+    if args.input == "-" and not args.output:
+        parser.error("从标准输入读取时需要用 -o 指定输出（\"-\"表示标准输出）")
+    if args.memory_budget and (not args.directory or args.watch):
+        parser.error("--memory-budget 只用于批量转换（-d/--directory）")
+    if args.deadline and (not args.directory or args.watch):
+        parser.error("--deadline 只用于批量转换（-d/--directory）")
+    if args.plan and (not args.directory or args.watch):
+        parser.error("--plan 只用于批量转换（-d/--directory）")
+    if args.small_clips and (not args.directory or args.watch):
+        parser.error("--small-clips 只用于批量转换（-d/--directory）")
+    if args.small_clips and (args.memory_budget or args.deadline):
+        parser.error("--small-clips 不能与 --memory-budget、--deadline 同时使用")
+    deadline = None
+    if args.deadline:
+        try:
+            deadline = parse_deadline(args.deadline)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.workers is None:
+        args.workers = len(available_cpus()) if args.memory_budget else 1
     print(f"命令行参数解析完成，输入文件: {args.input}, 输出文件: {args.output}")
     
+    # 查询视频库目录不需要FFmpeg
+    if args.catalog_query:
+        catalog = LibraryCatalog(args.catalog)
+        rows = catalog.query(codec=args.codec,
+                             min_size=parse_size(args.min_size) if args.min_size else None,
+                             status=args.status)
+        for row in rows:
+            print(f"{row['status']:<10} {row['codec'] or '-':<6} {row['size']/1024/1024:>10.2f} MB  {row['path']}")
+        print(f"\n共 {len(rows)} 个文件，合计 {sum(row['size'] for row in rows)/1024/1024/1024:.2f} GB")
+        return
+    
     # 检查FFmpeg是否安装
-    if not check_ffmpeg_installed():
+    capabilities = check_ffmpeg_installed()
+    if not capabilities:
         logger.error("错误: 未找到FFmpeg。请先安装FFmpeg工具。")
         logger.error("macOS用户可以使用Homebrew安装: brew install ffmpeg")
         logger.error("Windows用户可以从官方网站下载: https://ffmpeg.org/download.html")
         logger.error("Linux用户可以使用包管理器安装: sudo apt-get install ffmpeg")
         sys.exit(1)
+    # 开始转换前确认所需的编码器存在，避免每个文件都失败（探测超时、编码器未知时不检查）
+    if capabilities.partial:
+        logger.warning("FFmpeg功能未知，跳过编码器检查")
+    elif not capabilities.has_x265:
+        logger.error("错误: 当前FFmpeg未编译libx265，无法编码H.265。请安装包含libx265的FFmpeg。")
+        sys.exit(1)
+    elif args.audio_codec != "copy" and not capabilities.has_encoder(args.audio_codec):
+        logger.error(f"错误: 当前FFmpeg不支持音频编码器: {args.audio_codec}")
+        sys.exit(1)
+    
+    # 第一次Ctrl-C/SIGTERM等待进行中的转换完成，第二次立即终止
+    shutdown = ShutdownController()
+    if not (args.input and (is_stream_path(args.input) or is_stream_path(args.output))):
+        shutdown.install()
+    
+    # 进程优先级和CPU绑定
+    cpus = parse_cpu_list(args.cpu_affinity) if args.cpu_affinity else None
+    priority = ProcessPriority(args.nice, args.io_class, args.io_level, cpus)
+    core_allocator = CoreAllocator(args.pin_cores, cpus) if args.pin_cores else None
+    result_cache = ResultCache(args.cache_dir, parse_size(args.cache_max_size),
+                               full_hash=args.full_hash, hardlink=args.cache_hardlink) if args.result_cache else None
     
     # 提取FFmpeg参数
     ffmpeg_args = {
@@ -337,21 +1693,42 @@ def main():
         "preset": args.preset,
         "audio_codec": args.audio_codec,
         "audio_bitrate": args.audio_bitrate,
-        "threads": args.threads
+        "threads": args.threads,
+        "scratch_dir": args.scratch_dir,
+        "moov_mode": args.moov_mode,
+        "priority": priority,
+        "core_allocator": core_allocator,
+        "result_cache": result_cache,
+        "checkpoint": args.checkpoint,
+        "segment_seconds": args.segment_seconds
     }
     
     logger.info(f"使用FFmpeg引擎进行转换")
     
     # 执行转换
-    if args.input:
+    if args.input and (is_stream_path(args.input) or is_stream_path(args.output)):
+        # 流式转换模式
+        logger.info(f"流式转换模式")
+        stream_args = {key: value for key, value in ffmpeg_args.items()
+                       if key not in ("scratch_dir", "moov_mode", "core_allocator", "result_cache",
+                                      "checkpoint", "segment_seconds")}
+        with (core_allocator.acquire() if core_allocator else contextlib.nullcontext()) as cores:
+            if cores:
+                stream_args["priority"] = priority.with_cpus(cores)
+            success = convert_stream(args.input, args.output, duration=args.duration,
+                                     input_format=args.input_format, **stream_args)
+        if not success:
+            logger.error("转换失败！")
+            sys.exit(1)
+    elif args.input:
         # 单个文件转换模式
         if not args.output:
             # 如果未指定输出文件，自动生成
             base_name, ext = os.path.splitext(args.input)
-            args.output = f"{base_name}_h265{ext}"
+            args.output = f"{base_name}_h265{output_extension(ext)}"
         
         logger.info(f"单个文件转换模式")
-        success = convert_h264_to_h265(args.input, args.output, **ffmpeg_args)
+        success = convert_h264_to_h265(args.input, args.output, cancel_event=shutdown.cancel_event, **ffmpeg_args)
         
         if success:
             logger.info("转换完成！")
@@ -362,17 +1739,82 @@ def main():
             logger.error("转换失败！")
             print(f"\n❌ 转换失败！请查看日志获取详细信息。")
             sys.exit(1)
+    elif args.serve:
+        # 任务服务模式
+        from job_server import JobService, serve
+        
+        logger.info(f"任务服务模式 - 端口: {args.port}, 工作线程: {args.workers}")
+        service = JobService(args.state_file, workers=args.workers, max_queue=args.max_queue, **ffmpeg_args)
+        serve(service, args.port, shutdown=shutdown)
+        if shutdown.cancelled:
+            sys.exit(130)
+    elif args.plan:
+        # 迁移计划模式：只探测不编码
+        from migration_plan import plan_library
+        
+        logger.info(f"迁移计划模式 - 目录: {args.directory}, 递归: {args.recursive}")
+        plan_library(args.directory, args.plan_output, args.recursive,
+                     include=args.include,
+                     exclude=args.exclude,
+                     include_hidden=args.include_hidden,
+                     probe_workers=args.probe_workers,
+                     catalog=LibraryCatalog(args.catalog) if args.catalog else None,
+                     state_file=args.state_file,
+                     workers=args.workers,
+                     crf=args.crf,
+                     preset=args.preset,
+                     audio_codec=args.audio_codec,
+                     audio_bitrate=args.audio_bitrate,
+                     threads=args.threads)
+    elif args.watch:
+        # 监视文件夹模式
+        from watch_folder import FolderWatcher
+        
+        logger.info(f"监视文件夹模式 - 目录: {args.directory}, 递归: {args.recursive}")
+        watcher = FolderWatcher(args.directory, args.recursive,
+                                stable_seconds=args.stable_seconds,
+                                workers=args.workers,
+                                state_file=args.state_file,
+                                include_hidden=args.include_hidden,
+                                cancel_event=shutdown.cancel_event,
+                                **ffmpeg_args)
+        shutdown.on_drain(watcher.stop)
+        success_count = watcher.run()
+        print(f"\n📊 监视期间成功转换: {success_count} 个文件")
+        if shutdown.stop_requested:
+            sys.exit(130)
     elif args.directory:
         # 批量转换模式
         logger.info(f"批量转换模式 - 目录: {args.directory}, 递归: {args.recursive}")
-        success_count = batch_convert(args.directory, args.recursive, **ffmpeg_args)
+        catalog = LibraryCatalog(args.catalog) if args.catalog else None
+        success_count = batch_convert(args.directory, args.recursive,
+                                      catalog=catalog,
+                                      full_rescan=args.full_rescan,
+                                      retry_failed=args.retry_failed,
+                                      include_hidden=args.include_hidden,
+                                      include=args.include,
+                                      exclude=args.exclude,
+                                      workers=args.workers,
+                                      probe_workers=args.probe_workers,
+                                      shutdown=shutdown,
+                                      state_file=args.state_file,
+                                      memory_budget=parse_size(args.memory_budget) if args.memory_budget else None,
+                                      memory_history=MemoryHistory(args.memory_history or default_history_file())
+                                      if args.memory_budget else None,
+                                      deadline=deadline,
+                                      small_clips=args.small_clips,
+                                      small_clip_seconds=args.small_clip_seconds,
+                                      **ffmpeg_args)
         
         print(f"\n📊 批量转换统计:")
         print(f"目录: {args.directory}")
         print(f"递归扫描: {'是' if args.recursive else '否'}")
         print(f"成功转换: {success_count} 个文件")
         
-        if success_count > 0:
+        if shutdown.stop_requested:
+            print("\n⚠️  批量转换被中断")
+            sys.exit(130)
+        elif success_count > 0:
             print("\n✅ 批量转换完成！")
         else:
             logger.warning("没有成功转换的文件")
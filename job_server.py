@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地HTTP转换任务服务
+
+其他程序通过REST接口提交转换任务，不需要登录编码机器执行命令。
+任务在固定数量的工作线程中执行，队列持久化保存在磁盘上，重启后继续执行未完成的任务；
+排队的任务达到上限时拒绝新任务（HTTP 429）。服务只监听本机地址。
+
+浏览器中的网页也能访问本机地址，所以修改任务的请求必须是Content-Type: application/json
+（网页跨域发送这种请求需要预检，服务不响应预检），Host不是本机地址的请求（DNS重绑定）一律拒绝。
+不覆盖已存在的文件。
+
+接口:
+    POST   /jobs               提交任务，JSON: {"input": 路径, "output": 可选路径（不能已存在）, "params": {"crf": 28, ...}}
+    GET    /jobs               任务列表（含历史），可用 ?status=queued 过滤
+    GET    /jobs/<id>          任务状态和进度
+    POST   /jobs/<id>/cancel   取消任务（DELETE /jobs/<id> 相同）
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import index
+from mp4_layout import MOOV_MODES
+
+logger = logging.getLogger(__name__)
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# 请求头Host允许的主机名
+ALLOWED_HOSTS = (HOST, "localhost")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+FINISHED_STATUSES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+# 保存的已结束任务数，更早的历史会被丢弃
+MAX_HISTORY = 1000
+# 排队已满时建议客户端等待的秒数
+RETRY_AFTER_SECONDS = 30
+
+def default_queue_file():
+    """任务队列文件，默认为 ~/.cache/video-optimizer/job_server.json"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "video-optimizer", "job_server.json")
+
+class QueueFullError(Exception):
+    """排队的任务已达到上限"""
+
+class JobParamError(ValueError):
+    """提交的任务参数无效"""
+
+def validate_params(params):
+    """
+    检查客户端提交的转换参数（convert_h264_to_h265的参数的子集）
+
+    Args:
+        params: 客户端提交的参数字典
+
+    Returns:
+        dict: 可以传给convert_h264_to_h265的参数
+
+    Raises:
+        JobParamError: 参数无效
+    """
+    if not isinstance(params, dict):
+        raise JobParamError("params必须是JSON对象")
+    result = {}
+    for key, value in params.items():
+        if key == "crf":
+            if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 51:
+                raise JobParamError("crf必须是0-51的整数")
+        elif key == "threads":
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise JobParamError("threads必须是非负整数")
+        elif key == "preset":
+            if value not in index.FFMPEG_PRESETS:
+                raise JobParamError(f"preset必须是以下之一: {', '.join(index.FFMPEG_PRESETS)}")
+        elif key == "moov_mode":
+            if value not in MOOV_MODES:
+                raise JobParamError(f"moov_mode必须是以下之一: {', '.join(MOOV_MODES)}")
+        elif key == "audio_codec":
+            if not isinstance(value, str) or not re.fullmatch(r"[\w-]+", value):
+                raise JobParamError("audio_codec无效")
+        elif key == "audio_bitrate":
+            if not isinstance(value, str) or not re.fullmatch(r"\d+[kKmM]?", value):
+                raise JobParamError("audio_bitrate无效，如'128k'")
+        else:
+            raise JobParamError(f"不支持的参数: {key}")
+        result[key] = value
+    return result
+
+class JobService:
+    """
+    持久化的任务队列和工作线程池
+
+    Args:
+        queue_file: 任务队列文件路径
+        workers: 同时进行的转换数量
+        max_queue: 最多排队的任务数，超过时submit()抛出QueueFullError
+        **kwargs: 传递给convert_h264_to_h265的默认参数（客户端参数会覆盖其中的同名项）
+    """
+
+    def __init__(self, queue_file=None, workers=1, max_queue=100, **kwargs):
+        self.queue_file = queue_file or default_queue_file()
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.convert_kwargs = kwargs
+        self._jobs = {}
+        self._cancel_events = {}
+        self._cancel_requested = set()
+        self._condition = threading.Condition()
+        self._accepting = True
+        self._stopping = False
+        self._threads = []
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.queue_file):
+            return
+        try:
+            with open(self.queue_file, "r", encoding="utf-8") as f:
+                jobs = json.load(f).get("jobs", [])
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取任务队列失败，将使用空队列: {str(e)}")
+            return
+        requeued = 0
+        for job in jobs:
+            # 上次退出时正在转换的任务重新排队
+            if job["status"] == JOB_RUNNING:
+                job.update(status=JOB_QUEUED, progress=None, started=None)
+                requeued += 1
+            self._jobs[job["id"]] = job
+        logger.info(f"已加载任务队列: {len(self._jobs)} 个任务，{requeued} 个中断的任务重新排队")
+
+    def _save(self):
+        """写入磁盘（调用方持有self._condition）"""
+        finished = [job for job in self._jobs.values() if job["status"] in FINISHED_STATUSES]
+        for job in finished[:-MAX_HISTORY]:
+            del self._jobs[job["id"]]
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.queue_file)), exist_ok=True)
+            temp_file = f"{self.queue_file}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump({"jobs": list(self._jobs.values())}, f, ensure_ascii=False, indent=1)
+            os.replace(temp_file, self.queue_file)
+        except OSError as e:
+            logger.error(f"保存任务队列失败: {str(e)}")
+
+    def _counts(self):
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for job in self._jobs.values():
+            counts[job["status"]] += 1
+        return counts
+
+    def submit(self, input_file, output_file=None, params=None):
+        """
+        提交转换任务
+
+        Args:
+            input_file: 输入文件路径
+            output_file: 输出文件路径，None表示在输入文件旁自动生成
+            params: 转换参数（见validate_params）
+
+        Returns:
+            dict: 任务信息
+
+        Raises:
+            JobParamError: 参数无效、输入文件不存在或输出文件已存在
+            QueueFullError: 排队的任务已达到上限
+        """
+        if not isinstance(input_file, str) or not input_file:
+            raise JobParamError("缺少input")
+        input_file = os.path.abspath(input_file)
+        if not os.path.isfile(input_file):
+            raise JobParamError(f"输入文件不存在: {input_file}")
+        if output_file is not None and (not isinstance(output_file, str) or not output_file):
+            raise JobParamError("output必须是文件路径")
+        output_file = os.path.abspath(output_file) if output_file else None
+        if output_file == input_file:
+            raise JobParamError("输出文件不能与输入文件相同")
+        params = validate_params(params or {})
+
+        with self._condition:
+            if not self._accepting:
+                raise QueueFullError("服务正在停止")
+            if self._counts()[JOB_QUEUED] >= self.max_queue:
+                raise QueueFullError(f"排队的任务已达到上限 {self.max_queue}")
+            # 排队中和转换中的任务占用的输出路径
+            reserved = {job["output_file"] for job in self._jobs.values() if job["status"] not in FINISHED_STATUSES}
+            if output_file is None:
+                output_file = index.make_output_path(input_file, reserved)
+            elif output_file in reserved:
+                raise JobParamError(f"输出文件已被其他任务使用: {output_file}")
+            elif os.path.exists(output_file):
+                raise JobParamError(f"输出文件已存在: {output_file}")
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "input_file": input_file,
+                "output_file": output_file,
+                "params": params,
+                "status": JOB_QUEUED,
+                "progress": None,
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+                "input_size": os.path.getsize(input_file),
+                "output_size": None,
+                "error": None,
+            }
+            self._jobs[job["id"]] = job
+            self._save()
+            self._condition.notify()
+            logger.info(f"已提交任务 {job['id']}: {input_file} -> {output_file}")
+            return dict(job)
+
+    def get(self, job_id):
+        """任务信息，不存在时返回None"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, status=None):
+        """按提交顺序返回任务列表"""
+        with self._condition:
+            return [dict(job) for job in self._jobs.values() if status is None or job["status"] == status]
+
+    def stats(self):
+        with self._condition:
+            return {"workers": self.workers, "max_queue": self.max_queue, "jobs": self._counts()}
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的直接取消，转换中的终止ffmpeg
+
+        Returns:
+            dict: 任务信息，不存在时返回None；已结束的任务原样返回
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == JOB_QUEUED:
+                job.update(status=JOB_CANCELLED, finished=time.time())
+                self._save()
+                logger.info(f"已取消排队中的任务 {job_id}")
+            elif job["status"] == JOB_RUNNING:
+                self._cancel_requested.add(job_id)
+                self._cancel_events[job_id].set()
+                logger.info(f"正在终止任务 {job_id}")
+            return dict(job)
+
+    def _next_job(self):
+        """等待下一个排队的任务，停止时返回None"""
+        with self._condition:
+            while True:
+                if self._stopping:
+                    return None
+                job = next((job for job in self._jobs.values() if job["status"] == JOB_QUEUED), None)
+                if job is not None:
+                    job.update(status=JOB_RUNNING, started=time.time(), progress=0.0)
+                    self._cancel_events[job["id"]] = threading.Event()
+                    self._save()
+                    return job
+                self._condition.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job["id"]
+        cancel_event = self._cancel_events[job_id]
+
+        def on_progress(position, duration):
+            if duration:
+                job["progress"] = round(min(100.0, position / duration * 100), 1)
+
+        kwargs = dict(self.convert_kwargs, **job["params"])
+        logger.info(f"开始执行任务 {job_id}: {job['input_file']}")
+        try:
+            if os.path.exists(job["output_file"]):
+                # 排队期间出现的文件同样不覆盖
+                raise JobParamError(f"输出文件已存在: {job['output_file']}")
+            success = index.convert_h264_to_h265(job["input_file"], job["output_file"],
+                                                 cancel_event=cancel_event, progress_callback=on_progress,
+                                                 **kwargs)
+            error = None if success else "转换失败，详见服务日志"
+        except Exception as e:
+            logger.error(f"任务 {job_id} 出错: {str(e)}")
+            success, error = False, str(e)
+
+        with self._condition:
+            del self._cancel_events[job_id]
+            if job_id in self._cancel_requested:
+                self._cancel_requested.discard(job_id)
+                job.update(status=JOB_CANCELLED, finished=time.time())
+            elif not success and cancel_event.is_set():
+                # 服务停止时被终止的任务重新排队，下次启动时继续
+                job.update(status=JOB_QUEUED, progress=None, started=None)
+            elif success:
+                job.update(status=JOB_DONE, progress=100.0, finished=time.time(),
+                           output_size=os.path.getsize(job["output_file"]))
+            else:
+                job.update(status=JOB_FAILED, finished=time.time(), error=error)
+            self._save()
+        logger.info(f"任务 {job_id} 结束: {job['status']}")
+
+    def start(self):
+        """启动工作线程"""
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, cancel_event=None):
+        """
+        停止服务：不再接受和开始新任务，等待进行中的转换完成
+
+        Args:
+            cancel_event: threading.Event，等待期间被设置时终止进行中的转换（任务重新排队）
+        """
+        with self._condition:
+            self._accepting = False
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(timeout=0.2)
+                if cancel_event is not None and cancel_event.is_set():
+                    with self._condition:
+                        for event in self._cancel_events.values():
+                            event.set()
+        logger.info("任务服务已停止")
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """REST接口，self.server.service 为 JobService"""
+
+    server_version = "H265JobServer/1.0"
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        """返回 (路径片段列表, 查询参数)"""
+        url = urlsplit(self.path)
+        return [part for part in url.path.split("/") if part], parse_qs(url.query)
+
+    def _rejected(self, require_json=False):
+        """
+        拒绝可能来自浏览器中其他网页的请求
+
+        Args:
+            require_json: 修改任务的请求，要求Content-Type为application/json
+
+        Returns:
+            bool: 已拒绝（已发送403/415响应）
+        """
+        host = self.headers.get("Host")
+        if host is not None and urlsplit(f"//{host}").hostname not in ALLOWED_HOSTS:
+            self._send(403, {"error": f"Host必须是本机地址: {host}"})
+            return True
+        if require_json and self.headers.get_content_type() != "application/json":
+            self._send(415, {"error": "请求的Content-Type必须是application/json"})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._rejected():
+            return
+        parts, query = self._route()
+        service = self.server.service
+        if parts == ["jobs"]:
+            status = query.get("status", [None])[0]
+            if status is not None and status not in JOB_STATUSES:
+                self._send(400, {"error": f"status必须是以下之一: {', '.join(JOB_STATUSES)}"})
+                return
+            self._send(200, {"jobs": service.list(status)})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = service.get(parts[1])
+            if job is None:
+                self._send(404, {"error": "任务不存在"})
+            else:
+                self._send(200, job)
+        elif parts == ["stats"]:
+            self._send(200, service.stats())
+        else:
+            self._send(404, {"error": "接口不存在"})
+
+    def do_POST(self):
+        if self._rejected(require_json=True):
+            return
+        parts, _ = self._route()
+        if parts == ["jobs"]:
+            self._submit()
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            self._cancel(parts[1])
+        else:
+            self._send(404, {"error": "接口不存在"})
+
+    def do_DELETE(self):
+        if self._rejected():
+            return
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == "jobs":
+            self._cancel(parts[1])
+        else:
+            self._send(404, {"error": "接口不存在"})
+
+    def _submit(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(data, dict):
+                raise JobParamError("请求体必须是JSON对象")
+            job = self.server.service.submit(data.get("input"), data.get("output"), data.get("params"))
+        except (ValueError, JobParamError) as e:
+            self._send(400, {"error": str(e)})
+        except QueueFullError as e:
+            self._send(429, {"error": str(e)}, {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        else:
+            self._send(201, job, {"Location": f"/jobs/{job['id']}"})
+
+    def _cancel(self, job_id):
+        job = self.server.service.cancel(job_id)
+        if job is None:
+            self._send(404, {"error": "任务不存在"})
+        elif job["status"] in FINISHED_STATUSES:
+            self._send(409, {"error": f"任务已结束: {job['status']}", "job": job})
+        else:
+            self._send(200, job)
+
+def serve(service, port=DEFAULT_PORT, shutdown=None):
+    """
+    在本机地址上运行服务，直到收到停止信号
+
+    Args:
+        service: JobService
+        port: 监听端口，0表示随机端口
+        shutdown: ShutdownController，第一次信号后停止接受任务并等待进行中的转换，第二次终止转换
+    """
+    httpd = ThreadingHTTPServer((HOST, port), JobRequestHandler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    service.start()
+    thread = threading.Thread(target=httpd.serve_forever, name="job-server", daemon=True)
+    thread.start()
+    address = f"http://{HOST}:{httpd.server_address[1]}"
+    logger.info(f"任务服务已启动: {address}，工作线程: {service.workers}，最多排队: {service.max_queue}")
+    print(f"🌐 任务服务已启动: {address}（按Ctrl-C停止）")
+    try:
+        if shutdown is not None:
+            while not shutdown.draining.wait(1):
+                pass
+        else:
+            thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        print("⚠️  任务服务正在停止，等待进行中的转换完成...")
+        service.stop(shutdown.cancel_event if shutdown is not None else None)
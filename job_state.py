@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转换任务的持久化状态记录
+记录已处理文件及处理时的大小、修改时间和抽样哈希，重启或恢复后不会重复转换已完成的文件
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from content_hash import file_hash
+
+logger = logging.getLogger(__name__)
+
+class JobState:
+    """
+    已处理文件的记录
+
+    以文件路径为键，记录处理时的大小、修改时间和抽样哈希；文件内容变化后会重新处理。
+    只有修改时间变化（如复制时没有保留时间）而内容不变的文件仍视为已处理。
+
+    Args:
+        state_file: 状态文件路径，None表示只保存在内存中（可以稍后用save()写入磁盘）
+    """
+
+    def __init__(self, state_file=None):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.pending = []
+        if state_file and os.path.exists(state_file):
+            try:
+                with open(state_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                # 兼容只包含文件记录的旧格式
+                if "entries" in data:
+                    self._entries = data["entries"]
+                    self.pending = data.get("pending", [])
+                else:
+                    self._entries = data
+                logger.info(f"已加载任务状态: {len(self._entries)} 条记录")
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取任务状态失败，将重新开始: {str(e)}")
+
+    def is_handled(self, path, st):
+        """文件是否已以当前的内容处理过"""
+        with self._lock:
+            entry = self._entries.get(path)
+        if not entry or entry["size"] != st.st_size:
+            return False
+        if entry["mtime"] == st.st_mtime:
+            return True
+        if not entry.get("hash"):
+            return False
+        try:
+            return file_hash(path, st=st) == entry["hash"]
+        except OSError:
+            return False
+
+    def record(self, path, st, status, output_file=None):
+        """记录处理结果，有状态文件时立即写入磁盘"""
+        try:
+            digest = file_hash(path, st=st)
+        except OSError:
+            digest = None
+        with self._lock:
+            self._entries[path] = {
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "hash": digest,
+                "status": status,
+                "output": output_file,
+                "time": time.time()
+            }
+            if self.state_file:
+                self._save(self.state_file)
+
+    def resume_first(self, probed_files, probe):
+        """
+        先处理上次被中断时未完成的文件，再处理其余文件
+
+        上次的列表只使用一次：取出后清空，之后写入的状态不再包含它。
+
+        Args:
+            probed_files: (路径, 视频信息) 的可迭代对象
+            probe: 探测函数，参数为文件路径，返回视频信息
+
+        Yields:
+            tuple: (路径, 视频信息)，每个文件只出现一次
+        """
+        with self._lock:
+            pending, self.pending = self.pending, []
+        resumed = set()
+        for path in pending:
+            if path in resumed or not os.path.isfile(path):
+                continue
+            resumed.add(path)
+            logger.info(f"优先处理上次未完成的文件: {path}")
+            yield path, probe(path)
+        for path, info in probed_files:
+            if path not in resumed:
+                yield path, info
+
+    def save(self, state_file=None, pending=None):
+        """
+        写入磁盘
+
+        Args:
+            state_file: 状态文件路径，None表示使用构造时指定的路径
+            pending: 尚未完成的文件列表，恢复时由resume_first()优先处理
+        """
+        with self._lock:
+            if state_file:
+                self.state_file = state_file
+            if pending is not None:
+                self.pending = list(pending)
+            self._save(self.state_file)
+
+    def _save(self, state_file):
+        temp_file = f"{state_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"entries": self._entries, "pending": self.pending}, f, ensure_ascii=False, indent=1)
+        os.replace(temp_file, state_file)
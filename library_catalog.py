@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频库持久化目录（SQLite）
+
+记录已扫描根目录下每个目录的修改时间、每个文件的标识（设备号、inode、大小、修改时间）、
+内容哈希、探测信息和转换状态。再次扫描时只列出修改时间变化过的目录，只探测新增或变化的文件，
+夜间增量扫描只需几秒钟；也可以直接查询，如"所有超过1GB、尚未转换的H.264文件"。
+
+注意：原地改写已有文件不会改变所在目录的修改时间，这类变化需要 full=True 的全量扫描
+（命令行的--full-rescan）才能发现。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from video_scanner import matches_patterns, is_skipped_dir
+
+logger = logging.getLogger(__name__)
+
+# 文件状态
+STATUS_NEW = "new"              # 已发现，尚未探测
+STATUS_PENDING = "pending"      # 需要转换
+STATUS_HEVC = "hevc"            # 已经是H.265，跳过
+STATUS_CONVERTED = "converted"  # 已转换
+STATUS_FAILED = "failed"        # 转换失败
+STATUSES = (STATUS_NEW, STATUS_PENDING, STATUS_HEVC, STATUS_CONVERTED, STATUS_FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY,
+    recursive INTEGER NOT NULL,
+    last_scan REAL
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    dev INTEGER,
+    ino INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    codec TEXT,
+    width INTEGER,
+    height INTEGER,
+    duration REAL,
+    status TEXT NOT NULL,
+    output TEXT,
+    updated_at REAL,
+    content_hash TEXT,
+    fps REAL,
+    has_audio INTEGER,
+    audio_codec TEXT,
+    audio_bitrate INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE INDEX IF NOT EXISTS files_status ON files(status);
+"""
+# 旧版本创建的数据库缺少的列
+_ADDED_COLUMNS = [
+    ("content_hash", "TEXT"),
+    ("fps", "REAL"),
+    ("has_audio", "INTEGER"),
+    ("audio_codec", "TEXT"),
+    ("audio_bitrate", "INTEGER"),
+]
+
+class LibraryCatalog:
+    """
+    视频库目录
+
+    Args:
+        db_path: SQLite数据库文件路径
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # 转换线程会回写状态，所有访问通过同一把锁串行化
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        # 旧版本创建的数据库缺少后来增加的列
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(files)")}
+        for name, column_type in _ADDED_COLUMNS:
+            if name not in columns:
+                self._db.execute(f"ALTER TABLE files ADD COLUMN {name} {column_type}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_content_hash ON files(content_hash)")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def rescan(self, root, recursive=False, include=None, exclude=None, is_video=None, full=False,
+               include_hidden=False):
+        """
+        增量扫描根目录，逐个产出新增或变化的视频文件
+
+        修改时间未变的目录不再列出内容，只按记录的子目录继续向下；
+        已删除的文件和目录会从目录中移除。
+
+        Args:
+            root: 根目录
+            recursive: 是否递归扫描子目录
+            include: 包含的glob模式列表
+            exclude: 排除的glob模式列表
+            is_video: 判断文件名是否为视频文件的函数
+            full: 忽略目录修改时间，全部重新列出
+            include_hidden: 也扫描隐藏目录（见video_scanner.is_skipped_dir）
+
+        Yields:
+            str: 新增或变化的文件路径（已以STATUS_NEW写入目录，探测后调用record_probe）
+        """
+        root = os.path.abspath(root)
+        include = include or []
+        exclude = exclude or []
+        listed = 0
+        skipped = 0
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                dir_mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                self._forget_tree(directory)
+                continue
+
+            with self._lock:
+                row = self._db.execute("SELECT mtime_ns, subdirs FROM dirs WHERE path = ?", (directory,)).fetchone()
+            if row and row["mtime_ns"] == dir_mtime and not full:
+                skipped += 1
+                if recursive:
+                    stack.extend(json.loads(row["subdirs"]))
+                continue
+
+            listed += 1
+            subdirs = []
+            present = {}
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        rel_path = os.path.relpath(entry.path, root)
+                        if exclude and matches_patterns(exclude, rel_path, entry.name):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not is_skipped_dir(entry.name, include_hidden):
+                                    subdirs.append(entry.path)
+                                continue
+                            if not entry.is_file():
+                                continue
+                            if is_video and not is_video(entry.name):
+                                continue
+                            if include and not matches_patterns(include, rel_path, entry.name):
+                                continue
+                            present[entry.path] = entry.stat()
+                        except OSError:
+                            continue
+            except OSError as e:
+                logger.warning(f"扫描目录失败: {directory}: {str(e)}")
+                continue
+
+            changed = self._sync_directory(directory, dir_mtime, subdirs, present)
+            for path in changed:
+                yield path
+            if recursive:
+                stack.extend(subdirs)
+
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO roots (path, recursive, last_scan) VALUES (?, ?, ?)",
+                             (root, int(recursive), time.time()))
+            self._db.commit()
+        logger.info(f"目录扫描完成: 列出 {listed} 个目录，跳过 {skipped} 个未变化的目录")
+
+    def _sync_directory(self, directory, dir_mtime, subdirs, present):
+        """把目录的最新内容写入数据库，返回新增或变化的文件"""
+        changed = []
+        now = time.time()
+        with self._lock:
+            known = {row["path"]: row for row in
+                     self._db.execute("SELECT path, dev, ino, size, mtime_ns FROM files WHERE dir = ?", (directory,))}
+            for path, st in present.items():
+                row = known.get(path)
+                if row and (row["dev"], row["ino"], row["size"], row["mtime_ns"]) == \
+                        (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns):
+                    continue
+                self._db.execute(
+                    "INSERT OR REPLACE INTO files (path, dir, dev, ino, size, mtime_ns, status, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, directory, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, STATUS_NEW, now))
+                changed.append(path)
+            for path in set(known) - set(present):
+                self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+            # 已删除的子目录
+            row = self._db.execute("SELECT subdirs FROM dirs WHERE path = ?", (directory,)).fetchone()
+            removed_subdirs = set(json.loads(row["subdirs"])) - set(subdirs) if row else set()
+            self._db.execute("INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs) VALUES (?, ?, ?)",
+                             (directory, dir_mtime, json.dumps(subdirs, ensure_ascii=False)))
+            self._db.commit()
+        for subdir in removed_subdirs:
+            self._forget_tree(subdir)
+        return changed
+
+    def _forget_tree(self, directory):
+        """移除目录及其下所有记录"""
+        prefix = directory.rstrip(os.sep) + os.sep
+        like = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self._lock:
+            self._db.execute("DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (directory, like))
+            self._db.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (directory, like))
+            self._db.commit()
+
+    def record_probe(self, path, info, content_hash=None):
+        """
+        记录探测结果，并据此设置状态（H.265文件标记为跳过，其他标记为待转换）
+
+        Args:
+            path: 文件路径
+            info: get_video_info返回的字典，None表示探测失败
+            content_hash: 文件的抽样哈希（见content_hash.py），用于识别移动或复制的文件
+        """
+        info = info or {}
+        codec = info.get("codec")
+        status = STATUS_FAILED if not info else STATUS_HEVC if codec == "hevc" else STATUS_PENDING
+        has_audio = info.get("has_audio")
+        with self._lock:
+            self._db.execute("UPDATE files SET codec = ?, width = ?, height = ?, duration = ?, fps = ?, "
+                             "has_audio = ?, audio_codec = ?, audio_bitrate = ?, status = ?, "
+                             "updated_at = ?, content_hash = ? WHERE path = ?",
+                             (codec, info.get("width"), info.get("height"), info.get("duration"), info.get("fps"),
+                              None if has_audio is None else int(has_audio), info.get("audio_codec"),
+                              info.get("audio_bitrate"), status, time.time(), content_hash, path))
+            self._db.commit()
+
+    def find_probed(self, content_hash, size):
+        """
+        内容相同且已探测过的文件（如被移动、重命名或复制的文件），用于代替重新探测
+
+        Returns:
+            dict: 文件记录，没有时返回None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM files WHERE content_hash = ? AND size = ? AND codec IS NOT NULL "
+                                   "LIMIT 1", (content_hash, size)).fetchone()
+        return dict(row) if row else None
+
+    def get(self, path):
+        """
+        文件的记录
+
+        Returns:
+            dict: 字段与files表一致，没有记录时返回None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM files WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        return dict(row) if row else None
+
+    def set_status(self, path, status, output=None):
+        """更新文件的转换状态"""
+        with self._lock:
+            self._db.execute("UPDATE files SET status = ?, output = ?, updated_at = ? WHERE path = ?",
+                             (status, output, time.time(), path))
+            self._db.commit()
+
+    def query(self, root=None, codec=None, min_size=None, max_size=None, status=None, limit=None):
+        """
+        查询目录中的文件
+
+        Args:
+            root: 只返回该目录下的文件
+            codec: 视频编码，如 "h264"
+            min_size: 最小文件大小（字节）
+            max_size: 最大文件大小（字节）
+            status: 状态，见STATUSES
+            limit: 最多返回的条数
+
+        Returns:
+            list: 字典列表，字段与files表一致
+        """
+        conditions = []
+        params = []
+        if root:
+            root = os.path.abspath(root)
+            prefix = root.rstrip(os.sep) + os.sep
+            conditions.append("(dir = ? OR dir LIKE ? ESCAPE '\\')")
+            params.extend([root, prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"])
+        if codec:
+            conditions.append("codec = ?")
+            params.append(codec)
+        if min_size is not None:
+            conditions.append("size >= ?")
+            params.append(min_size)
+        if max_size is not None:
+            conditions.append("size <= ?")
+            params.append(max_size)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        sql = "SELECT * FROM files"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY path"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params)]
+
+    @staticmethod
+    def to_video_info(row):
+        """把目录记录转换为get_video_info格式的字典，避免重复探测"""
+        return {
+            "codec": row["codec"] or "未知",
+            "width": row["width"] or 0,
+            "height": row["height"] or 0,
+            "fps": row.get("fps"),
+            "duration": row["duration"],
+            # 旧版本的记录没有音频信息，按有音频处理
+            "has_audio": row.get("has_audio") != 0,
+            "audio_codec": row.get("audio_codec"),
+            "audio_bitrate": row.get("audio_bitrate"),
+            "file_size": row["size"],
+            "human_size": f"{row['size']/1024/1024:.2f} MB"
+        }
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共用的日志配置
+
+各入口（index.py、两个GUI）原来在导入时就创建同步写入的FileHandler，日志文件无限增长，
+写盘在编码的读取线程和界面线程中同步进行。这里的setup_logging()由入口的main()调用：
+记录只放入内存队列（QueueHandler，从不等待磁盘），由后台的QueueListener线程写入按大小轮转的
+日志文件和控制台；各类日志（按logger名称，如"ffmpeg"、"conversion_queue"）可以分别设置级别；
+FFmpeg的输出通过RateLimitedLog限速记录。导入本模块不会创建任何文件。
+
+日志级别也可以用环境变量设置，如:
+    VIDEO_OPTIMIZER_LOG_LEVELS="ffmpeg=debug,library_catalog=warning"
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+# 日志文件的大小上限和保留的旧文件数量
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+# 内存队列的容量，写盘跟不上时丢弃新的记录而不是等待
+QUEUE_SIZE = 10000
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LEVELS_ENV = "VIDEO_OPTIMIZER_LOG_LEVELS"
+# FFmpeg输出的日志类别
+FFMPEG_LOGGER = "ffmpeg"
+# FFmpeg输出每个时间窗口最多记录的行数
+FFMPEG_LINES_PER_INTERVAL = 20
+FFMPEG_LOG_INTERVAL = 5.0
+
+_listener = None
+
+def parse_levels(text):
+    """
+    解析各类日志的级别，如 "ffmpeg=debug,library_catalog=warning"
+
+    Returns:
+        dict: {logger名称: 级别}
+
+    Raises:
+        ValueError: 格式或级别名称无效
+    """
+    levels = {}
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, level_name = item.partition("=")
+        level = logging.getLevelName(level_name.strip().upper())
+        if not separator or not name.strip() or not isinstance(level, int):
+            raise ValueError(f"无效的日志级别设置: {item}（应为 名称=debug/info/warning/error）")
+        levels[name.strip()] = level
+    return levels
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录并计数，记录日志的线程从不等待"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _open_file_handler(log_file, max_bytes, backup_count, formatter):
+    """
+    创建轮转的日志文件
+
+    Returns:
+        tuple: (handler, 错误信息)，无法创建时handler为None（不影响程序运行）
+    """
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                                       backupCount=backup_count, encoding="utf-8")
+    except OSError as e:
+        return None, f"无法创建日志文件 {log_file}: {str(e)}"
+    handler.setFormatter(formatter)
+    return handler, None
+
+def setup_logging(log_file=None, level=logging.INFO, category_levels=None, console=True,
+                  max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+    """
+    配置根logger：记录放入内存队列，由后台线程写入日志文件和控制台
+
+    重复调用时先停止上一次的配置。程序退出时自动写完队列中剩余的记录。
+
+    Args:
+        log_file: 日志文件路径，None表示只输出到控制台
+        level: 默认日志级别
+        category_levels: {logger名称: 级别}，覆盖各类日志的级别；环境变量VIDEO_OPTIMIZER_LOG_LEVELS的设置优先
+        console: 是否同时输出到标准错误
+        max_bytes: 日志文件的大小上限，超过时轮转
+        backup_count: 保留的旧日志文件数量
+
+    Returns:
+        str: 实际使用的日志文件路径，无法创建或未指定时返回None
+    """
+    global _listener
+    stop_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+    file_handler, file_error = (_open_file_handler(log_file, max_bytes, backup_count, formatter)
+                                if log_file else (None, None))
+    if file_handler is not None:
+        handlers.append(file_handler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(queue.Queue(QUEUE_SIZE)))
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(root.handlers[0].queue, *handlers)
+    _listener.start()
+
+    logger = logging.getLogger(__name__)
+    if file_error:
+        logger.warning(file_error)
+    levels = dict(category_levels or {})
+    try:
+        levels.update(parse_levels(os.environ.get(LEVELS_ENV)))
+    except ValueError as e:
+        logger.warning(f"忽略环境变量{LEVELS_ENV}: {str(e)}")
+    for name, category_level in levels.items():
+        logging.getLogger(name).setLevel(category_level)
+    return file_handler.baseFilename if file_handler is not None else None
+
+def stop_logging():
+    """停止后台写入线程，写完队列中剩余的记录"""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    dropped = sum(getattr(handler, "dropped", 0) for handler in logging.getLogger().handlers)
+    if dropped:
+        print(f"⚠️  日志写入跟不上，丢弃了 {dropped} 条记录")
+
+atexit.register(stop_logging)
+
+class RateLimitedLog:
+    """
+    限速记录FFmpeg的输出：每个时间窗口最多记录固定行数，超出的行只计数，
+    在下一个窗口开始或flush()时记录省略的行数。目标级别未启用时几乎没有开销。
+
+    Args:
+        name: 输出的来源（如文件名），加在每行前面
+        logger: 使用的logger，默认为"ffmpeg"类别
+        level: 记录的级别
+        max_lines: 每个时间窗口最多记录的行数
+        interval: 时间窗口（秒）
+    """
+
+    def __init__(self, name, logger=None, level=logging.DEBUG,
+                 max_lines=FFMPEG_LINES_PER_INTERVAL, interval=FFMPEG_LOG_INTERVAL):
+        self.name = name
+        self.logger = logger or logging.getLogger(FFMPEG_LOGGER)
+        self.level = level
+        self.max_lines = max_lines
+        self.interval = interval
+        self._window_start = time.monotonic()
+        self._lines = 0
+        self._suppressed = 0
+
+    def log(self, line):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        if now - self._window_start >= self.interval:
+            self.flush()
+            self._window_start = now
+            self._lines = 0
+        if self._lines >= self.max_lines:
+            self._suppressed += 1
+            return
+        self._lines += 1
+        self.logger.log(self.level, "[%s] %s", self.name, line.rstrip())
+
+    def flush(self):
+        """记录省略的行数"""
+        if self._suppressed:
+            self.logger.log(self.level, "[%s] 省略了 %d 行FFmpeg输出", self.name, self._suppressed)
+            self._suppressed = 0
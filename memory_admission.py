@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按内存预算调度并发的x265转换
+
+同时运行几个4K `preset slow` 转换可能耗尽内存，而720p的转换只占其中一小部分，
+固定的并发数要么浪费内存要么导致OOM。这里根据分辨率、预设、lookahead和帧线程数估算
+每个任务的峰值内存（RSS），并用实际测得的峰值校准；只有所有进行中任务的估算之和
+不超过预算时才开始新任务，大任务放不下时先开始能放下的小任务。
+"""
+
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# x265各预设的默认 rc-lookahead、bframes、ref（见x265文档的预设表）
+X265_PRESET_PARAMS = {
+    "ultrafast": (5, 3, 1),
+    "superfast": (10, 3, 1),
+    "veryfast": (15, 4, 2),
+    "faster": (15, 4, 2),
+    "fast": (15, 4, 3),
+    "medium": (20, 4, 3),
+    "slow": (25, 4, 4),
+    "slower": (40, 8, 5),
+    "veryslow": (40, 8, 5),
+}
+
+# lookahead中的帧只保存像素和1/4分辨率的副本（含边缘填充），每像素字节数
+LOOKAHEAD_BYTES_PER_PIXEL = 2.0
+# 正在编码和被参考的帧还保存重建图像和CU分析数据，每像素字节数
+ENCODE_BYTES_PER_PIXEL = 12.0
+# 解码器、封装器和进程本身的固定开销
+BASE_BYTES = 64 * 1024 * 1024
+# 校准系数的指数移动平均权重，以及允许的范围
+CALIBRATION_WEIGHT = 0.3
+CALIBRATION_RANGE = (0.25, 4.0)
+
+def default_history_file():
+    """内存测量记录，默认为 ~/.cache/video-optimizer/memory_history.json"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "video-optimizer", "memory_history.json")
+
+def default_frame_threads(cpu_count, height=0):
+    """x265按CPU核数自动选择的帧线程数（与x265源码中的规则一致）"""
+    if cpu_count >= 32:
+        return 6 if height > 2000 else 5
+    if cpu_count >= 16:
+        return 4
+    if cpu_count >= 8:
+        return 3
+    if cpu_count >= 4:
+        return 2
+    return 1
+
+def resolution_class(width, height):
+    """校准记录按分辨率分组（分辨率未知时按1080p）"""
+    pixels = (width or 1920) * (height or 1080)
+    if pixels <= 1280 * 720:
+        return "720p"
+    if pixels <= 1920 * 1080:
+        return "1080p"
+    if pixels <= 2560 * 1440:
+        return "1440p"
+    return "2160p"
+
+def model_peak_rss(width, height, preset="medium", lookahead=None, frame_threads=None, cpu_count=None):
+    """
+    未校准的峰值内存模型
+
+    Args:
+        width/height: 视频分辨率
+        preset: x265预设
+        lookahead: rc-lookahead帧数，None表示预设的默认值
+        frame_threads: 帧线程数，None表示按cpu_count自动选择
+        cpu_count: ffmpeg可用的CPU核数，None表示本机全部
+
+    Returns:
+        int: 估算的峰值内存（字节）
+    """
+    preset_lookahead, bframes, refs = X265_PRESET_PARAMS.get(preset, X265_PRESET_PARAMS["medium"])
+    lookahead = preset_lookahead if lookahead is None else lookahead
+    if frame_threads is None:
+        frame_threads = default_frame_threads(cpu_count or os.cpu_count() or 1, height or 0)
+    pixels = max(1, (width or 1920) * (height or 1080))
+    lookahead_bytes = (lookahead + bframes) * pixels * LOOKAHEAD_BYTES_PER_PIXEL
+    encode_bytes = frame_threads * (refs + 2) * pixels * ENCODE_BYTES_PER_PIXEL
+    return int(BASE_BYTES + lookahead_bytes + encode_bytes)
+
+def read_peak_rss(pid):
+    """
+    进程到目前为止的峰值内存（/proc/<pid>/status的VmHWM，仅Linux）
+
+    Returns:
+        int: 字节数，无法读取时返回None
+    """
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class MemoryHistory:
+    """
+    实测峰值内存与模型估算的比值，按 预设|分辨率 分组保存，用于校准估算
+
+    Args:
+        history_file: 记录文件路径，None表示只保存在内存中
+    """
+
+    def __init__(self, history_file=None):
+        self.history_file = history_file
+        self._lock = threading.Lock()
+        self._ratios = {}
+        if history_file and os.path.exists(history_file):
+            try:
+                with open(history_file, "r", encoding="utf-8") as f:
+                    self._ratios = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取内存测量记录失败: {str(e)}")
+
+    @staticmethod
+    def _key(width, height, preset):
+        return f"{preset}|{resolution_class(width, height)}"
+
+    def estimate(self, width, height, preset="medium", **kwargs):
+        """
+        校准后的峰值内存估算
+
+        Args:
+            kwargs: 传给model_peak_rss的其他参数
+
+        Returns:
+            int: 字节数
+        """
+        with self._lock:
+            entry = self._ratios.get(self._key(width, height, preset))
+        ratio = entry["ratio"] if entry else 1.0
+        return int(model_peak_rss(width, height, preset, **kwargs) * ratio)
+
+    def record(self, width, height, preset, peak_rss, **kwargs):
+        """记录一次实测的峰值内存，更新校准系数"""
+        model = model_peak_rss(width, height, preset, **kwargs)
+        measured_ratio = min(max(peak_rss / model, CALIBRATION_RANGE[0]), CALIBRATION_RANGE[1])
+        key = self._key(width, height, preset)
+        with self._lock:
+            entry = self._ratios.get(key)
+            if entry is None:
+                entry = {"ratio": measured_ratio, "samples": 0}
+            else:
+                entry["ratio"] += CALIBRATION_WEIGHT * (measured_ratio - entry["ratio"])
+            entry["samples"] += 1
+            self._ratios[key] = entry
+            logger.info(f"内存校准 {key}: 实测 {peak_rss/1024/1024:.0f} MB，模型 {model/1024/1024:.0f} MB，"
+                        f"校准系数 {entry['ratio']:.2f}")
+            if self.history_file:
+                self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.history_file)), exist_ok=True)
+            temp_file = f"{self.history_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self._ratios, f, indent=1)
+            os.replace(temp_file, self.history_file)
+        except OSError as e:
+            logger.warning(f"保存内存测量记录失败: {str(e)}")
+
+class MemoryBudget:
+    """
+    并发任务的准入控制：进行中任务数不超过max_jobs，且估算内存之和不超过budget_bytes
+
+    只有一个任务在运行时总是允许开始，超出预算的单个大任务不会被永远挡住。
+
+    Args:
+        budget_bytes: 内存预算（字节），None表示不限制内存，只限制任务数
+        max_jobs: 最多同时进行的任务数
+    """
+
+    def __init__(self, budget_bytes=None, max_jobs=1):
+        self.budget_bytes = budget_bytes
+        self.max_jobs = max(1, max_jobs)
+        self._condition = threading.Condition()
+        self._used = 0
+        self._running = 0
+
+    def _fits(self, estimate):
+        if self._running >= self.max_jobs:
+            return False
+        return self.budget_bytes is None or self._running == 0 or self._used + estimate <= self.budget_bytes
+
+    def choose(self, estimates, block=True, should_stop=None):
+        """
+        从候选任务中选出第一个放得下的并占用预算
+
+        Args:
+            estimates: 候选任务的内存估算列表（按优先顺序）
+            block: 没有放得下的任务时是否等待其他任务结束
+            should_stop: 可选的函数，返回True时停止等待
+
+        Returns:
+            int: 选中的下标，没有选中时返回None
+        """
+        with self._condition:
+            while True:
+                for i, estimate in enumerate(estimates):
+                    if self._fits(estimate):
+                        self._used += estimate
+                        self._running += 1
+                        return i
+                if not block or (should_stop is not None and should_stop()):
+                    return None
+                self._condition.wait(0.5)
+
+    def release(self, estimate):
+        """任务结束，归还预算"""
+        with self._condition:
+            self._used -= estimate
+            self._running -= 1
+            self._condition.notify_all()
+
+    @property
+    def used(self):
+        with self._condition:
+            return self._used
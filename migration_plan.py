@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频库迁移的预演计划（index.py --plan）
+
+只扫描和探测，不编码：按批量转换（index.py -d）实际的处理方式把每个文件归类为跳过、
+编码视频并复制音频、完整编码，另外给出批量转换不会自动处理的建议（只需重新封装的H.265文件、
+预计节省很少的低码率文件）。按每像素比特数（bpp）模型估算输出大小，按工作量（宽×高×帧数，见deadline_planner.py）和
+实测的编码速度估算耗时，写出每个文件的CSV/JSON，并汇总节省的空间、CPU小时数和N个并发转换的耗时。
+
+估算是统计意义上的：单个文件的实际大小取决于画面内容，可能相差一倍；大量文件的合计更接近实际。
+"""
+
+import os
+import csv
+import json
+import time
+import logging
+import heapq
+
+from deadline_planner import PRESET_COST, CALIBRATION_SECONDS, work_units, measure_encode_rate
+from deadline_planner import default_history_file as default_speed_history_file
+from preflight import HEVC_CONTAINERS, CONTAINER_AUDIO_CODECS, output_extension
+from process_priority import available_cpus
+
+logger = logging.getLogger(__name__)
+
+# 批量转换对文件的处理
+ACTION_SKIP = "skip"              # 不处理（已是H.265、上次已转换、无法探测）
+ACTION_COPY_AUDIO = "copy-audio"  # 编码视频，复制音频
+ACTION_ENCODE = "encode"          # 编码视频和音频
+ACTIONS = (ACTION_SKIP, ACTION_COPY_AUDIO, ACTION_ENCODE)
+ACTION_TEXT = {
+    ACTION_SKIP: "跳过",
+    ACTION_COPY_AUDIO: "编码视频、复制音频",
+    ACTION_ENCODE: "完整编码",
+}
+# 批量转换不会自动执行的建议
+RECOMMEND_REMUX = "remux"         # 已是H.265（批量转换跳过），但容器不能正常封装H.265，建议重新封装
+RECOMMEND_EXCLUDE = "exclude"     # 源码率已很低，批量转换仍会编码，但预计节省很少，建议用--exclude排除
+RECOMMENDATIONS = (RECOMMEND_REMUX, RECOMMEND_EXCLUDE)
+RECOMMENDATION_TEXT = {
+    RECOMMEND_REMUX: "建议重新封装（已是H.265，批量转换会跳过）",
+    RECOMMEND_EXCLUDE: "建议排除（源码率已很低，编码节省很少）",
+}
+
+# CRF 28、medium预设、1080p时H.265的每像素比特数（一般实拍内容的经验值）
+BASE_BPP = 0.025
+REFERENCE_PIXELS = 1920 * 1080
+# 分辨率越低每像素需要的比特越多：bpp ∝ 像素数^RESOLUTION_EXPONENT
+RESOLUTION_EXPONENT = -0.25
+# 各预设相对medium的输出大小
+PRESET_SIZE = {
+    "ultrafast": 1.35,
+    "superfast": 1.3,
+    "veryfast": 1.15,
+    "faster": 1.1,
+    "fast": 1.05,
+    "medium": 1.0,
+    "slow": 0.95,
+    "slower": 0.93,
+    "veryslow": 0.92,
+}
+# 预计节省不到这一比例的文件建议排除（源文件的码率已经很低）
+MIN_SAVING_RATIO = 0.1
+# 无法得知源文件音频码率时假设的值（不超过总码率的一半）
+ASSUMED_AUDIO_BITRATE = 128000
+# 重新封装（只复制数据）的速度，字节/秒
+REMUX_BYTES_PER_SECOND = 200 * 1024 * 1024
+# CSV的列
+FIELDS = ["path", "action", "reason", "recommendation", "codec", "width", "height", "fps", "duration",
+          "input_size", "estimated_size", "estimated_saving", "encode_seconds", "cpu_seconds"]
+
+def parse_bitrate(value):
+    """'128k' -> 128000"""
+    text = str(value).strip().lower()
+    multiplier = {"k": 1000, "m": 1000 * 1000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+def estimate_video_bitrate(info, crf=28, preset="medium"):
+    """
+    按bpp模型估算H.265视频的码率
+
+    Args:
+        info: get_video_info()的结果，缺少的分辨率和帧率按1080p、30fps估算
+
+    Returns:
+        float: 比特/秒
+    """
+    width = info.get("width") or 1920
+    height = info.get("height") or 1080
+    fps = info.get("fps") or 30.0
+    pixels = width * height
+    bpp = BASE_BPP * (pixels / REFERENCE_PIXELS) ** RESOLUTION_EXPONENT
+    bpp *= 2 ** ((28 - crf) / 6.0) * PRESET_SIZE.get(preset, 1.0)
+    return bpp * pixels * fps
+
+def classify(input_file, info, crf=28, preset="medium", audio_codec="aac", audio_bitrate="128k"):
+    """
+    按批量转换实际的处理方式归类一个文件，并估算输出大小和工作量
+
+    批量转换跳过所有H.265文件、编码其他所有能探测的文件；重新封装和排除低码率文件只作为建议
+    （"recommendation"字段），不计入节省的空间和耗时的差别。
+
+    Args:
+        input_file: 文件路径
+        info: get_video_info()的结果，None表示无法探测
+        其余参数同convert_h264_to_h265
+
+    Returns:
+        dict: 计划中的一项，字段见FIELDS；"units"为按预设折算的medium等效工作量（像素数）
+    """
+    entry = {"path": input_file, "action": ACTION_SKIP, "reason": "", "recommendation": None,
+             "codec": None, "width": None,
+             "height": None, "fps": None, "duration": None, "input_size": 0, "estimated_size": 0,
+             "estimated_saving": 0, "encode_seconds": 0.0, "cpu_seconds": 0.0, "units": 0.0}
+    if not info:
+        entry["reason"] = "无法探测或没有视频流"
+        try:
+            entry["input_size"] = entry["estimated_size"] = os.path.getsize(input_file)
+        except OSError:
+            pass
+        return entry
+    input_size = info.get("file_size") or 0
+    duration = info.get("duration")
+    entry.update(codec=info.get("codec"), width=info.get("width") or None, height=info.get("height") or None,
+                 fps=info.get("fps"), duration=duration, input_size=input_size, estimated_size=input_size)
+    ext = os.path.splitext(input_file)[1].lower()
+    output_ext = output_extension(ext)
+
+    if info.get("codec") == "hevc":
+        entry["reason"] = "已是H.265"
+        if ext not in HEVC_CONTAINERS:
+            entry["recommendation"] = RECOMMEND_REMUX
+            entry["reason"] = f"已是H.265，建议把{ext}重新封装为{output_ext}"
+        return entry
+
+    # 与preflight相同：容器不支持复制的音频编码时改为编码
+    has_audio = info.get("has_audio", True)
+    copy_audio = False
+    if has_audio and audio_codec == "copy":
+        allowed = CONTAINER_AUDIO_CODECS.get(output_ext)
+        copy_audio = allowed is None or info.get("audio_codec") is None or info["audio_codec"] in allowed
+    entry["action"] = ACTION_COPY_AUDIO if copy_audio else ACTION_ENCODE
+    entry["reason"] = f"{info.get('codec')} -> hevc" + ("" if has_audio else "（没有音频）")
+    if not duration:
+        entry["reason"] += "，无法确定时长，未估算大小和耗时"
+        return entry
+
+    total_bitrate = input_size * 8 / duration
+    source_audio_bitrate = 0
+    if has_audio:
+        source_audio_bitrate = info.get("audio_bitrate") or min(ASSUMED_AUDIO_BITRATE, total_bitrate / 2)
+    source_video_bitrate = max(total_bitrate - source_audio_bitrate, 1)
+    video_bitrate = min(estimate_video_bitrate(info, crf, preset), source_video_bitrate)
+    if video_bitrate >= source_video_bitrate * (1 - MIN_SAVING_RATIO):
+        entry["recommendation"] = RECOMMEND_EXCLUDE
+        entry["reason"] += (f"，源码率已很低（{source_video_bitrate/1000:.0f} kb/s），"
+                            f"预计节省不到{MIN_SAVING_RATIO:.0%}")
+    if not has_audio:
+        output_audio_bitrate = 0
+    elif copy_audio:
+        output_audio_bitrate = source_audio_bitrate
+    else:
+        output_audio_bitrate = parse_bitrate(audio_bitrate)
+    entry["estimated_size"] = int((video_bitrate + output_audio_bitrate) * duration / 8)
+    entry["estimated_saving"] = input_size - entry["estimated_size"]
+    entry["units"] = work_units(info) * PRESET_COST.get(preset, 1.0)
+    return entry
+
+def measure_rates(input_file, info, threads=0):
+    """
+    测量medium等效的编码速度：单个任务的速度（像素/秒）和每CPU秒编码的像素数
+
+    Returns:
+        tuple: (单个任务的速度, 每CPU秒的像素数)，失败时返回 (None, None)
+    """
+    try:
+        import resource
+        cpu_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    except ImportError:
+        resource = None
+    wall_rate = measure_encode_rate(input_file, info, threads=threads)
+    if not wall_rate:
+        return None, None
+    if resource is None:
+        # 无法测量CPU时间时按x265用满所有核估算
+        return wall_rate, wall_rate / len(available_cpus())
+    cpu_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_seconds = (cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime)
+    sample = dict(info, duration=min(CALIBRATION_SECONDS, info.get("duration") or CALIBRATION_SECONDS))
+    wall_seconds = work_units(sample) / wall_rate
+    cpu_rate = wall_rate * wall_seconds / cpu_seconds if cpu_seconds > 0 else wall_rate / len(available_cpus())
+    return wall_rate, cpu_rate
+
+def makespan(durations, workers):
+    """
+    N个并发转换完成全部文件的耗时：按从长到短依次交给最先空闲的转换（LPT调度）
+
+    Args:
+        durations: 每个文件的耗时（秒）
+        workers: 同时进行的转换数量
+    """
+    finish_times = [0.0] * max(1, workers)
+    for duration in sorted(durations, reverse=True):
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + duration)
+    return max(finish_times)
+
+class MigrationPlan:
+    """
+    整个视频库的迁移计划
+
+    Args:
+        crf, preset, audio_codec, audio_bitrate: 转换参数，同convert_h264_to_h265
+        workers: 同时进行的转换数量
+        cpus: 可用的CPU数量，None表示当前进程可用的全部CPU
+    """
+
+    def __init__(self, crf=28, preset="medium", audio_codec="aac", audio_bitrate="128k", workers=1, cpus=None):
+        self.crf = crf
+        self.preset = preset
+        self.audio_codec = audio_codec
+        self.audio_bitrate = audio_bitrate
+        self.workers = max(1, workers)
+        self.cpus = cpus or len(available_cpus())
+        self.entries = []
+        self.wall_rate = None
+        self.cpu_rate = None
+        # 批量转换实测的N个并发时的合计速度（见DeadlinePlanner）
+        self.measured_rate = None
+
+    def add(self, input_file, info):
+        entry = classify(input_file, info, self.crf, self.preset, self.audio_codec, self.audio_bitrate)
+        self.entries.append(entry)
+        return entry
+
+    def calibrate(self, threads=0, history_file=None):
+        """
+        测量编码速度：读取批量转换记录的速度，并编码第一个需要编码的文件开头几秒
+
+        Returns:
+            bool: 是否得到了速度
+        """
+        history_file = history_file or default_speed_history_file()
+        try:
+            with open(history_file, "r", encoding="utf-8") as f:
+                self.measured_rate = json.load(f).get(str(self.workers))
+        except (OSError, ValueError):
+            self.measured_rate = None
+        # 用工作量最大的文件测量，短小的文件受启动开销影响，速度偏低
+        for entry in sorted(self.entries, key=lambda entry: entry["units"], reverse=True):
+            if entry["units"]:
+                info = {key: entry[key] for key in ("width", "height", "fps", "duration")}
+                self.wall_rate, self.cpu_rate = measure_rates(entry["path"], info, threads)
+                if self.wall_rate:
+                    break
+        if not self.wall_rate:
+            return False
+        # 每个并发转换的速度：单个任务的速度，但所有转换合计不超过CPU的处理能力（或实测的合计速度）
+        total_rate = self.measured_rate or self.cpu_rate * self.cpus
+        worker_rate = min(self.wall_rate, total_rate / self.workers)
+        for entry in self.entries:
+            if entry["units"]:
+                entry["encode_seconds"] = entry["units"] / worker_rate
+                entry["cpu_seconds"] = entry["units"] / self.cpu_rate
+        return True
+
+    def summary(self):
+        """
+        汇总
+
+        Returns:
+            dict: 各类文件的数量和大小、预计输出大小和节省的空间、CPU小时数、N个并发转换的耗时（秒）
+        """
+        actions = {action: {"files": 0, "input_size": 0, "estimated_size": 0} for action in ACTIONS}
+        recommendations = {name: {"files": 0, "input_size": 0, "estimated_size": 0, "seconds": 0.0}
+                           for name in RECOMMENDATIONS}
+        for entry in self.entries:
+            totals = actions[entry["action"]]
+            totals["files"] += 1
+            totals["input_size"] += entry["input_size"]
+            totals["estimated_size"] += entry["estimated_size"]
+            if entry["recommendation"]:
+                totals = recommendations[entry["recommendation"]]
+                totals["files"] += 1
+                totals["input_size"] += entry["input_size"]
+                totals["estimated_size"] += entry["estimated_size"]
+                # 重新封装只复制数据；排除的文件节省的是编码时间
+                totals["seconds"] += (entry["input_size"] / REMUX_BYTES_PER_SECOND
+                                      if entry["recommendation"] == RECOMMEND_REMUX else entry["cpu_seconds"])
+        input_size = sum(entry["input_size"] for entry in self.entries)
+        estimated_size = sum(entry["estimated_size"] for entry in self.entries)
+        return {
+            "files": len(self.entries),
+            "actions": actions,
+            "recommendations": recommendations,
+            "input_size": input_size,
+            "estimated_size": estimated_size,
+            "estimated_saving": input_size - estimated_size,
+            "cpu_hours": sum(entry["cpu_seconds"] for entry in self.entries) / 3600,
+            "workers": self.workers,
+            "wall_seconds": makespan([entry["encode_seconds"] for entry in self.entries if entry["encode_seconds"]],
+                                     self.workers),
+            "calibrated": bool(self.wall_rate),
+            "params": {"crf": self.crf, "preset": self.preset, "audio_codec": self.audio_codec,
+                       "audio_bitrate": self.audio_bitrate},
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def write(self, output_file):
+        """
+        写出计划：扩展名为.json时写出汇总和每个文件，否则写出每个文件的CSV
+        """
+        temp_file = f"{output_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w", encoding="utf-8", newline="") as f:
+            if output_file.lower().endswith(".json"):
+                json.dump({"summary": self.summary(),
+                           "files": [{key: entry[key] for key in FIELDS} for entry in self.entries]},
+                          f, ensure_ascii=False, indent=1)
+            else:
+                writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                for entry in self.entries:
+                    writer.writerow(dict(entry, encode_seconds=round(entry["encode_seconds"], 1),
+                                         cpu_seconds=round(entry["cpu_seconds"], 1)))
+        os.replace(temp_file, output_file)
+
+def format_size(size):
+    for unit, factor in (("TB", 1024 ** 4), ("GB", 1024 ** 3), ("MB", 1024 ** 2)):
+        if abs(size) >= factor:
+            return f"{size/factor:.2f} {unit}"
+    return f"{size/1024:.1f} KB"
+
+def format_duration(seconds):
+    if seconds >= 86400:
+        return f"{seconds/86400:.1f} 天"
+    if seconds >= 3600:
+        return f"{seconds/3600:.1f} 小时"
+    return f"{seconds/60:.1f} 分钟"
+
+def print_summary(summary):
+    """打印计划的汇总"""
+    print(f"\n📋 迁移计划（CRF={summary['params']['crf']}，预设={summary['params']['preset']}）")
+    for action in ACTIONS:
+        totals = summary["actions"][action]
+        if totals["files"]:
+            print(f"   {ACTION_TEXT[action]}: {totals['files']} 个文件，{format_size(totals['input_size'])}"
+                  f" -> {format_size(totals['estimated_size'])}")
+    input_size = summary["input_size"]
+    saving = summary["estimated_saving"]
+    print(f"   合计: {summary['files']} 个文件，{format_size(input_size)} -> {format_size(summary['estimated_size'])}，"
+          f"预计节省 {format_size(saving)}（{saving / input_size * 100 if input_size else 0:.1f}%）")
+    if summary["calibrated"]:
+        print(f"   CPU时间: {summary['cpu_hours']:.2f} CPU小时")
+        print(f"   {summary['workers']} 个并发转换预计耗时: {format_duration(summary['wall_seconds'])}")
+    else:
+        print("   ⚠️  未能测量编码速度，没有估算耗时")
+    totals = summary["recommendations"][RECOMMEND_REMUX]
+    if totals["files"]:
+        print(f"   💡 {RECOMMENDATION_TEXT[RECOMMEND_REMUX]}: {totals['files']} 个文件，"
+              f"{format_size(totals['input_size'])}，只需复制数据约 {format_duration(totals['seconds'])}")
+    totals = summary["recommendations"][RECOMMEND_EXCLUDE]
+    if totals["files"]:
+        print(f"   💡 {RECOMMENDATION_TEXT[RECOMMEND_EXCLUDE]}: {totals['files']} 个文件，"
+              f"{format_size(totals['input_size'])} -> {format_size(totals['estimated_size'])}，"
+              f"排除可节省 {totals['seconds']/3600:.2f} CPU小时")
+
+def plan_library(directory, output_file, recursive=False, include=None, exclude=None, include_hidden=False,
+                 probe_workers=4, catalog=None, state_file=None, workers=1, crf=28, preset="medium", audio_codec="aac",
+                 audio_bitrate="128k", threads=0):
+    """
+    扫描目录生成迁移计划，不编码
+
+    Args:
+        directory: 要扫描的目录
+        output_file: 计划文件路径（.json或.csv）
+        catalog: LibraryCatalog，只读：记录中标识未变的文件使用记录的探测结果，已转换的文件记为跳过；
+            不写入任何记录
+        state_file: 批量转换的状态文件，已完成的文件记为跳过
+        其余参数同batch_convert和convert_h264_to_h265
+
+    Returns:
+        MigrationPlan: 计划
+    """
+    from index import get_video_info, is_video_file
+    from video_scanner import iter_video_files, iter_probed
+    from library_catalog import STATUS_CONVERTED
+    from job_state import JobState
+
+    default_state_file = os.path.join(directory, ".h265_batch_state.json")
+    state = JobState(state_file or (default_state_file if os.path.exists(default_state_file) else None))
+    plan = MigrationPlan(crf, preset, audio_codec, audio_bitrate, workers)
+    started = time.monotonic()
+
+    video_files = iter_video_files(directory, recursive, include, exclude, is_video=is_video_file,
+                                   include_hidden=include_hidden)
+
+    def probe(input_file):
+        # 预演不写入视频库目录：只读取记录，文件标识变化或没有记录时重新探测
+        row = catalog.get(input_file) if catalog is not None else None
+        if row is not None and row["codec"]:
+            try:
+                st = os.stat(input_file)
+            except OSError:
+                return None, None
+            if (row["dev"], row["ino"], row["size"], row["mtime_ns"]) == \
+                    (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns):
+                return catalog.to_video_info(row), row["status"]
+        return get_video_info(input_file), None
+
+    probed_files = ((path, info, status) for path, (info, status) in
+                    iter_probed(video_files, probe, workers=probe_workers, max_pending=probe_workers * 2))
+
+    for input_file, info, status in probed_files:
+        try:
+            handled = status == STATUS_CONVERTED or state.is_handled(input_file, os.stat(input_file))
+        except OSError:
+            continue
+        entry = plan.add(input_file, info)
+        if handled:
+            entry.update(action=ACTION_SKIP, reason="上次已转换", recommendation=None, estimated_size=entry["input_size"],
+                         estimated_saving=0, units=0.0)
+        if len(plan.entries) % 1000 == 0:
+            print(f"🔍 已探测 {len(plan.entries)} 个文件")
+    logger.info(f"迁移计划探测了 {len(plan.entries)} 个文件，耗时 {time.monotonic() - started:.1f} 秒")
+
+    plan.entries.sort(key=lambda entry: entry["path"])
+    if any(entry["units"] for entry in plan.entries):
+        print("⏱️  正在测量编码速度（编码开头几秒，不写输出）")
+        plan.calibrate(threads)
+    plan.write(output_file)
+    print_summary(plan.summary())
+    print(f"💾 计划已写入: {output_file}")
+    return plan
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MP4/MOV输出布局（moov atom位置）相关的工具函数
+
+-movflags +faststart 会在编码结束后把整个文件重写一遍，以便把moov移到文件开头，
+对多GB的输出意味着写入量翻倍。这里提供两种避免二次重写的方式：
+- reserve: 按预估大小用 -moov_size 在文件开头预留空间，结束时直接写入预留位置
+- fragmented: 分片MP4，开头写入空moov，之后按关键帧分片输出
+"""
+
+import re
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 可选的moov布局模式
+MOOV_MODES = ("reserve", "fragmented", "faststart", "none")
+
+# 支持movflags的容器扩展名
+MP4_EXTENSIONS = {'.mp4', '.mov', '.m4v'}
+
+# 每个样本在moov索引表(stts/ctts/stsz/stco/stss)中的最大字节数，实测约15字节，按保守值估算
+_VIDEO_BYTES_PER_FRAME = 33
+_AUDIO_BYTES_PER_FRAME = 12
+_MOOV_BASE_SIZE = 64 * 1024
+
+# ffmpeg在预留空间不足时仍可能返回0，需要检查输出中的这条错误
+MOOV_TOO_SMALL_ERROR = "reserved_moov_size is too small"
+
+def estimate_moov_size(duration, fps=30.0, audio_sample_rate=48000, has_audio=True):
+    """
+    根据时长和帧率估算moov atom需要预留的大小
+
+    Args:
+        duration: 时长（秒）
+        fps: 视频帧率
+        audio_sample_rate: 音频采样率，AAC每帧1024个采样
+        has_audio: 是否包含音频
+
+    Returns:
+        int: 预留字节数
+    """
+    video_frames = duration * (fps or 30.0)
+    audio_frames = duration * audio_sample_rate / 1024.0 if has_audio else 0
+    size = video_frames * _VIDEO_BYTES_PER_FRAME + audio_frames * _AUDIO_BYTES_PER_FRAME
+    return int(size * 1.25) + _MOOV_BASE_SIZE
+
+def movflags_args(mode, duration=None, fps=None, has_audio=True):
+    """
+    生成对应布局模式的ffmpeg输出参数
+
+    reserve模式需要时长，未知时退回fragmented，仍然避免二次重写。
+
+    Args:
+        mode: 布局模式，见MOOV_MODES
+        duration: 时长（秒），reserve模式使用
+        fps: 视频帧率，reserve模式使用
+        has_audio: 是否包含音频，reserve模式使用
+
+    Returns:
+        list: ffmpeg参数列表
+    """
+    if mode == "reserve":
+        if duration:
+            return ["-moov_size", str(estimate_moov_size(duration, fps, has_audio=has_audio))]
+        logger.info("未知时长，无法预留moov空间，改用分片MP4")
+        mode = "fragmented"
+    if mode == "fragmented":
+        return ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+    if mode == "faststart":
+        return ["-movflags", "+faststart"]
+    return []
+
+def probe_timing(ffmpeg_path, input_file):
+    """
+    只用ffmpeg（无需ffprobe）读取输入的时长、帧率和是否有音频
+
+    Args:
+        ffmpeg_path: ffmpeg可执行文件路径
+        input_file: 输入文件路径
+
+    Returns:
+        dict: {"duration": 秒或None, "fps": 帧率或None, "has_audio": bool}
+    """
+    timing = {"duration": None, "fps": None, "has_audio": False}
+    try:
+        result = subprocess.run([ffmpeg_path, "-hide_banner", "-i", input_file],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                text=True,
+                                timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"读取输入时长失败: {str(e)}")
+        return timing
+
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        timing["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = re.search(r"Stream #.*Video:.* ([\d.]+) fps", result.stderr)
+    if match:
+        timing["fps"] = float(match.group(1))
+    timing["has_audio"] = bool(re.search(r"Stream #.*Audio:", result.stderr))
+    return timing
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+开始编码前的快速检查
+
+有的转换要编码数小时后才在结尾失败，或者根本不产生输出：静音视频被强制映射音频流、
+.flv/.webm容器不能封装H.265、输出目录在编码中途被写满、输入文件损坏。
+这里在启动x265之前用不到一秒检查流、容器与编码的兼容性、剩余空间、输出目录是否可写，
+并解码开头几秒；能自动修正的问题（如复制的音频编码容器不支持）直接修正，其他问题拒绝转换。
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# 能封装H.265的输出容器（.avi/.wmv可以写入但多数播放器不支持，.flv/.webm不能写入）
+HEVC_CONTAINERS = {".mp4", ".m4v", ".mov", ".mkv"}
+# 输入的容器不能封装H.265时使用的输出扩展名
+DEFAULT_OUTPUT_EXTENSION = ".mp4"
+# 各容器能直接复制（-c:a copy）的音频编码，None表示不限制
+_MP4_AUDIO_CODECS = {"aac", "mp3", "ac3", "eac3", "alac", "opus", "flac"}
+CONTAINER_AUDIO_CODECS = {
+    ".mp4": _MP4_AUDIO_CODECS,
+    ".m4v": _MP4_AUDIO_CODECS,
+    ".mov": _MP4_AUDIO_CODECS | {"pcm_s16le", "pcm_s16be", "pcm_s24le", "pcm_s24be", "pcm_f32le"},
+    ".mkv": None,
+}
+# 复制音频不兼容时改用的音频编码
+FALLBACK_AUDIO_CODEC = "aac"
+# 试解码的秒数和超时时间
+DECODE_SECONDS = 2
+DECODE_TIMEOUT = 15
+
+def output_extension(ext):
+    """
+    输出文件的扩展名：输入的容器能封装H.265时保留，否则改为DEFAULT_OUTPUT_EXTENSION
+
+    Args:
+        ext: 输入文件的扩展名（含"."）
+    """
+    return ext if ext.lower() in HEVC_CONTAINERS else DEFAULT_OUTPUT_EXTENSION
+
+class PreflightResult:
+    """
+    检查结果
+
+    Attributes:
+        ok: 是否可以开始转换
+        errors: 拒绝转换的原因
+        warnings: 不影响转换的问题和已自动修正的问题
+        audio_codec: 修正后应使用的音频编码
+    """
+
+    def __init__(self, audio_codec):
+        self.errors = []
+        self.warnings = []
+        self.audio_codec = audio_codec
+
+    @property
+    def ok(self):
+        return not self.errors
+
+def check_writable(directory):
+    """
+    在目录中创建并删除一个临时文件，确认可以写入
+
+    Returns:
+        str: 错误信息，可写时返回None
+    """
+    try:
+        fd, path = tempfile.mkstemp(prefix=".preflight.", suffix=".part", dir=directory)
+        os.close(fd)
+        os.remove(path)
+    except OSError as e:
+        return f"目录不可写: {directory}: {e.strerror or str(e)}"
+    return None
+
+def check_decodable(input_file, ffmpeg="ffmpeg", seconds=DECODE_SECONDS):
+    """
+    解码输入开头几秒的视频和音频
+
+    Returns:
+        str: 错误信息，可以解码时返回None
+    """
+    cmd = [ffmpeg, "-hide_banner", "-nostdin", "-v", "error", "-t", str(seconds), "-i", input_file,
+           "-map", "0:v:0", "-map", "0:a:0?", "-f", "null", "-"]
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                text=True, errors="replace", timeout=DECODE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return f"试解码开头 {seconds} 秒超过 {DECODE_TIMEOUT} 秒"
+    except OSError as e:
+        # FFmpeg无法执行时由转换本身报告
+        logger.warning(f"无法试解码: {str(e)}")
+        return None
+    stderr = result.stderr.strip()
+    if result.returncode != 0:
+        if "matches no streams" in stderr:
+            return "输入没有视频流"
+        last_line = stderr.splitlines()[-1] if stderr else f"返回码 {result.returncode}"
+        return f"无法解码输入: {last_line}"
+    if stderr:
+        logger.warning(f"试解码有错误输出（仍继续）: {input_file}: {stderr.splitlines()[-1]}")
+    return None
+
+def preflight(input_file, output_file, info=None, work_dir=None, required_bytes=None,
+              audio_codec="aac", ffmpeg="ffmpeg", decode=True):
+    """
+    开始编码前检查
+
+    Args:
+        input_file: 输入文件路径
+        output_file: 输出文件路径，扩展名决定容器
+        info: get_video_info()的结果（可选），用于检查复制的音频编码
+        work_dir: 临时文件目录，None表示输出目录
+        required_bytes: 预计需要的磁盘空间，None表示不检查
+        audio_codec: 音频编码器（"copy"表示复制）
+        ffmpeg: ffmpeg可执行文件
+        decode: 是否试解码开头几秒
+
+    Returns:
+        PreflightResult: 检查结果
+    """
+    result = PreflightResult(audio_codec)
+    if not os.path.isfile(input_file):
+        result.errors.append(f"输入文件不存在: {input_file}")
+        return result
+    if not os.access(input_file, os.R_OK):
+        result.errors.append(f"输入文件不可读: {input_file}")
+        return result
+
+    # 容器与编码的兼容性
+    ext = os.path.splitext(output_file)[1].lower()
+    if ext not in HEVC_CONTAINERS:
+        result.errors.append(f"输出容器{ext or '（无扩展名）'}不能封装H.265，请使用"
+                             f"{'/'.join(sorted(HEVC_CONTAINERS))}")
+    elif info and audio_codec == "copy" and info.get("audio_codec"):
+        allowed = CONTAINER_AUDIO_CODECS.get(ext)
+        if allowed is not None and info["audio_codec"] not in allowed:
+            result.audio_codec = FALLBACK_AUDIO_CODEC
+            result.warnings.append(f"{ext}不能直接复制{info['audio_codec']}音频，改为编码为{FALLBACK_AUDIO_CODEC}")
+
+    # 输出目录可写、剩余空间足够
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    work_dir = os.path.abspath(work_dir) if work_dir else output_dir
+    checked_devices = []
+    for directory in dict.fromkeys((work_dir, output_dir)):
+        if not os.path.isdir(directory):
+            result.errors.append(f"目录不存在: {directory}")
+            continue
+        error = check_writable(directory)
+        if error:
+            result.errors.append(error)
+            continue
+        # 同一磁盘上的两个目录只检查一次剩余空间
+        device = os.stat(directory).st_dev
+        if device in checked_devices:
+            continue
+        checked_devices.append(device)
+        if required_bytes is not None:
+            free_bytes = shutil.disk_usage(directory).free
+            if free_bytes < required_bytes:
+                result.errors.append(f"磁盘空间不足: {directory} 剩余 {free_bytes/1024/1024:.2f} MB，"
+                                     f"预计需要 {required_bytes/1024/1024:.2f} MB")
+
+    # 前面的检查都通过后再试解码
+    if decode and result.ok:
+        error = check_decodable(input_file, ffmpeg)
+        if error:
+            result.errors.append(error)
+    return result
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FFmpeg子进程的CPU/IO优先级和CPU亲和性控制
+在共享机器上后台批量转换时，避免抢占交互式服务的资源
+"""
+
+import os
+import sys
+import glob
+import platform
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# IO调度类别（见 linux/ioprio.h）
+IO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+
+# 各架构的ioprio_set系统调用号
+_SYS_IOPRIO_SET = {"x86_64": 251, "amd64": 251, "aarch64": 30, "arm64": 30, "i386": 289, "i686": 289, "armv7l": 314}
+
+def parse_cpu_list(value):
+    """
+    解析CPU列表字符串，如 "0-3,8,10-11"
+
+    Args:
+        value: CPU列表字符串
+
+    Returns:
+        list: 排序后的CPU编号
+    """
+    cpus = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+def available_cpus():
+    """返回当前进程允许使用的CPU编号"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def _load_ioprio_set():
+    """准备ioprio_set调用，不支持的平台返回None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    syscall_number = _SYS_IOPRIO_SET.get(platform.machine())
+    if syscall_number is None:
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+
+    def ioprio_set(pid, ioprio):
+        if libc.syscall(syscall_number, _IOPRIO_WHO_PROCESS, pid, ioprio) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+    return ioprio_set
+
+def thread_ids(pid):
+    """进程的所有线程号（读取/proc/<pid>/task），没有/proc时只返回进程号本身"""
+    try:
+        return {int(tid) for tid in os.listdir(f"/proc/{pid}/task")}
+    except (OSError, ValueError):
+        return {pid}
+
+def numa_node_of(cpu):
+    """CPU所在的NUMA节点，无法确定时返回0"""
+    nodes = glob.glob(f"/sys/devices/system/cpu/cpu{cpu}/node[0-9]*")
+    return int(os.path.basename(nodes[0])[4:]) if nodes else 0
+
+class ProcessPriority:
+    """
+    应用到每个FFmpeg子进程的优先级设置
+
+    Args:
+        nice: nice值(-20~19)，None表示不修改
+        io_class: IO调度类别(idle/best-effort/realtime)，None表示不修改，仅Linux
+        io_level: IO优先级(0-7，值越小优先级越高)，best-effort和realtime有效
+        cpus: 允许使用的CPU编号列表，None表示不限制，仅Linux
+    """
+
+    def __init__(self, nice=None, io_class=None, io_level=4, cpus=None):
+        self.nice = nice
+        self.io_class = io_class
+        self.io_level = io_level
+        self.cpus = list(cpus) if cpus else None
+
+        if nice is not None and not hasattr(os, "setpriority"):
+            logger.warning("当前平台不支持设置nice值，忽略--nice")
+            self.nice = None
+
+        self._ioprio_set = None
+        self._ioprio = 0
+        if io_class:
+            self._ioprio_set = _load_ioprio_set()
+            if self._ioprio_set is None:
+                logger.warning("当前平台不支持设置IO优先级，忽略--io-class")
+            else:
+                level = 0 if io_class == "idle" else io_level
+                self._ioprio = (IO_CLASSES[io_class] << _IOPRIO_CLASS_SHIFT) | level
+        if self.cpus and not hasattr(os, "sched_setaffinity"):
+            logger.warning("当前平台不支持设置CPU亲和性，忽略CPU绑定")
+            self.cpus = None
+
+    def with_cpus(self, cpus):
+        """返回绑定到指定CPU的副本"""
+        return ProcessPriority(self.nice, self.io_class, self.io_level, cpus)
+
+    def is_empty(self):
+        return self.nice is None and self._ioprio_set is None and not self.cpus
+
+    def apply(self, pid):
+        """
+        应用到刚启动的子进程的所有线程
+
+        不使用subprocess的preexec_fn：转换在线程池和asyncio中启动，存在其他线程时fork之后
+        执行Python代码可能死锁。Linux上nice值、IO优先级和CPU亲和性都只作用于指定的线程，
+        而Popen返回时ffmpeg可能已经创建了编码线程，所以先设置主线程（之后创建的线程继承），
+        再设置/proc/<pid>/task中已有的线程，重复直到没有新出现的线程。
+
+        Args:
+            pid: 子进程的进程号
+        """
+        done = set()
+        pending = [pid]
+        while pending:
+            for tid in pending:
+                try:
+                    self._apply_thread(tid)
+                except ProcessLookupError:
+                    # 线程（或整个进程）已经退出
+                    continue
+                except OSError as e:
+                    logger.warning(f"设置子进程 {pid} 的优先级失败: {str(e)}")
+                    return
+            done.update(pending)
+            pending = sorted(thread_ids(pid) - done)
+
+    def _apply_thread(self, tid):
+        if self.nice is not None:
+            os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+        if self._ioprio_set is not None:
+            self._ioprio_set(tid, self._ioprio)
+        if self.cpus:
+            os.sched_setaffinity(tid, self.cpus)
+
+    def x265_params(self):
+        """
+        绑定CPU后x265仍按机器总核数创建线程池，这里按绑定的核所在的NUMA节点给出每个节点的线程数
+        （x265的pools参数是逐个NUMA节点的线程数列表，"-"表示该节点不创建线程）
+
+        Returns:
+            list: x265参数，如 ["pools=4"]、["pools=-,4"]
+        """
+        if not self.cpus:
+            return []
+        counts = {}
+        for cpu in self.cpus:
+            node = numa_node_of(cpu)
+            counts[node] = counts.get(node, 0) + 1
+        return ["pools=" + ",".join(str(counts[node]) if node in counts else "-"
+                                    for node in range(max(counts) + 1))]
+
+    def describe(self):
+        parts = []
+        if self.nice is not None:
+            parts.append(f"nice={self.nice}")
+        if self.io_class:
+            parts.append(f"io={self.io_class}")
+        if self.cpus:
+            parts.append(f"cpus={','.join(str(cpu) for cpu in self.cpus)}")
+        return ", ".join(parts) or "默认"
+
+class CoreAllocator:
+    """
+    把可用CPU划分为互不重叠的核组，分配给同时进行的转换任务
+
+    每个任务固定在自己的核组上，保持缓存局部性，x265线程池之间也不会互相争抢。
+    同时进行的任务多于核组时，多出的任务等待其他任务归还核组，不会不绑定CPU运行。
+
+    Args:
+        cores_per_job: 每个任务使用的核数
+        cpus: 可分配的CPU编号，None表示使用当前进程允许的全部CPU
+    """
+
+    def __init__(self, cores_per_job, cpus=None):
+        cpus = list(cpus) if cpus else available_cpus()
+        cores_per_job = max(1, cores_per_job)
+        self.cores_per_job = cores_per_job
+        self._free = [cpus[i:i + cores_per_job]
+                      for i in range(0, len(cpus) - cores_per_job + 1, cores_per_job)] or [cpus]
+        self._available = threading.Condition()
+        logger.info(f"CPU核组划分: {self._free}")
+
+    @contextmanager
+    def acquire(self):
+        """占用一个核组，退出时归还；没有空闲核组时等待"""
+        with self._available:
+            if not self._free:
+                logger.info("没有空闲的CPU核组，等待其他任务完成")
+                self._available.wait_for(lambda: self._free)
+            cores = self._free.pop(0)
+        try:
+            yield cores
+        finally:
+            with self._available:
+                self._free.append(cores)
+                self._available.notify()
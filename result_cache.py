@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的转换结果缓存
+
+同一个源视频经常以不同的文件名、在不同的目录中反复出现，每一份都被完整地重新编码。
+这里用（输入文件内容的哈希，规范化后的编码参数，FFmpeg和libx265的版本）作为键保存转换结果，
+命中时把缓存的输出通过reflink（写时复制，支持的文件系统上）或复制放到输出路径，不再编码；
+也可以选择使用硬链接。
+内容哈希默认为只读取少量数据的抽样哈希（见content_hash.py）。
+缓存总大小超过上限时按最近使用时间淘汰最久未用的结果。
+
+用法:
+    python result_cache.py stats [--cache-dir 目录]
+    python result_cache.py gc [--cache-dir 目录] [--max-size 50G]
+"""
+
+import os
+import json
+import time
+import uuid
+import errno
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+
+from ffmpeg_capabilities import get_capabilities
+from content_hash import file_hash
+
+logger = logging.getLogger(__name__)
+
+# 缓存总大小的默认上限
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024 * 1024
+# 键的格式变化时修改，旧的缓存结果不再命中
+KEY_VERSION = 2
+# 超过这个时间的临时文件视为中断的写入留下的，gc时删除
+STALE_TEMP_SECONDS = 3600
+# Linux的FICLONE ioctl（btrfs、XFS等支持reflink的文件系统）
+FICLONE = 0x40049409
+
+def default_cache_dir():
+    """结果缓存目录，默认为 ~/.cache/video-optimizer/results"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "video-optimizer", "results")
+
+def _normalize_bitrate(value):
+    """'128k'、'128K'、'128000' 统一为比特数"""
+    text = str(value).strip().lower()
+    multiplier = {"k": 1000, "m": 1000 * 1000}.get(text[-1:], 1)
+    try:
+        return int(float(text.rstrip("km")) * multiplier)
+    except ValueError:
+        return text
+
+def normalize_params(params, output_file):
+    """
+    规范化影响输出内容的参数，写法不同但含义相同的参数得到相同的键
+
+    Args:
+        params: 转换参数（convert_h264_to_h265的参数）
+        output_file: 输出文件路径，扩展名决定容器格式
+
+    Returns:
+        dict: 规范化后的参数
+    """
+    normalized = {
+        "crf": int(params.get("crf", 28)),
+        "preset": str(params.get("preset", "medium")).lower(),
+        "audio_codec": str(params.get("audio_codec", "aac")).lower(),
+        "audio_bitrate": _normalize_bitrate(params.get("audio_bitrate", "128k")),
+        "moov_mode": str(params.get("moov_mode", "reserve")).lower(),
+        "container": os.path.splitext(output_file)[1].lower(),
+    }
+    # 复制音频流时音频比特率不起作用
+    if normalized["audio_codec"] == "copy":
+        normalized["audio_bitrate"] = None
+    return normalized
+
+def clone_file(source, destination, allow_hardlink=False):
+    """
+    用最省空间和时间的方式把文件放到新路径：reflink，其次硬链接（需要allow_hardlink），最后复制
+
+    reflink和复制得到独立的文件；硬链接与源文件共用同一个inode，修改其中一个会同时改变另一个。
+
+    Returns:
+        str: 使用的方式，"reflink"、"hardlink" 或 "copy"
+    """
+    try:
+        import fcntl
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        if os.path.exists(destination):
+            os.remove(destination)
+    if allow_hardlink:
+        try:
+            os.link(source, destination)
+            return "hardlink"
+        except OSError:
+            pass
+    shutil.copyfile(source, destination)
+    return "copy"
+
+class ResultCache:
+    """
+    转换结果缓存
+
+    缓存的文件保存为 <目录>/objects/<键的前两位>/<键><扩展名>，文件的访问时间记录最近一次使用，
+    用于LRU淘汰。多个进程可以共用同一个缓存目录：写入先写临时文件再rename。
+
+    加入缓存时总是得到独立的文件（reflink或复制），缓存的结果与用户的输出文件互不影响。
+    命中时默认同样用reflink或复制；hardlink=True时可用硬链接，此时输出与缓存共用同一份数据，
+    原地修改输出会同时改变缓存的结果和其他链接到它的输出。
+
+    Args:
+        cache_dir: 缓存目录，None表示default_cache_dir()
+        max_bytes: 缓存总大小上限（字节），写入新结果后超出时淘汰最久未用的结果
+        ffmpeg: ffmpeg可执行文件，版本参与键的计算
+        full_hash: True时用完整哈希识别输入（读取整个文件，用于校验），默认用抽样哈希
+        hardlink: 命中时允许用硬链接放到输出路径
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, ffmpeg="ffmpeg", full_hash=False,
+                 hardlink=False):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.ffmpeg = ffmpeg
+        self.full_hash = full_hash
+        self.hardlink = hardlink
+        self._lock = threading.Lock()
+        self._versions = None
+
+    @property
+    def objects_dir(self):
+        return os.path.join(self.cache_dir, "objects")
+
+    def _encoder_versions(self):
+        """FFmpeg和libx265的版本（来自能力缓存），无法获取时返回None"""
+        if self._versions is None:
+            try:
+                capabilities = get_capabilities(self.ffmpeg)
+            except Exception as e:
+                logger.warning(f"读取FFmpeg版本失败，不使用结果缓存: {str(e)}")
+                capabilities = None
+            if capabilities is None or not capabilities.version or not capabilities.x265_version:
+                self._versions = ()
+            else:
+                self._versions = (capabilities.version, capabilities.x265_version)
+        return self._versions or None
+
+    def key(self, input_file, output_file, params):
+        """
+        计算缓存键
+
+        Args:
+            input_file: 输入文件路径
+            output_file: 输出文件路径
+            params: 转换参数
+
+        Returns:
+            str: 键，无法确定编码器版本时返回None（不使用缓存）
+        """
+        versions = self._encoder_versions()
+        if versions is None:
+            return None
+        data = {
+            "key_version": KEY_VERSION,
+            "content": file_hash(input_file, full=self.full_hash),
+            "hash": "full" if self.full_hash else "sampled",
+            "params": normalize_params(params, output_file),
+            "ffmpeg": versions[0],
+            "x265": versions[1],
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _object_path(self, key, output_file):
+        return os.path.join(self.objects_dir, key[:2], key + os.path.splitext(output_file)[1].lower())
+
+    def fetch(self, key, output_file):
+        """
+        缓存命中时把结果放到输出路径
+
+        Returns:
+            str: 使用的方式（见clone_file），未命中时返回None
+        """
+        cached = self._object_path(key, output_file)
+        if not os.path.exists(cached):
+            return None
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        base_name, ext = os.path.splitext(os.path.basename(output_file))
+        staging_file = os.path.join(output_dir, f".{base_name}.{uuid.uuid4().hex[:12]}.cache.part{ext}")
+        try:
+            method = clone_file(cached, staging_file, allow_hardlink=self.hardlink)
+            os.replace(staging_file, output_file)
+        except OSError as e:
+            logger.warning(f"从结果缓存复制失败: {str(e)}")
+            if os.path.exists(staging_file):
+                os.remove(staging_file)
+            return None
+        # 显式设置访问时间记录这次使用（不依赖文件系统的atime挂载选项）
+        try:
+            os.utime(cached, (time.time(), os.stat(cached).st_mtime))
+        except OSError:
+            pass
+        logger.info(f"结果缓存命中: {key[:12]}，通过{method}放到 {output_file}")
+        return method
+
+    def store(self, key, output_file):
+        """
+        把转换结果加入缓存，之后超出上限时淘汰最久未用的结果
+
+        Returns:
+            bool: 是否已加入
+        """
+        cached = self._object_path(key, output_file)
+        if os.path.exists(cached):
+            return True
+        temp_file = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            method = clone_file(output_file, temp_file)
+            os.replace(temp_file, cached)
+        except OSError as e:
+            logger.warning(f"保存到结果缓存失败: {str(e)}")
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return False
+        logger.info(f"转换结果已加入缓存: {key[:12]}（{method}）")
+        if self.max_bytes is not None:
+            self.gc()
+        return True
+
+    def entries(self, include_linked=False):
+        """
+        缓存中的结果
+
+        还有硬链接的输出在使用的结果不计入：删除它们不会释放空间，
+        输出文件都被删除后才重新计入大小并参与淘汰。
+
+        Args:
+            include_linked: 同时返回被硬链接的结果
+
+        Returns:
+            list: (路径, 大小, 最近使用时间) 列表，临时文件和被硬链接的结果除外
+        """
+        entries = []
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".tmp"):
+                    # 中断的写入留下的临时文件
+                    if time.time() - st.st_mtime > STALE_TEMP_SECONDS:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                    continue
+                if st.st_nlink > 1 and not include_linked:
+                    continue
+                entries.append((path, st.st_size, max(st.st_atime, st.st_mtime)))
+        return entries
+
+    def gc(self, max_bytes=None):
+        """
+        按最近使用时间淘汰结果，直到总大小不超过上限
+
+        Args:
+            max_bytes: 大小上限，None表示self.max_bytes
+
+        Returns:
+            tuple: (删除的结果数, 释放的字节数)
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = 0
+        freed = 0
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                if total <= max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        logger.warning(f"删除缓存结果失败: {path}: {str(e)}")
+                        continue
+                total -= size
+                removed += 1
+                freed += size
+        if removed:
+            logger.info(f"结果缓存淘汰了 {removed} 个结果，释放 {freed/1024/1024:.2f} MB")
+        return removed, freed
+
+def main():
+    from index import parse_size
+
+    parser = argparse.ArgumentParser(description="转换结果缓存管理")
+    parser.add_argument("command", choices=["stats", "gc"], help="stats: 查看缓存使用情况；gc: 按最近使用时间淘汰结果")
+    parser.add_argument("--cache-dir", help=f"缓存目录，默认{default_cache_dir()}")
+    parser.add_argument("--max-size", default="50G", help="gc后保留的最大总大小，如'50G'、'0'（清空），默认50G")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache_dir, max_bytes=parse_size(args.max_size))
+    if args.command == "gc":
+        removed, freed = cache.gc()
+        print(f"🧹 删除了 {removed} 个缓存结果，释放 {freed/1024/1024:.2f} MB")
+    entries = cache.entries()
+    linked = len(cache.entries(include_linked=True)) - len(entries)
+    print(f"📦 缓存目录: {cache.cache_dir}")
+    print(f"   结果数: {len(entries)}，合计 {sum(size for _, size, _ in entries)/1024/1024:.2f} MB")
+    if linked:
+        print(f"   另有 {linked} 个结果与输出文件硬链接，不计入大小上限")
+
+if __name__ == "__main__":
+    main()
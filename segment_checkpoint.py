@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分段编码的断点记录
+
+长视频一次编码成一个完整的输出文件，断电或崩溃时已编码的部分全部作废。分段模式按关键帧
+把视频切成约一分钟的片段分别编码，每个完成的片段保存在检查点目录中；重新运行时只编码
+缺少的片段，最后无损拼接视频片段并编码音频。
+
+片段从关键帧开始，按输入的数据包数截止，编码时保留每一帧原来的时间戳；拼接列表写明每个片段
+的时长，下一个片段从它在输入中的开始时间接上。拼接后再核对帧数和时长，不一致时放弃分段结果。
+"""
+
+import os
+import json
+import shutil
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# 每个片段的目标时长（秒），实际在之后的第一个关键帧处切分
+SEGMENT_SECONDS = 60
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+# 拼接结果与输入的视频时长允许的差异（秒）
+DURATION_TOLERANCE = 0.1
+# 定位到片段开头时提前的秒数，避免时间戳的舍入误差导致丢掉片段开头的关键帧
+SEEK_EPSILON = 0.0005
+
+def checkpoint_dir_for(output_file, work_dir=None):
+    """
+    输出文件的检查点目录：临时文件目录（默认为输出目录）下的隐藏目录，扫描目录时会被跳过
+    """
+    base_name = os.path.splitext(os.path.basename(output_file))[0]
+    return os.path.join(work_dir or os.path.dirname(os.path.abspath(output_file)), f".{base_name}.checkpoint")
+
+def probe_video_packets(input_file, ffprobe="ffprobe"):
+    """
+    读取视频流所有数据包的时间戳和关键帧标记（只解封装，不解码）
+
+    Returns:
+        tuple: (文件的起始时间, [(时间戳, 是否关键帧), ...] 按时间戳排序)，失败时返回 (None, None)
+    """
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "format=start_time:packet=pts_time,flags", "-of", "json", input_file]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        data = json.loads(result.stdout) if result.returncode == 0 else None
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取关键帧失败: {str(e)}")
+        return None, None
+    if not data:
+        logger.warning(f"读取关键帧失败: {result.stderr.strip()[-200:]}")
+        return None, None
+    packets = []
+    for packet in data.get("packets", []):
+        pts_time = packet.get("pts_time")
+        if pts_time in (None, "N/A"):
+            # 没有时间戳的数据包无法按时间切分
+            return None, None
+        packets.append((float(pts_time), "K" in packet.get("flags", "")))
+    packets.sort()
+    start_time = data.get("format", {}).get("start_time")
+    return float(start_time) if start_time not in (None, "N/A") else 0.0, packets
+
+def probe_frame_count(media_file, ffprobe="ffprobe"):
+    """
+    统计视频流的数据包数和时长（只解封装，不解码）
+
+    Returns:
+        tuple: (数据包数, 时长秒数)，失败时返回 (None, None)；容器没有记录流时长时使用文件时长
+    """
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0", "-count_packets",
+           "-show_entries", "stream=nb_read_packets,duration:format=duration", "-of", "json", media_file]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        data = json.loads(result.stdout) if result.returncode == 0 else None
+        streams = data.get("streams") if data else None
+        if not streams:
+            return None, None
+        duration = streams[0].get("duration")
+        if duration in (None, "N/A"):
+            duration = data.get("format", {}).get("duration")
+        return int(streams[0]["nb_read_packets"]), float(duration)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"统计视频帧数失败: {str(e)}")
+        return None, None
+
+def plan_segments(packets, segment_seconds=SEGMENT_SECONDS):
+    """
+    在关键帧处切分片段
+
+    Args:
+        packets: probe_video_packets()的数据包列表
+        segment_seconds: 片段的目标时长
+
+    Returns:
+        list: [{"start": 第一帧的时间戳, "frames": 帧数}, ...]
+    """
+    segments = []
+    for pts_time, is_key in packets:
+        if not segments or (is_key and pts_time - segments[-1]["start"] >= segment_seconds):
+            segments.append({"start": pts_time, "frames": 0})
+        segments[-1]["frames"] += 1
+    return segments
+
+def segment_file(checkpoint_dir, index):
+    return os.path.join(checkpoint_dir, f"seg_{index:05d}.mp4")
+
+class SegmentCheckpoint:
+    """
+    一个输出文件的检查点目录
+
+    manifest.json记录输入文件的标识、编码参数和片段划分；片段编码完成后才从临时文件重命名为
+    seg_NNNNN.mp4，存在即表示已完成。输入或参数变化时旧的片段作废。
+
+    Args:
+        checkpoint_dir: 检查点目录
+        identity: 输入文件的标识和编码参数（dict），与记录不同时重新开始
+    """
+
+    def __init__(self, checkpoint_dir, identity):
+        self.checkpoint_dir = checkpoint_dir
+        self.identity = identity
+        self.start_time = 0.0
+        self.segments = None
+
+    @property
+    def manifest_file(self):
+        return os.path.join(self.checkpoint_dir, MANIFEST_NAME)
+
+    def load(self):
+        """
+        读取已有的检查点
+
+        Returns:
+            bool: 是否有可继续使用的检查点
+        """
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != MANIFEST_VERSION or data.get("identity") != self.identity:
+            logger.info(f"输入文件或编码参数已变化，丢弃旧的检查点: {self.checkpoint_dir}")
+            self.remove()
+            return False
+        self.start_time = data["start_time"]
+        self.segments = data["segments"]
+        return True
+
+    def create(self, start_time, segments):
+        """写入新的检查点"""
+        self.remove()
+        os.makedirs(self.checkpoint_dir)
+        self.start_time = start_time
+        self.segments = segments
+        temp_file = f"{self.manifest_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "identity": self.identity,
+                       "start_time": start_time, "segments": segments}, f, ensure_ascii=False, indent=1)
+        os.replace(temp_file, self.manifest_file)
+
+    def is_done(self, index):
+        return os.path.exists(segment_file(self.checkpoint_dir, index))
+
+    def completed(self):
+        return [i for i in range(len(self.segments)) if self.is_done(i)]
+
+    def seek_position(self, index):
+        """片段开头相对于文件起始时间的位置（用于ffmpeg的-ss），第一个片段返回None（不定位）"""
+        if index == 0:
+            return None
+        return max(0.0, self.segments[index]["start"] - self.start_time - SEEK_EPSILON)
+
+    def segment_duration(self, index):
+        """片段的时长（秒），最后一个片段返回None"""
+        if index + 1 >= len(self.segments):
+            return None
+        return self.segments[index + 1]["start"] - self.segments[index]["start"]
+
+    def write_concat_list(self):
+        """
+        写入concat分离器的片段列表
+
+        除最后一个片段外都写明片段在输入中的时长，下一个片段的时间戳从这里接上，
+        不依赖片段文件末尾帧的时长（可变帧率时与到下一个关键帧的间隔不同）
+
+        Returns:
+            str: 列表文件路径
+        """
+        list_file = os.path.join(self.checkpoint_dir, "segments.txt")
+        with open(list_file, "w", encoding="utf-8") as f:
+            for i in range(len(self.segments)):
+                f.write(f"file '{os.path.basename(segment_file(self.checkpoint_dir, i))}'\n")
+                duration = self.segment_duration(i)
+                if duration is not None:
+                    f.write(f"duration {duration:.6f}\n")
+        return list_file
+
+    def remove(self):
+        if os.path.isdir(self.checkpoint_dir):
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
@@ -3,86 +3,62 @@
 
 """
 简化版视频H264转H265工具 (GUI版本)
-这个版本更简单，专注于基本功能和稳定性
+这个版本更简单，专注于基本功能和稳定性，支持一次选择多个文件排队转换
 """
 
 import os
 import sys
-import subprocess
 import logging
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QFileDialog, QMessageBox, QGroupBox, QProgressBar
 )
-from PyQt5.QtCore import Qt, QProcess
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
 import datetime
 
-# 配置日志 - 使用安全的日志路径和容错机制
-import os
+from command_profile import probe_media, build_douyin_command, estimate_douyin_size
+from preflight import preflight
+from ffmpeg_capabilities import check_ffmpeg, find_ffmpeg
+from gui_ffmpeg_check import FfmpegCheckThread
+from logging_setup import setup_logging
+from conversion_queue import (
+    ConversionQueue, ConversionQueueModel, ConversionQueueView, PAUSE_SUPPORTED,
+    JOB_RUNNING, JOB_PAUSED, JOB_QUEUED, JOB_DONE, JOB_FAILED, JOB_CANCELLED
+)
 
-def setup_safe_logging():
-    """设置安全的日志记录，即使无法创建日志文件也不会导致程序崩溃"""
-    # 创建logger实例
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
-    
-    # 创建格式化器
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    
-    # 添加StreamHandler（总是可用）
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
-    
-    # 尝试添加应用支持目录日志文件（但不中断程序）
-    try:
-        log_dir = os.path.expanduser("~/Library/Application Support/VideoConverter")
-        # 使用更安全的目录创建方式
-        if not os.path.exists(log_dir):
-            try:
-                os.makedirs(log_dir, exist_ok=True)
-            except (OSError, PermissionError):
-                # 如果无法创建目录，使用临时目录作为备选
-                log_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-                
-        app_log_file = os.path.join(log_dir, "video_converter.log")
-        file_handler = logging.FileHandler(app_log_file)
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        logger.info(f"日志文件保存到: {app_log_file}")
-    except Exception as e:
-        logger.warning(f"无法创建应用日志文件: {str(e)}")
-    
-    # 尝试添加工作目录日志（但不中断程序）
-    try:
-        # 使用更安全的工作目录检查
-        safe_cwd = os.getcwd() if os.access(os.getcwd(), os.W_OK) else os.path.expanduser("~")
-        working_dir_log = os.path.join(safe_cwd, "video_converter_debug.log")
-        working_handler = logging.FileHandler(working_dir_log)
-        working_handler.setFormatter(formatter)
-        logger.addHandler(working_handler)
-        logger.info(f"调试日志同时保存到: {working_dir_log}")
-    except Exception as e:
-        logger.warning(f"无法创建工作目录日志文件: {str(e)}")
-    
-    return logger
+logger = logging.getLogger(__name__)
 
-# 设置安全的日志记录
-logger = setup_safe_logging()
+def default_log_file():
+    """
+    日志文件路径：应用支持目录，无法创建时使用下载目录
+    """
+    log_dir = os.path.expanduser("~/Library/Application Support/VideoConverter")
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+    except OSError:
+        log_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+    return os.path.join(log_dir, "video_converter.log")
 
 class SimpleVideoConverter(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.input_file = None
-        self.output_file = None
+        self.ffmpeg_path = None
+        self.ffmpeg_capabilities = None
+        # 后台检查FFmpeg的结果，返回之前不能开始转换
+        self.ffmpeg_check_result = None
+        self.queue_model = ConversionQueueModel(self)
+        self.queue = ConversionQueue(self.queue_model, self.build_ffmpeg_command, max_concurrent=2, parent=self)
+        self.queue.job_finished.connect(self.job_finished)
+        self.queue.queue_finished.connect(self.queue_finished)
         self.init_ui()
-        self.check_ffmpeg_installed()
+        # 窗口先显示，FFmpeg在后台检查
+        self.start_ffmpeg_check()
     
     def init_ui(self):
         """初始化用户界面"""
         self.setWindowTitle("小压工坊")
-        self.setGeometry(100, 100, 600, 350)
+        self.setGeometry(100, 100, 700, 550)
         
         # 主窗口
         central_widget = QWidget()
@@ -101,12 +77,27 @@ class SimpleVideoConverter(QMainWindow):
         self.file_label.setWordWrap(True)
         file_layout.addWidget(self.file_label)
         
+        # 转换队列
+        self.queue_view = ConversionQueueView(self.queue_model)
+        file_layout.addWidget(self.queue_view)
+        
+        queue_buttons = QHBoxLayout()
         select_button = QPushButton("选择视频文件")
         select_button.clicked.connect(self.select_file)
-        file_layout.addWidget(select_button)
+        queue_buttons.addWidget(select_button)
+        up_button = QPushButton("上移")
+        up_button.clicked.connect(lambda: self.queue_view.move_selected(-1))
+        queue_buttons.addWidget(up_button)
+        down_button = QPushButton("下移")
+        down_button.clicked.connect(lambda: self.queue_view.move_selected(1))
+        queue_buttons.addWidget(down_button)
+        remove_button = QPushButton("移除")
+        remove_button.clicked.connect(self.remove_selected)
+        queue_buttons.addWidget(remove_button)
+        file_layout.addLayout(queue_buttons)
         
         file_group.setLayout(file_layout)
-        main_layout.addWidget(file_group)
+        main_layout.addWidget(file_group, 1)
         
         # 状态区域
         status_group = QGroupBox("转换状态")
@@ -121,10 +112,11 @@ class SimpleVideoConverter(QMainWindow):
         progress_label = QLabel("进度:")
         progress_layout.addWidget(progress_label)
         
+        # 总进度：已结束的文件数
         self.progress_bar = QProgressBar()
         self.progress_bar.setValue(0)
         self.progress_bar.setMinimumWidth(400)
-        self.progress_bar.setFormat("%p%")
+        self.progress_bar.setFormat("%v/%m")
         progress_layout.addWidget(self.progress_bar)
         
         status_layout.addLayout(progress_layout)
@@ -139,6 +131,11 @@ class SimpleVideoConverter(QMainWindow):
         self.convert_button.clicked.connect(self.start_conversion)
         button_layout.addWidget(self.convert_button)
         
+        self.pause_button = QPushButton("暂停/继续")
+        self.pause_button.clicked.connect(self.toggle_pause_selected)
+        self.pause_button.setEnabled(False)
+        button_layout.addWidget(self.pause_button)
+        
         self.cancel_button = QPushButton("取消")
         self.cancel_button.clicked.connect(self.cancel_conversion)
         self.cancel_button.setEnabled(False)
@@ -179,150 +176,116 @@ class SimpleVideoConverter(QMainWindow):
         """)
     
     def select_file(self):
-        """选择视频文件"""
-        file_path, _ = QFileDialog.getOpenFileName(
+        """选择视频文件（可多选），加入转换队列"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self, "选择视频文件", "", 
             "视频文件 (*.mp4 *.mov *.mkv *.avi *.flv *.wmv);;所有文件 (*)"
         )
         
-        if file_path:
-            self.input_file = file_path
-            self.file_label.setText(f"已选择: {os.path.basename(file_path)}")
-            # 自动生成输出文件名
-            base_name = os.path.splitext(file_path)[0]
-            self.output_file = f"{base_name}_h265.mp4"
-            logger.info(f"选择文件: {file_path}")
+        if file_paths:
+            # 输出文件名自动生成为 原文件名_h265.mp4
+            added = self.queue_model.add_files(file_paths, output_ext=".mp4")
+            logger.info(f"选择文件: {len(file_paths)} 个，新加入队列 {added} 个")
+            self.update_file_label()
+            self.progress_bar.setMaximum(max(1, len(self.queue_model.jobs())))
+    
+    def remove_selected(self):
+        """从队列中移除选中的文件（转换中的文件需要先取消）"""
+        self.queue_model.remove_rows(self.queue_view.selected_rows())
+        self.update_file_label()
+    
+    def update_file_label(self):
+        jobs = self.queue_model.jobs()
+        if not jobs:
+            self.file_label.setText("未选择文件")
+        elif len(jobs) == 1:
+            self.file_label.setText(f"已选择: {os.path.basename(jobs[0].input_file)}")
+        else:
+            self.file_label.setText(f"已选择: {len(jobs)} 个文件")
     
     def get_ffmpeg_path(self):
         """获取FFmpeg可执行文件路径，优先使用内置版本"""
-        import sys
-        import platform
-        
-        # 尝试内置的FFmpeg
-        # 获取当前可执行文件所在目录
-        if getattr(sys, 'frozen', False):
-            # 打包后的环境
-            base_dir = os.path.dirname(sys.executable)
-            # 在Mac应用中，实际可执行文件在Contents/MacOS/目录
-            if base_dir.endswith('/Contents/MacOS'):
-                base_dir = os.path.dirname(os.path.dirname(base_dir))
-                ffmpeg_dir = os.path.join(base_dir, 'Contents', 'Resources', 'ffmpeg')
-            else:
-                ffmpeg_dir = os.path.join(base_dir, 'ffmpeg')
-        else:
-            # 开发环境
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            ffmpeg_dir = os.path.join(base_dir, 'ffmpeg_bin')
-        
-        # 根据系统架构选择对应的FFmpeg目录
-        system = platform.system()
-        architecture = platform.machine()
-        
-        if system == 'Darwin':
-            if architecture in ['arm64', 'aarch64']:
-                ffmpeg_dir = os.path.join(ffmpeg_dir, 'ffmpeg_macos_arm64')
-            else:
-                ffmpeg_dir = os.path.join(ffmpeg_dir, 'ffmpeg_macos_x64')
-        elif system == 'Windows':
-            ffmpeg_dir = os.path.join(ffmpeg_dir, 'ffmpeg_windows_x64')
-        else:  # Linux
-            ffmpeg_dir = os.path.join(ffmpeg_dir, 'ffmpeg_linux_x64')
-        
-        # 构建完整的FFmpeg路径
-        if system == 'Windows':
-            ffmpeg_path = os.path.join(ffmpeg_dir, 'ffmpeg.exe')
+        ffmpeg_path = find_ffmpeg()
+        if ffmpeg_path:
+            logger.info(f"找到FFmpeg: {ffmpeg_path}")
         else:
-            ffmpeg_path = os.path.join(ffmpeg_dir, 'ffmpeg')
-        
-        # 如果内置FFmpeg存在，返回它的路径
-        if os.path.isfile(ffmpeg_path):
-            logger.info(f"找到内置FFmpeg: {ffmpeg_path}")
-            return ffmpeg_path
-        
-        # 否则尝试系统路径中的FFmpeg
-        try:
-            import shutil
-            system_ffmpeg = shutil.which('ffmpeg')
-            if system_ffmpeg:
-                logger.info(f"找到系统FFmpeg: {system_ffmpeg}")
-                return system_ffmpeg
-        except Exception as e:
-            logger.warning(f"检查系统FFmpeg时出错: {str(e)}")
-        
-        logger.error("未找到FFmpeg")
-        return None
+            logger.error("未找到FFmpeg")
+        return ffmpeg_path
+    
+    def start_ffmpeg_check(self):
+        """在后台线程检查FFmpeg，结果返回后更新状态"""
+        self.status_label.setText("🔄 正在检查FFmpeg...")
+        self.convert_button.setEnabled(False)
+        self.ffmpeg_check_thread = FfmpegCheckThread(self.probe_ffmpeg, self)
+        self.ffmpeg_check_thread.checked.connect(self.ffmpeg_checked)
+        self.ffmpeg_check_thread.start()
+    
+    def ffmpeg_checked(self, result):
+        """保存后台检查的结果，之后开始转换时不再检查"""
+        self.ffmpeg_check_result = result
+        self.ffmpeg_path = result["path"]
+        self.show_ffmpeg_status(result)
+        self.convert_button.setEnabled(not self.queue.running)
     
-    def check_ffmpeg_installed(self):
-        """检查FFmpeg是否可用（内置或系统安装）"""
+    def probe_ffmpeg(self):
+        """查找并检查FFmpeg（不操作界面，可以在后台线程调用）"""
         ffmpeg_path = self.get_ffmpeg_path()
         logger.debug(f"检查FFmpeg路径: {ffmpeg_path}")
         
-        if ffmpeg_path:
-            # 首先检查文件是否存在且可执行
-            if not os.path.isfile(ffmpeg_path):
-                self.status_label.setText("❌ FFmpeg文件不存在")
-                self.status_label.setStyleSheet("color: red;")
-                logger.error(f"FFmpeg文件不存在: {ffmpeg_path}")
-                return False
-            
-            if not os.access(ffmpeg_path, os.X_OK):
-                try:
-                    # 尝试添加执行权限
-                    os.chmod(ffmpeg_path, 0o755)
-                    logger.info(f"已添加FFmpeg执行权限: {ffmpeg_path}")
-                except Exception as e:
-                    self.status_label.setText("❌ FFmpeg无执行权限")
-                    self.status_label.setStyleSheet("color: red;")
-                    logger.error(f"FFmpeg无执行权限: {str(e)}")
-                    return False
-            
-            # 版本检查可能会超时，特别是在打包后的应用中
-            # 增加超时时间并优化错误处理
-            try:
-                # 简化检查，只执行一个简单命令
-                result = subprocess.run([ffmpeg_path, "-version"], 
-                                      stdout=subprocess.PIPE, 
-                                      stderr=subprocess.PIPE, 
-                                      text=True,
-                                      timeout=15)  # 增加超时时间
-                
-                # 即使没有完整输出，只要不超时就认为可用
-                logger.info(f"FFmpeg基本功能检查通过")
-                
-                # 不要在启动时检查编解码器，避免额外的超时风险
-                # 只简单标记FFmpeg可用
-                self.status_label.setText("✅ FFmpeg可用")
-                self.status_label.setStyleSheet("color: green;")
-                return True
-                
-            except subprocess.TimeoutExpired:
-                # 超时不应该导致应用失败，只记录警告
-                logger.warning("FFmpeg版本检查超时，但将继续")
-                self.status_label.setText("⚠️  FFmpeg检查超时，但将继续尝试")
-                self.status_label.setStyleSheet("color: orange;")
-                # 即使超时也返回True，让应用继续运行
-                return True
-            except (FileNotFoundError, OSError) as e:
-                error_msg = f"FFmpeg执行错误: {str(e)}"
-                self.status_label.setText("❌ FFmpeg无法执行")
-                self.status_label.setStyleSheet("color: red;")
-                logger.error(error_msg)
-                return False
-        else:
-            self.status_label.setText("❌ 未找到FFmpeg")
-            self.status_label.setStyleSheet("color: red;")
+        if not ffmpeg_path:
             logger.error("未找到可用的FFmpeg")
-            return False
+            return {"path": None, "available": False, "timed_out": False, "error": "未找到FFmpeg"}
+        
+        # 首先检查文件是否存在且可执行
+        if not os.path.isfile(ffmpeg_path):
+            logger.error(f"FFmpeg文件不存在: {ffmpeg_path}")
+            return {"path": ffmpeg_path, "available": False, "timed_out": False, "error": "FFmpeg文件不存在"}
+        
+        if not os.access(ffmpeg_path, os.X_OK):
+            try:
+                # 尝试添加执行权限
+                os.chmod(ffmpeg_path, 0o755)
+                logger.info(f"已添加FFmpeg执行权限: {ffmpeg_path}")
+            except Exception as e:
+                logger.error(f"FFmpeg无执行权限: {str(e)}")
+                return {"path": ffmpeg_path, "available": False, "timed_out": False, "error": "FFmpeg无执行权限"}
+        
+        # 版本检查可能会超时，特别是在打包后的应用中；结果按可执行文件缓存，只检查一次
+        result = check_ffmpeg(ffmpeg_path, timeout=15)
+        if result["error"]:
+            logger.error(f"FFmpeg执行错误: {result['error']}")
+            result["error"] = "FFmpeg无法执行"
+        return result
+    
+    def show_ffmpeg_status(self, result):
+        """显示FFmpeg检查结果"""
+        if result.get("capabilities") is not None:
+            self.ffmpeg_capabilities = result["capabilities"]
+        if result["timed_out"]:
+            # 超时不应该导致应用失败，只记录警告
+            self.status_label.setText("⚠️  FFmpeg检查超时，但将继续尝试")
+            self.status_label.setStyleSheet("color: orange;")
+            return True
+        if result["available"]:
+            self.status_label.setText("✅ FFmpeg可用")
+            self.status_label.setStyleSheet("color: green;")
+            return True
+        self.status_label.setText(f"❌ {result['error']}")
+        self.status_label.setStyleSheet("color: red;")
+        return False
     
     def start_conversion(self):
-        """开始转换 - 使用QProcess实时更新进度条"""
+        """开始转换队列 - 使用QProcess实时更新每个文件的进度"""
         # 检查输入文件
-        if not self.input_file or not os.path.exists(self.input_file):
+        pending = [job for job in self.queue_model.jobs() if job.status == JOB_QUEUED]
+        if not pending:
             QMessageBox.warning(self, "警告", "请选择有效的视频文件")
             return
         
-        # 检查FFmpeg
-        if not self.check_ffmpeg_installed():
+        # 使用后台检查的结果（检查完成前开始按钮不可用）
+        if self.ffmpeg_check_result is None:
+            return
+        if not self.show_ffmpeg_status(self.ffmpeg_check_result):
             # 提供更友好的错误提示，包含可能的解决方案
             QMessageBox.critical(self, 
                                "FFmpeg检查失败", 
@@ -332,12 +295,21 @@ class SimpleVideoConverter(QMainWindow):
                                "3. 确保您的系统上已安装FFmpeg")
             return
         
+        if not self.ffmpeg_path:
+            QMessageBox.critical(self, "错误", "未找到FFmpeg，无法进行转换")
+            self.status_label.setText("❌ 未找到FFmpeg")
+            self.status_label.setStyleSheet("color: red;")
+            return
+        
         # 确认转换
+        if len(pending) == 1:
+            detail = f"输入: {os.path.basename(pending[0].input_file)}\n"\
+                     f"输出: {os.path.basename(pending[0].output_file)}"
+        else:
+            detail = f"共 {len(pending)} 个文件，输出文件名为 原文件名_h265.mp4"
         confirm = QMessageBox.question(
             self, "确认转换", 
-            f"确定要将视频转换为H.265格式吗？\n"\
-            f"输入: {os.path.basename(self.input_file)}\n"\
-            f"输出: {os.path.basename(self.output_file)}",
+            f"确定要将视频转换为H.265格式吗？\n{detail}",
             QMessageBox.Yes | QMessageBox.No
         )
         
@@ -345,175 +317,110 @@ class SimpleVideoConverter(QMainWindow):
             return
         
         # 初始化进度条和状态
-        self.status_label.setText("🔄 正在转换中...")
+        self.status_label.setText("🔄 转换进行中，请稍候...")
         self.status_label.setStyleSheet("color: orange;")
-        self.progress_bar.setValue(0)
+        self.progress_bar.setMaximum(max(1, len(self.queue_model.jobs())))
+        self.update_overall_progress()
         
-        # 禁用开始按钮，启用取消按钮
+        # 禁用开始按钮，启用暂停和取消按钮
         self.convert_button.setEnabled(False)
+        self.pause_button.setEnabled(PAUSE_SUPPORTED)
         self.cancel_button.setEnabled(True)
         
-        # 获取FFmpeg路径
-        ffmpeg_path = self.get_ffmpeg_path()
-        if not ffmpeg_path:
-            self.reset_ui_state()
-            QMessageBox.critical(self, "错误", "未找到FFmpeg，无法进行转换")
-            self.status_label.setText("❌ 未找到FFmpeg")
+        self.queue.start()
+    
+    def build_ffmpeg_command(self, job):
+        """生成单个文件的FFmpeg命令（文件开始转换时在后台线程调用，探测和预检不阻塞界面）"""
+        # 功能来自缓存，不需要启动额外的进程
+        if self.ffmpeg_capabilities is not None and not self.ffmpeg_capabilities.has_x265:
+            raise RuntimeError("当前FFmpeg未编译libx265，无法编码H.265")
+        # 读取流信息：时长和帧率用于按预估大小预留moov空间，分辨率、像素格式、色彩和音频格式
+        # 用于省略不会改变输出的滤镜和转换
+        media = probe_media(self.ffmpeg_path, job.input_file)
+        job.duration = media["duration"]
+        # 开始编码前检查输出目录、剩余空间，并试解码开头几秒，有问题时直接标记为失败
+        required_bytes = int(estimate_douyin_size(media, os.path.getsize(job.input_file)) * 1.1)
+        check = preflight(job.input_file, job.output_file, required_bytes=required_bytes, ffmpeg=self.ffmpeg_path)
+        if not check.ok:
+            raise RuntimeError("；".join(check.errors))
+        ffmpeg_cmd, skipped = build_douyin_command(self.ffmpeg_path, job.input_file, job.output_file, media)
+        if skipped:
+            logger.info(f"输入已符合目标格式，省略: {'，'.join(skipped)}")
+        return ffmpeg_cmd
+    
+    def job_finished(self, job):
+        """单个文件转换结束"""
+        self.update_overall_progress()
+        if job.status == JOB_FAILED:
+            logger.error(f"转换失败: {job.input_file}: {job.message}")
+    
+    def update_overall_progress(self):
+        counts = self.queue_model.counts()
+        self.progress_bar.setValue(counts[JOB_DONE] + counts[JOB_FAILED] + counts[JOB_CANCELLED])
+    
+    def queue_finished(self):
+        """队列全部结束后显示汇总"""
+        self.reset_ui_state()
+        jobs = self.queue_model.jobs()
+        done = [job for job in jobs if job.status == JOB_DONE]
+        failed = [job for job in jobs if job.status == JOB_FAILED]
+        cancelled = [job for job in jobs if job.status == JOB_CANCELLED]
+        self.update_overall_progress()
+        
+        if failed:
+            self.status_label.setText(f"❌ {len(failed)} 个文件转换失败")
             self.status_label.setStyleSheet("color: red;")
+            QMessageBox.critical(self, "转换失败",
+                                 f"成功 {len(done)} 个，失败 {len(failed)} 个，请查看日志获取详细信息")
+            return
+        if not done:
+            self.status_label.setText("⚠️  转换已取消")
+            self.status_label.setStyleSheet("color: orange;")
             return
         
-        # 构建FFmpeg命令 - 使用完整的参数集，确保视频流正确处理
-        # 添加-progress参数以获取进度信息
-        # 获取输入文件大小，用于计算压缩比例
-        self.original_size = os.path.getsize(self.input_file)
-        
-        # 构建适合抖音的FFmpeg参数，优化画质和兼容性
-        ffmpeg_cmd = [
-            ffmpeg_path,
-            "-y",                       # 覆盖输出文件
-            "-i", self.input_file,
-            "-map", "0:v",              # 明确映射视频流
-            "-map", "0:a",              # 明确映射音频流
-            "-c:v", "libx265",          # 视频编码器
-            "-crf", "26",               # 降低CRF值以提高画质（26比28质量更好）
-            "-preset", "medium",        # 编码预设
-            "-pix_fmt", "yuv420p",      # 像素格式确保兼容性
-            "-color_range", "tv",       # 标准色彩范围
-            "-colorspace", "bt709",     # 标准色彩空间
-            "-color_trc", "bt709",      # 色彩传输特性
-            "-color_primaries", "bt709", # 色彩原色
-            "-maxrate", "5M",           # 最大比特率限制，适合抖音
-            "-bufsize", "10M",          # 缓冲区大小
-            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2", # 确保分辨率为偶数
-            "-c:a", "aac",              # 音频编码器
-            "-b:a", "192k",             # 提高音频比特率以获得更好音质
-            "-ac", "2",                 # 确保是立体声
-            "-ar", "44100",             # 标准音频采样率
-            "-movflags", "+faststart",  # 优化MP4文件，快速开始播放
-            "-threads", "0",            # 自动使用所有CPU核心
-            "-tag:v", "hvc1",           # 使用hvc1标签提高兼容性
-            "-progress", "pipe:1",      # 输出进度信息到标准输出
-            self.output_file
-        ]
-        # 记录完整的FFmpeg命令到日志
-        logger.debug(f"执行FFmpeg命令: {' '.join(ffmpeg_cmd)}")
-        
-        # 创建QProcess
-        self.process = QProcess()
-        self.process.setProcessChannelMode(QProcess.MergedChannels)
-        self.process.readyReadStandardOutput.connect(self.handle_output)
-        self.process.finished.connect(self.process_finished)
+        self.status_label.setText("✅ 转换成功！")
+        self.status_label.setStyleSheet("color: green;")
+        # 计算压缩后的文件大小和压缩比例
+        original_size = sum(job.input_size or 0 for job in done)
+        new_size = sum(job.output_size or 0 for job in done)
+        reduction_percent = ((original_size - new_size) / original_size) * 100 if original_size else 0
         
-        try:
-            # 开始转换
-            self.status_label.setText("🔄 转换进行中，请稍候...")
-            logger.debug(f"开始转换: {self.input_file} -> {self.output_file}")
-            self.process.start(ffmpeg_cmd[0], ffmpeg_cmd[1:])
-            
-        except Exception as e:
-            error_msg = f"启动转换进程失败: {str(e)}"
-            self.reset_ui_state()
-            self.status_label.setText("❌ 转换失败")
-            self.status_label.setStyleSheet("color: red;")
-            QMessageBox.critical(self, "转换失败", error_msg)
-            logger.error(error_msg)
-    
-    def handle_output(self):
-        """处理FFmpeg输出并更新进度条"""
-        try:
-            output = self.process.readAllStandardOutput().data().decode()
-            
-            # 记录输出
-            logger.debug(f"FFmpeg输出片段: {output[:200]}...")
-            
-            # 解析进度信息
-            progress_data = {}
-            for line in output.splitlines():
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    progress_data[key.strip()] = value.strip()
-            
-            # 更新进度
-            if 'out_time_ms' in progress_data and 'total_duration' in progress_data:
-                try:
-                    current_time = float(progress_data['out_time_ms'])
-                    total_time = float(progress_data['total_duration'])
-                    if total_time > 0:
-                        percent = int((current_time / total_time) * 100)
-                        self.progress_bar.setValue(percent)
-                except ValueError:
-                    pass
-            
-            # 尝试从输出中提取frame信息来估计进度
-            elif 'frame=' in output:
-                # 简单的基于文本的进度解析
-                try:
-                    for line in output.splitlines():
-                        if 'frame=' in line and 'fps=' in line:
-                            # 这里我们没有总帧数信息，所以只是更新状态文本
-                            frame_info = line.strip()
-                            self.status_label.setText(f"🔄 转换中: {frame_info[:50]}")
-                except Exception:
-                    pass
-        except Exception as e:
-            logger.warning(f"处理FFmpeg输出时出错: {str(e)}")
+        # 格式化文件大小显示
+        original_size_mb = round(original_size / (1024 * 1024), 2)
+        new_size_mb = round(new_size / (1024 * 1024), 2)
+        
+        if len(done) == 1:
+            title = f"视频转换成功！\n输出文件: {os.path.basename(done[0].output_file)}\n\n"
+        else:
+            title = f"{len(done)} 个视频转换成功！" + (f"（{len(cancelled)} 个已取消）" if cancelled else "") + "\n\n"
+        # 显示包含压缩信息的成功消息
+        message = (
+            title + 
+            f"压缩前大小：{original_size_mb} MB\n" 
+            f"压缩后大小：{new_size_mb} MB\n" 
+            f"压缩比例：{round(reduction_percent, 2)}%"
+        )
+        QMessageBox.information(self, "成功", message)
     
-    def process_finished(self, exit_code, exit_status):
-        """处理进程完成后的操作"""
-        try:
-            # 重置UI状态
-            self.reset_ui_state()
-            
-            if exit_code == 0 and exit_status == QProcess.NormalExit:
-                # 检查输出文件
-                if os.path.exists(self.output_file):
-                    self.status_label.setText("✅ 转换成功！")
-                    self.status_label.setStyleSheet("color: green;")
-                    self.progress_bar.setValue(100)
-                    
-                    # 计算压缩后的文件大小和压缩比例
-                    try:
-                        new_size = os.path.getsize(self.output_file)
-                        reduction_percent = ((self.original_size - new_size) / self.original_size) * 100
-                        
-                        # 格式化文件大小显示
-                        original_size_mb = round(self.original_size / (1024 * 1024), 2)
-                        new_size_mb = round(new_size / (1024 * 1024), 2)
-                        
-                        # 显示包含压缩信息的成功消息
-                        message = (
-                            f"视频转换成功！\n输出文件: {os.path.basename(self.output_file)}\n\n" 
-                            f"压缩前大小：{original_size_mb} MB\n" 
-                            f"压缩后大小：{new_size_mb} MB\n" 
-                            f"压缩比例：{round(reduction_percent, 2)}%"
-                        )
-                        QMessageBox.information(self, "成功", message)
-                    except Exception as e:
-                        # 即使计算大小失败也显示基本成功信息
-                        QMessageBox.information(
-                            self, "成功", 
-                            f"视频转换成功！\n输出文件: {os.path.basename(self.output_file)}"
-                        )
-                        logger.warning(f"计算压缩信息失败: {str(e)}")
-                        
-                    logger.info(f"转换成功: {self.output_file}")
-                else:
-                    raise Exception("输出文件未生成")
-            else:
-                error_msg = f"FFmpeg进程退出，返回码: {exit_code}"
-                self.status_label.setText("❌ 转换失败")
-                self.status_label.setStyleSheet("color: red;")
-                QMessageBox.critical(self, "转换失败", f"视频转换失败，请查看日志获取详细信息")
-                logger.error(error_msg)
-        except Exception as e:
-            error_msg = f"处理转换结果时出错: {str(e)}"
-            self.status_label.setText("❌ 转换失败")
-            self.status_label.setStyleSheet("color: red;")
-            logger.error(error_msg)
+    def toggle_pause_selected(self):
+        """暂停或继续选中的文件，未选中时作用于所有转换中的文件"""
+        jobs = self.queue_view.selected_jobs() or self.queue.active_jobs()
+        for job in jobs:
+            if job.status == JOB_RUNNING:
+                self.queue.pause(job)
+            elif job.status == JOB_PAUSED:
+                self.queue.resume(job)
     
     def cancel_conversion(self):
-        """取消转换"""
-        if hasattr(self, 'process') and self.process.state() == QProcess.Running:
+        """取消转换：有选中文件时只取消选中的文件，否则取消整个队列"""
+        selected = self.queue_view.selected_jobs()
+        if selected:
+            for job in selected:
+                self.queue.cancel(job)
+            logger.info(f"已取消 {len(selected)} 个文件")
+            return
+        
+        if self.queue.active_jobs():
             confirm = QMessageBox.question(
                 self, "确认取消", 
                 "确定要取消当前转换吗？",
@@ -521,19 +428,26 @@ class SimpleVideoConverter(QMainWindow):
             )
             
             if confirm == QMessageBox.Yes:
-                self.process.kill()
-                self.reset_ui_state()
-                self.status_label.setText("⚠️  转换已取消")
-                self.status_label.setStyleSheet("color: orange;")
+                self.queue.cancel_all()
                 logger.info("转换已取消")
     
     def reset_ui_state(self):
         """重置UI状态"""
         self.convert_button.setEnabled(True)
+        self.pause_button.setEnabled(False)
         self.cancel_button.setEnabled(False)
+    
+    def closeEvent(self, event):
+        """关闭窗口时终止进行中的转换，避免留下孤儿ffmpeg进程"""
+        self.queue.shutdown()
+        event.accept()
 
 def main():
     """主函数 - 添加更健壮的错误处理和macOS安全特性支持"""
+    # 日志在后台线程写入，本程序的调试信息也记录到文件
+    log_file = setup_logging(default_log_file(), category_levels={__name__: logging.DEBUG})
+    if log_file:
+        logger.info(f"日志文件保存到: {log_file}")
     # 确保正确设置工作目录，避免权限问题
     try:
         # 获取可执行文件所在目录作为基础目录
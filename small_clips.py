@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大量短视频的快速通道
+
+几秒到十几秒的短视频，每个文件单独探测、预检、启动ffmpeg和初始化x265的开销与编码本身相当，
+而且单个小分辨率的x265编码用不满多核CPU。这里把多个短视频合并为一次ffmpeg调用
+（多个输入、每个输入对应一个输出，各自独立的x265编码器并行编码），
+启动ffmpeg和初始化编码器的固定开销分摊到一组文件上。
+
+探测仍用ffprobe的JSON输出逐个进行（ffprobe一次只能打开一个输入），结果可靠，
+每个文件只多几毫秒，与编码相比可以忽略。
+"""
+
+import os
+import logging
+
+from mp4_layout import MP4_EXTENSIONS, movflags_args
+from process_priority import available_cpus
+
+logger = logging.getLogger(__name__)
+
+# 不超过这一时长（秒）的文件走快速通道
+SMALL_CLIP_SECONDS = 20
+# 每次ffmpeg调用合并的短视频数
+DEFAULT_GROUP_SIZE = 8
+
+def is_small_clip(info, max_seconds=SMALL_CLIP_SECONDS):
+    """探测结果是否为适合快速通道的短视频（时长未知的不算）"""
+    return bool(info and info.get("duration") and info["duration"] <= max_seconds)
+
+def build_group_command(clips, crf=28, preset="medium", audio_bitrate="128k", threads=0,
+                        moov_mode="reserve", priority=None, ffmpeg="ffmpeg", workers=1):
+    """
+    构建一次编码多个短视频的ffmpeg命令
+
+    每个输出只映射对应输入的第一条视频流和音频流；x265的线程池按同时进行的所有编码器
+    （workers个组，每组len(clips)个文件）平分CPU，各编码器之间不互相争抢。
+
+    Args:
+        clips: [(输入文件, 临时输出文件, 音频编码器, 视频信息), ...]
+        threads: 每个编码器的线程数，0表示按编码器总数平分可用的CPU
+        workers: 共用这些CPU、同时进行的组数（绑定独立核组时为1）
+        其余参数同convert_h264_to_h265
+
+    Returns:
+        list: ffmpeg命令
+    """
+    cpus = len(priority.cpus) if priority and priority.cpus else len(available_cpus())
+    pool_threads = threads if threads > 0 else max(1, cpus // (max(1, workers) * len(clips)))
+    cmd = [ffmpeg, "-hide_banner", "-nostdin"]
+    for input_file, _, _, _ in clips:
+        cmd.extend(["-i", input_file])
+    for index, (_, temp_file, audio_codec, info) in enumerate(clips):
+        cmd.extend(["-map", f"{index}:v:0", "-map", f"{index}:a:0?",
+                    "-c:v", "libx265", "-crf", str(crf), "-preset", preset,
+                    "-x265-params", f"pools={pool_threads}:log-level=error"])
+        is_mp4 = os.path.splitext(temp_file)[1].lower() in MP4_EXTENSIONS
+        if is_mp4:
+            cmd.extend(["-tag:v", "hvc1"])
+        cmd.extend(["-c:a", audio_codec, "-b:a", audio_bitrate])
+        if is_mp4:
+            cmd.extend(movflags_args(moov_mode, info.get("duration"), info.get("fps"), info.get("has_audio", True)))
+        cmd.extend(["-y", temp_file])
+    return cmd
@@ -8,6 +8,9 @@ import os
 import subprocess
 import time
 
+from mp4_layout import movflags_args, probe_timing
+from ffmpeg_capabilities import find_ffmpeg
+
 input_file = "跑量优质.mov"
 output_file = f"test_exact_output_{int(time.time())}.mp4"
 
@@ -16,18 +19,20 @@ if not os.path.isfile(input_file):
     print(f"错误：输入文件 {input_file} 不存在")
     exit(1)
 
-# 获取FFmpeg路径
-ffmpeg_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
-                          'ffmpeg_bin', 'ffmpeg_macos_arm64', 'ffmpeg')
+# 获取FFmpeg路径（优先使用内置FFmpeg）
+ffmpeg_path = find_ffmpeg()
 
-if not os.path.isfile(ffmpeg_path):
-    print(f"错误：未找到FFmpeg: {ffmpeg_path}")
+if not ffmpeg_path:
+    print("错误：未找到FFmpeg")
     exit(1)
 
 print(f"使用FFmpeg: {ffmpeg_path}")
 print(f"输入文件: {input_file}")
 print(f"输出文件: {output_file}")
 
+# moov放在文件开头（预留空间），避免+faststart在结束时重写整个文件
+timing = probe_timing(ffmpeg_path, input_file)
+
 # 构建完整的FFmpeg命令，添加额外的兼容性参数
 ffmpeg_cmd = [
     ffmpeg_path,
@@ -45,11 +50,11 @@ ffmpeg_cmd = [
     '-color_primaries', 'bt709', # 色彩原色
     '-c:a', 'aac',             # AAC音频编码
     '-b:a', '128k',            # 音频比特率
-    '-movflags', '+faststart', # 网页播放优化
     '-strict', 'experimental', # 启用实验性功能
     '-threads', '0',           # 自动使用所有CPU核心
-    output_file                # 输出文件
 ]
+ffmpeg_cmd.extend(movflags_args('reserve', timing['duration'], timing['fps'], timing['has_audio']))  # 网页播放优化
+ffmpeg_cmd.append(output_file)  # 输出文件
 
 print("\n执行命令:")
 print(' '.join(ffmpeg_cmd))
@@ -7,9 +7,11 @@
 import os
 import subprocess
 import logging
-import sys
 from datetime import datetime
 
+from mp4_layout import movflags_args, probe_timing
+from ffmpeg_capabilities import find_ffmpeg
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -22,29 +24,11 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def get_ffmpeg_path():
-    """获取FFmpeg路径"""
-    # 检查内置FFmpeg路径
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # 检查系统架构
-    if sys.platform == 'darwin':  # macOS
-        if 'arm64' in subprocess.check_output('uname -m', shell=True).decode():
-            ffmpeg_path = os.path.join(base_dir, 'ffmpeg_bin', 'ffmpeg_macos_arm64', 'ffmpeg')
-        else:
-            ffmpeg_path = os.path.join(base_dir, 'ffmpeg_bin', 'ffmpeg_macos_x64', 'ffmpeg')
-    else:
-        # Windows或Linux路径（如果需要）
-        ffmpeg_path = 'ffmpeg'
-    
-    # 如果内置路径不存在，尝试使用系统FFmpeg
-    if not os.path.exists(ffmpeg_path):
-        try:
-            subprocess.run(['which', 'ffmpeg'], check=True, stdout=subprocess.PIPE)
-            ffmpeg_path = 'ffmpeg'
-            logger.info("使用系统FFmpeg")
-        except:
-            logger.error("未找到FFmpeg")
-            return None
+    """获取FFmpeg路径（优先使用内置FFmpeg）"""
+    ffmpeg_path = find_ffmpeg()
+    if not ffmpeg_path:
+        logger.error("未找到FFmpeg")
+        return None
     
     logger.info(f"使用FFmpeg路径: {ffmpeg_path}")
     return ffmpeg_path
@@ -60,6 +44,9 @@ def convert_to_quicktime_compatible(input_file, output_file):
     if not ffmpeg_path:
         return False
     
+    # moov放在文件开头（预留空间），避免+faststart在结束时重写整个文件
+    timing = probe_timing(ffmpeg_path, input_file)
+    
     # 使用优化后的FFmpeg参数
     ffmpeg_cmd = [
         ffmpeg_path,
@@ -79,11 +66,11 @@ def convert_to_quicktime_compatible(input_file, output_file):
         "-b:a", "128k",             # 音频比特率
         "-ac", "2",                 # 确保是立体声
         "-ar", "44100",             # 标准音频采样率
-        "-movflags", "+faststart",  # 优化MP4文件
         "-threads", "0",            # 自动使用所有CPU核心
         "-tag:v", "hvc1",           # 使用hvc1标签提高QuickTime兼容性
-        output_file
     ]
+    ffmpeg_cmd.extend(movflags_args("reserve", timing["duration"], timing["fps"], timing["has_audio"]))
+    ffmpeg_cmd.append(output_file)
     
     logger.info(f"开始转换: {input_file} -> {output_file}")
     logger.debug(f"执行命令: {' '.join(ffmpeg_cmd)}")
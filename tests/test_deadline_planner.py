@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""deadline_planner的截止时间解析和预设选择"""
+
+import datetime
+import time
+
+import pytest
+
+from deadline_planner import DeadlinePlanner, PRESETS, PRESET_COST, SAFETY_MARGIN, parse_deadline
+
+NOW = datetime.datetime(2026, 10, 19, 22, 30)
+
+def test_parse_deadline_clock_time_later_today():
+    assert parse_deadline("23:15", now=NOW) == datetime.datetime(2026, 10, 19, 23, 15).timestamp()
+
+def test_parse_deadline_clock_time_already_passed_means_tomorrow():
+    assert parse_deadline("06:00", now=NOW) == datetime.datetime(2026, 10, 20, 6, 0).timestamp()
+
+@pytest.mark.parametrize("value, delta", [
+    ("8h", datetime.timedelta(hours=8)),
+    ("90m", datetime.timedelta(minutes=90)),
+    ("1h30m", datetime.timedelta(hours=1, minutes=30)),
+    ("1.5H", datetime.timedelta(hours=1.5)),
+])
+def test_parse_deadline_duration(value, delta):
+    assert parse_deadline(value, now=NOW) == (NOW + delta).timestamp()
+
+def test_parse_deadline_datetime():
+    assert parse_deadline(" 2026-10-20 06:00 ", now=NOW) == datetime.datetime(2026, 10, 20, 6, 0).timestamp()
+
+@pytest.mark.parametrize("value", ["", "tomorrow", "25h61x", "6:0"])
+def test_parse_deadline_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        parse_deadline(value, now=NOW)
+
+def planner_with_time_for(preset, units=1e9, rate=1e6):
+    """剩余时间刚好够用指定预设完成全部工作的规划器"""
+    needed = units * PRESET_COST[preset] / rate
+    planner = DeadlinePlanner(time.time() + needed / SAFETY_MARGIN + 60, units)
+    planner.set_rate(rate)
+    return planner
+
+def test_choose_preset_without_rate_uses_fastest():
+    planner = DeadlinePlanner(time.time() + 3600, 1e9)
+    assert not planner.calibrated
+    assert planner.choose_preset() == PRESETS[0]
+
+@pytest.mark.parametrize("preset", ["veryfast", "medium", "slow", "veryslow"])
+def test_choose_preset_picks_slowest_that_fits(preset):
+    assert planner_with_time_for(preset).choose_preset() == preset
+
+def test_choose_preset_falls_back_to_fastest_when_nothing_fits():
+    planner = DeadlinePlanner(time.time() + 1, 1e12)
+    planner.set_rate(1e6)
+    assert planner.choose_preset() == PRESETS[0]
+
+def test_choose_preset_speeds_up_when_measured_rate_is_slower():
+    planner = planner_with_time_for("medium")
+    assert planner.choose_preset() == "medium"
+    planner.start("a", 1e8, "medium")
+    # 实测速度只有估计的十分之一
+    planner.finish("a", encode_seconds=1e8 * PRESET_COST["medium"] / 1e5)
+    assert PRESETS.index(planner.choose_preset()) < PRESETS.index("medium")
+
+def test_finish_without_encoding_keeps_rate():
+    planner = planner_with_time_for("medium")
+    planner.start("a", 1e8, "medium")
+    planner.finish("a", encode_seconds=0)
+    assert planner.choose_preset() == "medium"
+
+def test_rate_is_saved_per_worker_count(tmp_path):
+    history_file = str(tmp_path / "speed.json")
+    planner = DeadlinePlanner(time.time() + 3600, 1e9, workers=2, history_file=history_file)
+    planner.start("a", 1e8, "medium")
+    planner.finish("a", encode_seconds=100)
+    assert DeadlinePlanner(time.time() + 3600, 1e9, workers=2, history_file=history_file).calibrated
+    assert not DeadlinePlanner(time.time() + 3600, 1e9, workers=1, history_file=history_file).calibrated
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""job_server的客户端参数检查"""
+
+import pytest
+
+from job_server import JobParamError, validate_params
+
+def test_valid_params_pass_through():
+    params = {"crf": 23, "preset": "slow", "threads": 4, "moov_mode": "fragmented",
+              "audio_codec": "libopus", "audio_bitrate": "96k"}
+    assert validate_params(params) == params
+    assert validate_params({}) == {}
+
+@pytest.mark.parametrize("params", [
+    [],
+    "crf=23",
+    {"crf": 52},
+    {"crf": -1},
+    {"crf": "23"},
+    {"crf": True},
+    {"threads": -2},
+    {"threads": 1.5},
+    {"preset": "turbo"},
+    {"moov_mode": "append"},
+    {"audio_codec": "aac; rm -rf /"},
+    {"audio_codec": 5},
+    {"audio_bitrate": "128 kbps"},
+    {"audio_bitrate": 128},
+    {"output_file": "/etc/passwd"},
+])
+def test_invalid_params_are_rejected(params):
+    with pytest.raises(JobParamError):
+        validate_params(params)
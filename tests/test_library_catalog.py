@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""library_catalog的增量扫描，以及--min-size等参数使用的parse_size"""
+
+import os
+
+import pytest
+
+import index
+from library_catalog import LibraryCatalog, STATUS_NEW, STATUS_PENDING, STATUS_HEVC, STATUS_FAILED
+
+def write(path, data=b"x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def touch_dir(path):
+    """目录的修改时间向后推一秒（文件系统的时间戳精度可能不足以区分两次快速的修改）"""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "videos"
+    write(str(root / "a.mp4"))
+    write(str(root / "notes.txt"))
+    write(str(root / "sub" / "b.mkv"))
+    write(str(root / ".hidden" / "c.mp4"))
+    catalog = LibraryCatalog(str(tmp_path / "catalog.db"))
+    yield str(root), catalog
+    catalog.close()
+
+def rescan(catalog, root, **kwargs):
+    return sorted(os.path.relpath(path, root)
+                  for path in catalog.rescan(root, recursive=True, is_video=index.is_video_file, **kwargs))
+
+def test_first_scan_yields_all_videos(library):
+    root, catalog = library
+    assert rescan(catalog, root) == ["a.mp4", os.path.join("sub", "b.mkv")]
+    assert catalog.get(os.path.join(root, "a.mp4"))["status"] == STATUS_NEW
+
+def test_hidden_directories_only_with_include_hidden(library):
+    root, catalog = library
+    assert os.path.join(".hidden", "c.mp4") in rescan(catalog, root, include_hidden=True)
+
+def test_unchanged_directories_are_not_listed(library):
+    root, catalog = library
+    rescan(catalog, root)
+    assert rescan(catalog, root) == []
+    # 原地改写不改变目录的修改时间，增量扫描发现不了，全量扫描可以
+    write(os.path.join(root, "sub", "b.mkv"), b"rewritten")
+    assert rescan(catalog, root) == []
+    assert rescan(catalog, root, full=True) == [os.path.join("sub", "b.mkv")]
+
+def test_new_and_deleted_files(library):
+    root, catalog = library
+    rescan(catalog, root)
+    write(os.path.join(root, "sub", "new.mov"))
+    touch_dir(os.path.join(root, "sub"))
+    assert rescan(catalog, root) == [os.path.join("sub", "new.mov")]
+
+    os.remove(os.path.join(root, "a.mp4"))
+    touch_dir(root)
+    assert rescan(catalog, root) == []
+    assert catalog.get(os.path.join(root, "a.mp4")) is None
+
+def test_deleted_subdirectory_is_forgotten(library):
+    root, catalog = library
+    rescan(catalog, root)
+    os.remove(os.path.join(root, "sub", "b.mkv"))
+    os.rmdir(os.path.join(root, "sub"))
+    touch_dir(root)
+    rescan(catalog, root)
+    assert catalog.query(root=root) == [catalog.get(os.path.join(root, "a.mp4"))]
+
+def test_record_probe_sets_status_and_query_filters(library):
+    root, catalog = library
+    rescan(catalog, root)
+    a, b = os.path.join(root, "a.mp4"), os.path.join(root, "sub", "b.mkv")
+    catalog.record_probe(a, {"codec": "h264", "width": 1920, "height": 1080, "duration": 10.0})
+    catalog.record_probe(b, {"codec": "hevc"})
+    assert catalog.get(a)["status"] == STATUS_PENDING
+    assert catalog.get(b)["status"] == STATUS_HEVC
+    assert [row["path"] for row in catalog.query(codec="h264", min_size=1)] == [a]
+    assert catalog.query(min_size=2) == []
+    catalog.record_probe(a, None)
+    assert catalog.get(a)["status"] == STATUS_FAILED
+
+@pytest.mark.parametrize("value, expected", [
+    ("1048576", 1048576),
+    ("500M", 500 * 1024 ** 2),
+    ("1.5G", int(1.5 * 1024 ** 3)),
+    (" 2gb ", 2 * 1024 ** 3),
+    ("10k", 10 * 1024),
+    ("1T", 1024 ** 4),
+])
+def test_parse_size(value, expected):
+    assert index.parse_size(value) == expected
+
+@pytest.mark.parametrize("value", ["", "G", "ten", "1X"])
+def test_parse_size_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        index.parse_size(value)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""memory_admission的准入控制和峰值内存估算"""
+
+import threading
+
+from memory_admission import MemoryBudget, MemoryHistory, model_peak_rss, CALIBRATION_RANGE
+
+MB = 1024 * 1024
+
+def test_choose_takes_first_candidate_that_fits():
+    budget = MemoryBudget(1000 * MB, max_jobs=4)
+    assert budget.choose([600 * MB]) == 0
+    # 800MB放不下，先开始后面能放下的小任务
+    assert budget.choose([800 * MB, 300 * MB, 100 * MB], block=False) == 1
+    assert budget.used == 900 * MB
+
+def test_choose_always_admits_a_single_oversized_job():
+    budget = MemoryBudget(100 * MB, max_jobs=2)
+    assert budget.choose([5000 * MB], block=False) == 0
+    assert budget.choose([1 * MB], block=False) is None
+
+def test_choose_respects_max_jobs_without_budget():
+    budget = MemoryBudget(None, max_jobs=2)
+    assert budget.choose([10 ** 12], block=False) == 0
+    assert budget.choose([10 ** 12], block=False) == 0
+    assert budget.choose([1], block=False) is None
+
+def test_release_returns_budget():
+    budget = MemoryBudget(1000 * MB, max_jobs=4)
+    budget.choose([700 * MB])
+    assert budget.choose([700 * MB], block=False) is None
+    budget.release(700 * MB)
+    assert budget.used == 0
+    assert budget.choose([700 * MB], block=False) == 0
+
+def test_choose_stops_waiting_when_asked():
+    budget = MemoryBudget(1000 * MB, max_jobs=1)
+    budget.choose([100 * MB])
+    assert budget.choose([100 * MB], should_stop=lambda: True) is None
+
+def test_blocked_choose_resumes_after_release():
+    budget = MemoryBudget(1000 * MB, max_jobs=4)
+    budget.choose([800 * MB])
+    chosen = []
+    waiter = threading.Thread(target=lambda: chosen.append(budget.choose([500 * MB])))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    budget.release(800 * MB)
+    waiter.join(5)
+    assert chosen == [0]
+
+def test_model_grows_with_resolution_and_slower_presets():
+    assert model_peak_rss(3840, 2160, "medium", cpu_count=8) > model_peak_rss(1280, 720, "medium", cpu_count=8)
+    assert model_peak_rss(1920, 1080, "slower", cpu_count=8) > model_peak_rss(1920, 1080, "fast", cpu_count=8)
+    assert model_peak_rss(1920, 1080, cpu_count=32) > model_peak_rss(1920, 1080, cpu_count=2)
+
+def test_history_calibrates_estimate_within_range(tmp_path):
+    history_file = str(tmp_path / "memory.json")
+    history = MemoryHistory(history_file)
+    model = model_peak_rss(1920, 1080, "medium", cpu_count=4)
+    assert history.estimate(1920, 1080, "medium", cpu_count=4) == model
+    history.record(1920, 1080, "medium", model * 2, cpu_count=4)
+    assert history.estimate(1920, 1080, "medium", cpu_count=4) == model * 2
+    # 其他分辨率和预设不受影响，记录会保存
+    assert history.estimate(1280, 720, "medium", cpu_count=4) == model_peak_rss(1280, 720, "medium", cpu_count=4)
+    reloaded = MemoryHistory(history_file)
+    assert reloaded.estimate(1920, 1080, "medium", cpu_count=4) == model * 2
+    # 异常的测量值被限制在允许范围内
+    history.record(1280, 720, "slow", 1, cpu_count=4)
+    assert history.estimate(1280, 720, "slow", cpu_count=4) == \
+        int(model_peak_rss(1280, 720, "slow", cpu_count=4) * CALIBRATION_RANGE[0])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""migration_plan的并发耗时估算和文件归类"""
+
+import pytest
+
+from migration_plan import (ACTION_COPY_AUDIO, ACTION_ENCODE, ACTION_SKIP, RECOMMEND_EXCLUDE, RECOMMEND_REMUX,
+                            classify, makespan)
+
+@pytest.mark.parametrize("durations, workers, expected", [
+    ([], 4, 0.0),
+    ([5, 3, 2], 1, 10),
+    ([5, 3, 2], 3, 5),
+    ([5, 3, 2], 0, 10),
+    # 最长的文件决定下限
+    ([10, 1, 1, 1], 2, 10),
+    # LPT：7和5各占一个，3、3交给先空闲的
+    ([3, 5, 3, 7], 2, 10),
+    ([4, 4, 4, 4, 4], 2, 12),
+])
+def test_makespan(durations, workers, expected):
+    assert makespan(durations, workers) == expected
+
+def h264_info(**overrides):
+    # 1080p30，10分钟，约12 Mb/s
+    info = {"codec": "h264", "width": 1920, "height": 1080, "fps": 30.0, "duration": 600.0,
+            "file_size": 900 * 1024 * 1024, "has_audio": True, "audio_codec": "aac", "audio_bitrate": 192000}
+    info.update(overrides)
+    return info
+
+def test_unprobeable_file_is_skipped(tmp_path):
+    path = tmp_path / "broken.mp4"
+    path.write_bytes(b"1234")
+    entry = classify(str(path), None)
+    assert entry["action"] == ACTION_SKIP
+    assert entry["input_size"] == entry["estimated_size"] == 4
+
+def test_hevc_is_skipped_and_remux_only_recommended_for_bad_containers():
+    entry = classify("a.mkv", h264_info(codec="hevc"))
+    assert (entry["action"], entry["recommendation"], entry["units"]) == (ACTION_SKIP, None, 0.0)
+    entry = classify("a.avi", h264_info(codec="hevc"))
+    assert (entry["action"], entry["recommendation"]) == (ACTION_SKIP, RECOMMEND_REMUX)
+
+def test_h264_is_encoded_with_saving_estimate():
+    entry = classify("a.mp4", h264_info())
+    assert entry["action"] == ACTION_ENCODE
+    assert entry["recommendation"] is None
+    assert 0 < entry["estimated_size"] < entry["input_size"]
+    assert entry["units"] > 0
+
+def test_audio_copy_follows_output_container():
+    assert classify("a.mp4", h264_info(), audio_codec="copy")["action"] == ACTION_COPY_AUDIO
+    # WMA不能复制到MP4，与预检一样改为编码
+    assert classify("a.wmv", h264_info(audio_codec="wmav2"), audio_codec="copy")["action"] == ACTION_ENCODE
+
+def test_low_bitrate_source_is_still_encoded_but_exclusion_recommended():
+    entry = classify("a.mp4", h264_info(file_size=10 * 1024 * 1024))
+    assert entry["action"] == ACTION_ENCODE
+    assert entry["recommendation"] == RECOMMEND_EXCLUDE
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""mp4_layout的moov布局参数"""
+
+import pytest
+
+from mp4_layout import MOOV_MODES, estimate_moov_size, movflags_args
+
+def test_reserve_with_duration_reserves_moov_space():
+    args = movflags_args("reserve", duration=60, fps=30, has_audio=True)
+    assert args == ["-moov_size", str(estimate_moov_size(60, 30, has_audio=True))]
+
+@pytest.mark.parametrize("duration", [None, 0])
+def test_reserve_without_duration_falls_back_to_fragmented(duration):
+    assert movflags_args("reserve", duration=duration) == movflags_args("fragmented")
+
+def test_other_modes():
+    assert movflags_args("fragmented") == ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+    assert movflags_args("faststart") == ["-movflags", "+faststart"]
+    assert movflags_args("none") == []
+    assert set(MOOV_MODES) == {"reserve", "fragmented", "faststart", "none"}
+
+def test_estimate_grows_with_duration_frame_rate_and_audio():
+    base = estimate_moov_size(600, 30, has_audio=False)
+    assert estimate_moov_size(1200, 30, has_audio=False) > base
+    assert estimate_moov_size(600, 60, has_audio=False) > base
+    assert estimate_moov_size(600, 30, has_audio=True) > base
+    # 帧率未知时按30 fps估算
+    assert estimate_moov_size(600, None, has_audio=False) == base
+
+def test_estimate_covers_index_tables():
+    # 一小时60 fps带音频：每帧的索引表项约15字节，预留量应明显大于此
+    frames = 3600 * 60 + 3600 * 48000 / 1024
+    assert estimate_moov_size(3600, 60) > frames * 15
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""index.py的输出文件命名"""
+
+import os
+
+import pytest
+
+import index
+
+@pytest.mark.parametrize("name, expected", [
+    ("clip_h265.mp4", True),
+    ("clip_h265_3.mkv", True),
+    ("/videos/a/clip_h265_12.mov", True),
+    ("clip_h265_h265.mp4", True),
+    ("clip.mp4", False),
+    ("my_h265_clip.mp4", False),
+    ("clip_h265x.mp4", False),
+    ("clip_h265_.mp4", False),
+    ("clip_h264.mp4", False),
+])
+def test_is_generated_output(name, expected):
+    assert index.is_generated_output(name) is expected
+
+def test_make_output_path_maps_extension_and_avoids_collisions(tmp_path):
+    clip_avi = str(tmp_path / "clip.avi")
+    clip_mp4 = str(tmp_path / "clip.mp4")
+    first = index.make_output_path(clip_avi)
+    assert first == str(tmp_path / "clip_h265.mp4")
+    assert index.is_generated_output(first)
+    # 同一目录的clip.mp4已被占用的名称不能重复
+    assert index.make_output_path(clip_mp4, reserved={first}) == str(tmp_path / "clip_h265_1.mp4")
+    (tmp_path / "clip_h265.mp4").write_bytes(b"")
+    (tmp_path / "clip_h265_1.mp4").write_bytes(b"")
+    assert index.make_output_path(clip_mp4) == str(tmp_path / "clip_h265_2.mp4")
+    assert index.make_output_path(str(tmp_path / "clip.mkv")) == str(tmp_path / "clip_h265.mkv")
+
+def test_temp_outputs_are_not_videos(tmp_path):
+    temp_file = index.make_temp_output_path(str(tmp_path / "clip_h265.mp4"), str(tmp_path))
+    assert os.path.dirname(temp_file) == str(tmp_path)
+    assert index.is_temp_output(temp_file)
+    assert not index.is_video_file(os.path.basename(temp_file))
+    assert index.is_video_file("clip.WEBM")
+    assert not index.is_video_file("clip.txt")
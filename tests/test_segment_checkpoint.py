@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""segment_checkpoint的片段划分和检查点"""
+
+import os
+
+from segment_checkpoint import SegmentCheckpoint, SEEK_EPSILON, plan_segments, segment_file
+
+def packets(times, keyframes):
+    return [(t, t in keyframes) for t in times]
+
+def test_segments_start_at_first_keyframe_after_target():
+    # 10 fps，每秒一个关键帧
+    times = [round(i * 0.1, 3) for i in range(50)]
+    keys = {0.0, 1.0, 2.0, 3.0, 4.0}
+    segments = plan_segments(packets(times, keys), segment_seconds=2)
+    assert segments == [{"start": 0.0, "frames": 20}, {"start": 2.0, "frames": 20}, {"start": 4.0, "frames": 10}]
+
+def test_segments_count_every_packet_with_variable_frame_rate():
+    # 前2秒30 fps，之后10 fps
+    times = [i / 30 for i in range(60)] + [2 + i / 10 for i in range(40)]
+    keys = {0.0, 2.0, 4.0}
+    segments = plan_segments(packets(times, keys), segment_seconds=2)
+    assert [segment["frames"] for segment in segments] == [60, 20, 20]
+    assert sum(segment["frames"] for segment in segments) == len(times)
+
+def test_no_keyframes_after_start_gives_one_segment():
+    times = [i * 0.5 for i in range(100)]
+    assert plan_segments(packets(times, {0.0}), segment_seconds=10) == [{"start": 0.0, "frames": 100}]
+
+def test_empty_input():
+    assert plan_segments([]) == []
+
+def make_checkpoint(tmp_path, identity=None):
+    return SegmentCheckpoint(str(tmp_path / ".out.checkpoint"), identity or {"content": "abc", "crf": 28})
+
+def test_checkpoint_resumes_only_with_same_identity(tmp_path):
+    segments = [{"start": 1.0, "frames": 30}, {"start": 3.5, "frames": 20}, {"start": 6.0, "frames": 5}]
+    checkpoint = make_checkpoint(tmp_path)
+    checkpoint.create(1.0, segments)
+    with open(segment_file(checkpoint.checkpoint_dir, 0), "wb"):
+        pass
+
+    resumed = make_checkpoint(tmp_path)
+    assert resumed.load()
+    assert resumed.segments == segments
+    assert resumed.completed() == [0]
+
+    changed = make_checkpoint(tmp_path, {"content": "abc", "crf": 30})
+    assert not changed.load()
+    assert not os.path.exists(checkpoint.checkpoint_dir)
+
+def test_seek_position_and_duration(tmp_path):
+    checkpoint = make_checkpoint(tmp_path)
+    checkpoint.create(1.0, [{"start": 1.0, "frames": 30}, {"start": 3.5, "frames": 20}])
+    assert checkpoint.seek_position(0) is None
+    assert abs(checkpoint.seek_position(1) - (2.5 - SEEK_EPSILON)) < 1e-9
+    assert checkpoint.segment_duration(0) == 2.5
+    assert checkpoint.segment_duration(1) is None
+
+def test_concat_list_records_durations_except_last(tmp_path):
+    checkpoint = make_checkpoint(tmp_path)
+    checkpoint.create(0.0, [{"start": 0.0, "frames": 30}, {"start": 2.0, "frames": 9}, {"start": 2.9, "frames": 5}])
+    with open(checkpoint.write_concat_list(), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines == ["file 'seg_00000.mp4'", "duration 2.000000",
+                     "file 'seg_00001.mp4'", "duration 0.900000",
+                     "file 'seg_00002.mp4'"]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式目录扫描：边扫描边探测边转换
+
+基于os.scandir的生成器逐个产出视频文件，探测在小线程池中并行进行，
+第一个符合条件的文件找到后就可以开始编码，内存占用只取决于队列深度而不是文件总数。
+"""
+
+import os
+import fnmatch
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+def matches_patterns(patterns, rel_path, name):
+    """判断相对路径或文件名是否匹配任一glob模式"""
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern)
+               for pattern in patterns)
+
+def is_skipped_dir(name, include_hidden=False):
+    """
+    递归扫描时是否跳过子目录
+
+    隐藏目录（以.开头）默认跳过；include_hidden时也进入隐藏目录，但始终跳过分段编码的检查点目录
+    （segment_checkpoint.checkpoint_dir_for()，其中的片段不是要转换的视频）。
+    """
+    if not name.startswith("."):
+        return False
+    return not include_hidden or name.endswith(".checkpoint")
+
+def iter_video_files(directory, recursive=False, include=None, exclude=None, is_video=None, include_hidden=False):
+    """
+    逐个产出目录中的视频文件路径
+
+    Args:
+        directory: 要扫描的目录
+        recursive: 是否递归扫描子目录
+        include: 包含的glob模式列表（匹配相对路径或文件名），None表示全部
+        exclude: 排除的glob模式列表，对目录同样生效
+        is_video: 判断文件名是否为视频文件的函数
+        include_hidden: 递归时也扫描隐藏目录（见is_skipped_dir）
+
+    Yields:
+        str: 视频文件路径
+    """
+    include = include or []
+    exclude = exclude or []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    rel_path = os.path.relpath(entry.path, directory)
+                    if exclude and matches_patterns(exclude, rel_path, entry.name):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive and not is_skipped_dir(entry.name, include_hidden):
+                                stack.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if is_video and not is_video(entry.name):
+                        continue
+                    if include and not matches_patterns(include, rel_path, entry.name):
+                        continue
+                    yield entry.path
+        except OSError as e:
+            logger.warning(f"扫描目录失败: {current}: {str(e)}")
+
+def iter_probed(paths, probe, workers=4, max_pending=16):
+    """
+    在线程池中并行探测文件，按完成顺序产出结果
+
+    同时进行中的探测不超过max_pending个，paths按需读取，不会一次性展开。
+
+    Args:
+        paths: 文件路径的可迭代对象（可以是生成器）
+        probe: 探测函数，参数为文件路径
+        workers: 探测线程数
+        max_pending: 最多同时排队的探测数
+
+    Yields:
+        tuple: (文件路径, 探测结果)
+    """
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="probe") as executor:
+        pending = deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                    break
+                future = executor.submit(probe, path)
+                future.path = path
+                pending.append(future)
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                try:
+                    info = future.result()
+                except Exception as e:
+                    logger.error(f"探测文件失败: {future.path}: {str(e)}")
+                    continue
+                yield future.path, info
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视文件夹模式 - 长期运行，自动转换新放入目录的视频文件
+Linux下使用inotify接收文件变化通知，其他平台或inotify不可用时使用os.scandir轮询
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import index
+from job_state import JobState
+from video_scanner import is_skipped_dir
+
+logger = logging.getLogger(__name__)
+
+# inotify事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+class Inotify:
+    """通过ctypes直接调用libc的inotify接口，无需第三方依赖"""
+
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._dirs = {}
+
+    def add_watch(self, directory):
+        """监视目录（不递归）"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            logger.warning(f"无法监视目录: {directory}")
+            return
+        self._dirs[wd] = directory
+
+    def read_events(self, timeout):
+        """
+        等待并读取事件
+
+        Args:
+            timeout: 最长等待秒数
+
+        Returns:
+            list: (路径, 是否为目录) 列表
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            directory = self._dirs.get(wd)
+            if mask & IN_DELETE_SELF:
+                self._dirs.pop(wd, None)
+                continue
+            if directory is None or not name:
+                continue
+            events.append((os.path.join(directory, os.fsdecode(name)), bool(mask & IN_ISDIR)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class FolderWatcher:
+    """
+    监视目录，文件大小和修改时间稳定一段时间后（写入完成）再提交转换
+
+    Args:
+        directory: 要监视的目录
+        recursive: 是否监视子目录
+        stable_seconds: 文件大小和修改时间保持不变多少秒后视为写入完成
+        workers: 同时进行的转换数量
+        state_file: 状态文件路径，None表示保存在监视目录下
+        poll_interval: 轮询/检查间隔（秒）
+        rescan_interval: 使用inotify时的兜底全量扫描间隔（秒），网络共享上inotify收不到远端写入
+        include_hidden: 递归时也监视隐藏目录（见video_scanner.is_skipped_dir）
+        **kwargs: 传递给convert_h264_to_h265的其他参数
+    """
+
+    def __init__(self, directory, recursive=False, stable_seconds=30, workers=1,
+                 state_file=None, poll_interval=5, rescan_interval=300, include_hidden=False, **kwargs):
+        self.directory = os.path.abspath(directory)
+        self.recursive = recursive
+        self.include_hidden = include_hidden
+        self.stable_seconds = stable_seconds
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.convert_kwargs = kwargs
+        self.state = JobState(state_file or os.path.join(self.directory, ".h265_watch_state.json"))
+
+        # 候选文件: 路径 -> (大小, 修改时间, 首次观察到该状态的时间)
+        self._pending = {}
+        self._in_progress = set()
+        # 进行中的转换占用的输出路径
+        self._outputs = set()
+        self._lock = threading.Lock()
+        # 提交队列有上限，避免一次放入大量文件时占满内存
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._stop = threading.Event()
+        self.success_count = 0
+
+    def _iter_directories(self):
+        yield self.directory
+        if not self.recursive:
+            return
+        stack = [self.directory]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False) and not is_skipped_dir(entry.name, self.include_hidden):
+                            stack.append(entry.path)
+                            yield entry.path
+            except OSError as e:
+                logger.warning(f"扫描目录失败: {current}: {str(e)}")
+
+    def _scan(self):
+        """用os.scandir扫描全部目录，把视频文件加入候选"""
+        for directory in self._iter_directories():
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_file(follow_symlinks=False) and index.is_video_file(entry.name):
+                            self._observe(entry.path, entry.stat())
+            except OSError as e:
+                logger.warning(f"扫描目录失败: {directory}: {str(e)}")
+
+    def _observe(self, path, st=None):
+        """记录文件的最新状态，状态变化时重新计时"""
+        if path in self._in_progress:
+            return
+        if st is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._pending.pop(path, None)
+                return
+        if self.state.is_handled(path, st):
+            self._pending.pop(path, None)
+            return
+        previous = self._pending.get(path)
+        if previous is None or previous[0] != st.st_size or previous[1] != st.st_mtime:
+            self._pending[path] = (st.st_size, st.st_mtime, time.monotonic())
+
+    def _check_stable(self, executor):
+        """提交已稳定的文件"""
+        now = time.monotonic()
+        for path in list(self._pending):
+            self._observe(path)
+            observed = self._pending.get(path)
+            if observed is None or now - observed[2] < self.stable_seconds:
+                continue
+            if not self._slots.acquire(blocking=False):
+                return
+            del self._pending[path]
+            with self._lock:
+                self._in_progress.add(path)
+            executor.submit(self._convert, path)
+
+    def _convert(self, path):
+        output_file = None
+        try:
+            st = os.stat(path)
+            info = index.get_video_info(path)
+            if info and info['codec'] == 'hevc':  # HEVC就是H.265
+                logger.info(f"跳过已使用H.265编码的文件: {path}")
+                self.state.record(path, st, "skipped")
+                return
+
+            with self._lock:
+                output_file = index.make_output_path(path, self._outputs)
+                self._outputs.add(output_file)
+            logger.info(f"文件写入完成，开始转换: {path}")
+            success = index.convert_h264_to_h265(path, output_file, **self.convert_kwargs)
+            cancel_event = self.convert_kwargs.get("cancel_event")
+            if not success and cancel_event is not None and cancel_event.is_set():
+                # 被终止的文件不记录，下次启动时重新转换
+                return
+            if success:
+                with self._lock:
+                    self.success_count += 1
+                # 输出文件本身也会出现在监视目录中，一并记录避免再次转换
+                self.state.record(output_file, os.stat(output_file), "output")
+            self.state.record(path, st, "done" if success else "failed", output_file if success else None)
+        except Exception as e:
+            logger.error(f"处理文件失败: {path}: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_progress.discard(path)
+                self._outputs.discard(output_file)
+            self._slots.release()
+
+    def stop(self):
+        """请求停止监视（已开始的转换会继续完成）"""
+        self._stop.set()
+
+    def run(self):
+        """
+        开始监视，直到调用stop()或收到KeyboardInterrupt
+
+        Returns:
+            int: 成功转换的文件数量
+        """
+        inotify = None
+        if sys.platform.startswith("linux"):
+            try:
+                inotify = Inotify()
+                for directory in self._iter_directories():
+                    inotify.add_watch(directory)
+                logger.info("使用inotify监视目录变化")
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify不可用，改用轮询: {str(e)}")
+                inotify = None
+        if inotify is None:
+            logger.info(f"使用轮询监视目录变化，间隔 {self.poll_interval} 秒")
+
+        print(f"👀 正在监视: {self.directory}（写入稳定 {self.stable_seconds} 秒后开始转换，按Ctrl-C退出）")
+        last_scan = time.monotonic()
+        self._scan()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while not self._stop.is_set():
+                    if inotify is not None:
+                        for path, is_dir in inotify.read_events(self.poll_interval):
+                            if is_dir:
+                                if self.recursive and not is_skipped_dir(os.path.basename(path), self.include_hidden):
+                                    inotify.add_watch(path)
+                                    last_scan = 0  # 新目录中可能已有文件，立即补扫
+                            elif index.is_video_file(path):
+                                self._observe(path)
+                        if time.monotonic() - last_scan >= self.rescan_interval:
+                            self._scan()
+                            last_scan = time.monotonic()
+                    else:
+                        self._stop.wait(self.poll_interval)
+                        self._scan()
+                    self._check_stable(executor)
+            except KeyboardInterrupt:
+                logger.warning("监视被用户中断，等待进行中的转换完成")
+                print("⚠️  监视已停止，等待进行中的转换完成...")
+            finally:
+                if inotify is not None:
+                    inotify.close()
+
+        logger.info(f"监视结束，共成功转换 {self.success_count} 个文件")
+        return self.success_count